@@ -0,0 +1,185 @@
+import asyncio
+import math
+import random
+import time
+from collections import OrderedDict, deque
+
+# Error codes S3 and S3-compatible backends use to ask clients to slow down
+THROTTLE_CODES = frozenset(
+    {
+        "SlowDown",
+        "ServiceUnavailable",
+        "Throttling",
+        "ThrottlingException",
+        "RequestLimitExceeded",
+        "RequestThrottled",
+        "TooManyRequests",
+    }
+)
+THROTTLE_STATUSES = (429, 503)  # For responses without an error body, e.g. to HEAD
+LATENCY_SMOOTHING = 0.2  # Weight of the newest call in the latency average
+MAX_RETRY_AFTER = 60  # Seconds, however long the queue looks
+MAX_BUCKETS = 1024  # Buckets tracked at once, names come from clients
+
+
+def is_throttled(error: Exception):
+    """Whether a backend call failed because the backend wants fewer requests"""
+    if getattr(error, "code", None) in THROTTLE_CODES:
+        return True
+    return getattr(error, "status_code", None) in THROTTLE_STATUSES
+
+
+class AdaptiveLimit:
+    """Concurrency limit for the backend requests of one bucket, adjusted
+    AIMD-style: every throttled request cuts it by `decrease`, at most once
+    per `cooldown` so one burst of errors counts once, and every successful
+    one raises it by 1/limit, so about one per limit's worth of requests.
+
+    Requests over the limit wait in a queue of `max_queue`, beyond which
+    `acquire` refuses them.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        max_queue: int = 1000,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.max_queue = max_queue
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.latency = 0.0  # Smoothed seconds per request
+        self._waiters = deque()
+        self._last_decrease = -math.inf
+        self.throttled_count = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        """Take a slot, waiting for one if needed; False when the queue is full"""
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # Granted just as the caller went away
+            else:
+                self._waiters.remove(waiter)
+            raise
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def succeeded(self, seconds: float):
+        self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+        if self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+
+    def throttled(self):
+        self.throttled_count += 1
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+
+    def retry_after(self):
+        """Seconds until the queue has likely drained, for Retry-After"""
+        drain = (len(self._waiters) + self.in_flight) / int(self.limit) * self.latency
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(max(drain, self.cooldown))))
+
+    def idle(self):
+        return self.in_flight == 0 and not self._waiters
+
+    def at_rest(self):
+        """Idle and back at its initial limit, so nothing is lost by forgetting it"""
+        return self.idle() and self.limit >= self.max_limit
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self):
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "throttled": self.throttled_count,
+            "rejected": self.rejected,
+        }
+
+
+class Backpressure:
+    """Per-bucket adaptive limits on backend requests, and the jittered
+    exponential backoff between retries of throttled ones"""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        max_queue: int = 1000,
+        retries: int = 3,
+        backoff: float = 0.2,
+        max_backoff: float = 10.0,
+        max_buckets: int = MAX_BUCKETS,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_queue = max_queue
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_buckets = max_buckets
+        self._limits = OrderedDict()  # Least recently used first
+        self.retried = 0
+
+    def limit(self, bucket_name: str):
+        limit = self._limits.get(bucket_name)
+        if limit is not None:
+            self._limits.move_to_end(bucket_name)
+            return limit
+        if len(self._limits) >= self.max_buckets:
+            self._evict()
+        limit = self._limits[bucket_name] = AdaptiveLimit(
+            self.max_concurrency, self.min_concurrency, self.max_queue
+        )
+        return limit
+
+    def _evict(self):
+        # Limits at rest first, then the least recently used idle ones; busy
+        # ones are bounded by the requests in flight and kept
+        for name in [name for name, limit in self._limits.items() if limit.at_rest()]:
+            del self._limits[name]
+        for name in [name for name, limit in self._limits.items() if limit.idle()]:
+            if len(self._limits) < self.max_buckets:
+                break
+            del self._limits[name]
+
+    def delay(self, attempt: int):
+        """Seconds before retry `attempt` (0 for the first), "full jitter"
+        so clients throttled together don't come back together"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def stats(self):
+        return {
+            "retried": self.retried,
+            "buckets": {name: limit.stats() for name, limit in self._limits.items()},
+        }
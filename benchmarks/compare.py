@@ -0,0 +1,73 @@
+"""Compare two benchmark reports written by `benchmarks/run.py`.
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+Prints the change in throughput, p99 latency and peak RSS for every
+scenario present in both reports, and exits non-zero when any of them got
+worse by more than the threshold, so it can gate CI.
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks.run import format_size
+
+# Metric, and whether a larger value is an improvement
+METRICS = (
+    ("requests_per_second", True),
+    ("p99_ms", False),
+    ("peak_rss_bytes", False),
+)
+
+
+def _scenarios(report):
+    return {(r["operation"], r["size"], r["concurrency"]): r for r in report["results"]}
+
+
+def compare(before: dict, after: dict, threshold: float):
+    """Yield (scenario, metric, before, after, percent change, regressed)"""
+    old, new = _scenarios(before), _scenarios(after)
+    for scenario in sorted(old.keys() & new.keys()):
+        for metric, higher_is_better in METRICS:
+            a, b = old[scenario].get(metric), new[scenario].get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a * 100
+            worse = -change if higher_is_better else change
+            yield scenario, metric, a, b, change, worse > threshold
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10,
+        help="Percent change counted as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{before.get('revision')} -> {after.get('revision')}")
+
+    regressions = 0
+    for (operation, size, concurrency), metric, a, b, change, regressed in compare(
+        before, after, args.threshold
+    ):
+        regressions += regressed
+        print(
+            f"{'REGRESSED' if regressed else '':<10}{operation:<9}"
+            f"{format_size(size):>6} c={concurrency:<4}{metric:<20}"
+            f"{a:>14.2f} -> {b:>14.2f} ({change:+.1f}%)"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
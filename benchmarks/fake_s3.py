@@ -0,0 +1,381 @@
+"""A minimal in-process S3 server for benchmarks.
+
+It speaks just enough of the S3 REST API for the minio client calls the
+service makes: bucket HEAD/PUT, ListObjectsV2, object GET (with Range),
+HEAD, PUT and DELETE, multipart uploads and multi-object delete. Requests
+are not authenticated and object bodies are kept in a temporary directory,
+so gigabyte-sized objects don't have to fit in memory.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+COPY_CHUNK_SIZE = 1024 * 1024
+S3_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class _Object:
+    def __init__(self, path, size, etag, content_type):
+        self.path = path
+        self.size = size
+        self.etag = etag
+        self.content_type = content_type
+        self.last_modified = datetime.now(timezone.utc)
+
+
+class FakeS3:
+    """Object store state shared by every handler thread"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.lock = threading.Lock()
+        self.buckets = {}  # bucket -> {key: _Object}
+        self.uploads = {}  # upload id -> (bucket, key, content type, {part: (path, etag)})
+
+    def new_path(self):
+        return os.path.join(self.root, uuid.uuid4().hex)
+
+    def put(self, bucket, key, obj):
+        with self.lock:
+            old = self.buckets[bucket].get(key)
+            self.buckets[bucket][key] = obj
+        if old is not None:
+            _remove(old.path)
+
+    def delete(self, bucket, key):
+        with self.lock:
+            old = self.buckets[bucket].pop(key, None)
+        if old is not None:
+            _remove(old.path)
+
+
+class FakeS3Server:
+    """Runs FakeS3 on a background thread; use as a context manager"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._root = tempfile.mkdtemp(prefix="fake-s3-")
+        self.state = FakeS3(self._root)
+        handler = type("BoundHandler", (_Handler,), {"state": self.state})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._root, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like a real S3 endpoint
+    disable_nagle_algorithm = True  # Headers and body are separate writes
+    state: FakeS3 = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _route(self):
+        url = urlsplit(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        query = {
+            k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()
+        }
+        return unquote(bucket), unquote(key), query
+
+    def do_HEAD(self):
+        bucket, key, _ = self._route()
+        if bucket not in self.state.buckets:
+            return self._send(404)
+        if not key:
+            return self._send(200)
+        obj = self.state.buckets[bucket].get(key)
+        if obj is None:
+            return self._send(404)
+        self._send(200, headers=self._object_headers(obj), length=obj.size)
+
+    def do_GET(self):
+        bucket, key, query = self._route()
+        if bucket not in self.state.buckets:
+            return self._error(404, "NoSuchBucket", bucket)
+        if not key:
+            if "location" in query:
+                return self._xml(
+                    200, "<LocationConstraint>us-east-1</LocationConstraint>"
+                )
+            return self._list(bucket, query)
+
+        obj = self.state.buckets[bucket].get(key)
+        if obj is None:
+            return self._error(404, "NoSuchKey", key)
+        start, end = 0, obj.size - 1
+        status = 200
+        headers = self._object_headers(obj)
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            if start > end:
+                return self._error(416, "InvalidRange", key)
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{obj.size}"
+
+        self._send(status, headers=headers, length=end - start + 1)
+        with open(obj.path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                chunk = f.read(min(COPY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def do_PUT(self):
+        bucket, key, query = self._route()
+        if not key:
+            self._read_body()
+            with self.state.lock:
+                self.state.buckets.setdefault(bucket, {})
+            return self._send(200)
+        if bucket not in self.state.buckets:
+            self._read_body()
+            return self._error(404, "NoSuchBucket", bucket)
+
+        path, size, etag = self._receive_body()
+        if "uploadId" in query:
+            upload = self.state.uploads.get(query["uploadId"])
+            if upload is None:
+                _remove(path)
+                return self._error(404, "NoSuchUpload", key)
+            upload[3][int(query["partNumber"])] = (path, etag)
+            return self._send(200, headers={"ETag": f'"{etag}"'})
+
+        content_type = self.headers.get("Content-Type", "application/octet-stream")
+        self.state.put(bucket, key, _Object(path, size, etag, content_type))
+        self._send(200, headers={"ETag": f'"{etag}"'})
+
+    def do_POST(self):
+        bucket, key, query = self._route()
+        body = self._read_body()
+        if bucket not in self.state.buckets:
+            return self._error(404, "NoSuchBucket", bucket)
+        if "delete" in query:
+            return self._delete_objects(bucket, body)
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            content_type = self.headers.get("Content-Type", "application/octet-stream")
+            self.state.uploads[upload_id] = (bucket, key, content_type, {})
+            return self._xml(
+                200,
+                "<InitiateMultipartUploadResult>"
+                f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                f"<UploadId>{upload_id}</UploadId>"
+                "</InitiateMultipartUploadResult>",
+            )
+        if "uploadId" in query:
+            return self._complete_upload(bucket, key, query["uploadId"], body)
+        self._error(400, "InvalidRequest", key)
+
+    def do_DELETE(self):
+        bucket, key, query = self._route()
+        if bucket not in self.state.buckets:
+            return self._error(404, "NoSuchBucket", bucket)
+        if "uploadId" in query:
+            upload = self.state.uploads.pop(query["uploadId"], None)
+            for path, _ in upload[3].values() if upload else []:
+                _remove(path)
+            return self._send(204)
+        self.state.delete(bucket, key)
+        self._send(204)
+
+    def _list(self, bucket, query):
+        prefix = query.get("prefix", "")
+        delimiter = query.get("delimiter", "")
+        max_keys = int(query.get("max-keys", "1000"))
+        after = query.get("continuation-token") or query.get("start-after") or ""
+        with self.state.lock:
+            objects = sorted(self.state.buckets[bucket].items())
+
+        entries = []
+        truncated = False
+        for name, obj in objects:
+            if not name.startswith(prefix) or name <= after:
+                continue
+            if delimiter and after.endswith(delimiter) and name.startswith(after):
+                continue  # Everything under a prefix returned on an earlier page
+            rest = name[len(prefix) :]
+            if delimiter and delimiter in rest:
+                common = prefix + rest[: rest.index(delimiter) + len(delimiter)]
+                if entries and entries[-1][0] == common:
+                    continue
+                entry = (common, None)
+            else:
+                entry = (name, obj)
+            if len(entries) == max_keys:
+                truncated = True
+                break
+            entries.append(entry)
+
+        parts = [
+            f"<ListBucketResult xmlns='{S3_NAMESPACE}'>",
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>",
+            f"<KeyCount>{len(entries)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>",
+            f"<IsTruncated>{str(truncated).lower()}</IsTruncated>",
+        ]
+        if truncated:
+            token = escape(entries[-1][0])
+            parts.append(f"<NextContinuationToken>{token}</NextContinuationToken>")
+        for name, obj in entries:
+            if obj is None:
+                parts.append(
+                    f"<CommonPrefixes><Prefix>{escape(name)}</Prefix></CommonPrefixes>"
+                )
+            else:
+                parts.append(
+                    f"<Contents><Key>{escape(name)}</Key>"
+                    f"<LastModified>{obj.last_modified:%Y-%m-%dT%H:%M:%S.%f}Z</LastModified>"
+                    f'<ETag>"{obj.etag}"</ETag><Size>{obj.size}</Size>'
+                    "<StorageClass>STANDARD</StorageClass></Contents>"
+                )
+        parts.append("</ListBucketResult>")
+        self._xml(200, "".join(parts))
+
+    def _delete_objects(self, bucket, body):
+        request = ElementTree.fromstring(body)
+        keys = [e.text for e in request.iter() if e.tag.rsplit("}", 1)[-1] == "Key"]
+        for key in keys:
+            self.state.delete(bucket, key)
+        quiet = any(
+            e.tag.rsplit("}", 1)[-1] == "Quiet" and e.text == "true"
+            for e in request.iter()
+        )
+        deleted = (
+            ""
+            if quiet
+            else "".join(f"<Deleted><Key>{escape(k)}</Key></Deleted>" for k in keys)
+        )
+        self._xml(200, f"<DeleteResult>{deleted}</DeleteResult>")
+
+    def _complete_upload(self, bucket, key, upload_id, body):
+        upload = self.state.uploads.pop(upload_id, None)
+        if upload is None:
+            return self._error(404, "NoSuchUpload", key)
+        _, _, content_type, parts = upload
+        request = ElementTree.fromstring(body)
+        numbers = [
+            int(e.text)
+            for e in request.iter()
+            if e.tag.rsplit("}", 1)[-1] == "PartNumber"
+        ]
+
+        path = self.state.new_path()
+        digests = hashlib.md5()
+        size = 0
+        with open(path, "wb") as out:
+            for number in numbers:
+                part_path, part_etag = parts.pop(number)
+                digests.update(bytes.fromhex(part_etag))
+                with open(part_path, "rb") as part:
+                    size += _copy(part, out)
+                _remove(part_path)
+        for part_path, _ in parts.values():  # Uploaded but not listed
+            _remove(part_path)
+
+        etag = f"{digests.hexdigest()}-{len(numbers)}"
+        self.state.put(bucket, key, _Object(path, size, etag, content_type))
+        self._xml(
+            200,
+            "<CompleteMultipartUploadResult>"
+            f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+            f'<ETag>"{etag}"</ETag>'
+            "</CompleteMultipartUploadResult>",
+        )
+
+    def _object_headers(self, obj):
+        return {
+            "Content-Type": obj.content_type,
+            "ETag": f'"{obj.etag}"',
+            "Last-Modified": format_datetime(obj.last_modified, usegmt=True),
+            "Accept-Ranges": "bytes",
+        }
+
+    def _receive_body(self):
+        path = self.state.new_path()
+        digest = hashlib.md5()
+        size = 0
+        remaining = int(self.headers.get("Content-Length", "0"))
+        with open(path, "wb") as out:
+            while remaining:
+                chunk = self.rfile.read(min(COPY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+                remaining -= len(chunk)
+        return path, size, digest.hexdigest()
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", "0")))
+
+    def _xml(self, status, body):
+        data = ('<?xml version="1.0" encoding="UTF-8"?>' + body).encode()
+        self._send(status, headers={"Content-Type": "application/xml"}, body=data)
+
+    def _error(self, status, code, resource):
+        self._xml(
+            status,
+            f"<Error><Code>{code}</Code><Message>{code}</Message>"
+            f"<Resource>{escape(resource)}</Resource>"
+            "<RequestId>fake</RequestId><HostId>fake</HostId></Error>",
+        )
+
+    def _send(self, status, headers=None, body=b"", length=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body) if length is None else length))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+
+def _copy(source, destination):
+    copied = 0
+    while chunk := source.read(COPY_CHUNK_SIZE):
+        destination.write(chunk)
+        copied += len(chunk)
+    return copied
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,436 @@
+"""Benchmark the service end to end against a local S3 stand-in.
+
+Starts an S3 backend (the in-process fake by default, or moto / a `minio`
+binary when available, or a temporary directory for the filesystem backend),
+runs the service under uvicorn in a subprocess pointed at it, then drives upload, download, list and delete requests over
+HTTP for every combination of object size and concurrency. Results,
+including the service's peak RSS per scenario, are written as JSON that
+`benchmarks/compare.py` can diff across commits.
+
+    python -m benchmarks.run --sizes 1KB,1MB,64MB --concurrency 1,16 -o before.json
+
+Service settings can be varied through the usual OBJECT_STORAGE_* variables,
+which the subprocess inherits.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.fake_s3 import FakeS3Server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUCKET = "bench"
+ACCESS_KEY = "benchmark"
+SECRET_KEY = "benchmark-secret"
+UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+OPERATIONS = ("upload", "download", "list", "delete")
+
+
+def parse_size(value: str):
+    value = value.strip().upper()
+    for unit in ("KB", "MB", "GB", "B"):
+        if value.endswith(unit):
+            return int(float(value[: -len(unit)]) * UNITS[unit])
+    return int(value)
+
+
+def format_size(size: int):
+    for unit in ("GB", "MB", "KB"):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return f"{size // UNITS[unit]}{unit}"
+    return f"{size}B"
+
+
+def percentile(values, fraction: float):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+class Backend:
+    """An S3 endpoint on localhost, or a directory; nothing here talks to the network"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._stop = None
+
+    @property
+    def settings(self):
+        """Environment pointing the service at this backend"""
+        if self.kind == "filesystem":
+            return {
+                "OBJECT_STORAGE_SERVICE": "filesystem",
+                "OBJECT_STORAGE_ROOT": self.endpoint,
+            }
+        return {
+            "OBJECT_STORAGE_SERVICE": "minio",
+            "OBJECT_STORAGE_ENDPOINT": self.endpoint,
+            "OBJECT_STORAGE_ACCESS_KEY": ACCESS_KEY,
+            "OBJECT_STORAGE_SECRET_KEY": SECRET_KEY,
+            "OBJECT_STORAGE_REGION": "us-east-1",
+            "OBJECT_STORAGE_SECURE": "false",
+        }
+
+    def start(self):
+        if self.kind == "filesystem":
+            self.endpoint = tempfile.mkdtemp(prefix="bench-filesystem-")
+            self._stop = functools.partial(
+                shutil.rmtree, self.endpoint, ignore_errors=True
+            )
+        elif self.kind == "fake":
+            server = FakeS3Server().start()
+            self.endpoint, self._stop = server.endpoint, server.stop
+        elif self.kind == "moto":
+            from moto.server import ThreadedMotoServer
+
+            port = _free_port()
+            server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+            server.start()
+            self.endpoint, self._stop = f"127.0.0.1:{port}", server.stop
+        elif self.kind == "minio":
+            binary = shutil.which("minio")
+            if binary is None:
+                raise RuntimeError("No minio binary on PATH")
+            data_dir = tempfile.mkdtemp(prefix="bench-minio-")
+            port = _free_port()
+            process = subprocess.Popen(
+                [binary, "server", data_dir, "--address", f"127.0.0.1:{port}"],
+                env={
+                    **os.environ,
+                    "MINIO_ROOT_USER": ACCESS_KEY,
+                    "MINIO_ROOT_PASSWORD": SECRET_KEY,
+                },
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            self.endpoint = f"127.0.0.1:{port}"
+            _wait_for(f"http://{self.endpoint}/minio/health/live")
+
+            def stop():
+                process.terminate()
+                process.wait()
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+            self._stop = stop
+        else:
+            raise ValueError(f"Unknown backend: {self.kind}")
+        return self
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop()
+
+
+class Service:
+    """The API under test, in its own process so its RSS is measured alone"""
+
+    def __init__(self, backend_settings: dict, workers: int = 1):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        # Run from an empty directory so a developer's .env files don't apply
+        self._cwd = tempfile.mkdtemp(prefix="bench-service-")
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join(
+                filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])
+            ),
+            **backend_settings,
+        }
+        self._process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "service:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(self.port),
+                "--workers",
+                str(workers),
+                "--log-level",
+                "warning",
+            ],
+            cwd=self._cwd,
+            env=env,
+        )
+
+    def start(self):
+        _wait_for(f"{self.url}/health")
+        return self
+
+    def stop(self):
+        self._process.terminate()
+        self._process.wait()
+        shutil.rmtree(self._cwd, ignore_errors=True)
+
+    def _pids(self):
+        # With --workers the server forks, so count the whole process tree
+        pids = [self._process.pid]
+        try:
+            with open(
+                f"/proc/{self._process.pid}/task/{self._process.pid}/children"
+            ) as f:
+                pids += [int(pid) for pid in f.read().split()]
+        except OSError:
+            pass
+        return pids
+
+    def reset_peak_rss(self):
+        for pid in self._pids():
+            try:  # Linux only: "5" resets VmHWM to the current RSS
+                with open(f"/proc/{pid}/clear_refs", "w") as f:
+                    f.write("5")
+            except OSError:
+                pass
+
+    def peak_rss(self):
+        """Summed VmHWM of the service processes in bytes, None if unavailable"""
+        total = None
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmHWM:"):
+                            total = (total or 0) + int(line.split()[1]) * 1024
+            except OSError:
+                pass
+        return total
+
+
+def make_payload(directory: str, size: int):
+    """A file of incompressible bytes, so uploads are streamed from disk"""
+    path = os.path.join(directory, f"payload-{size}")
+    if not os.path.exists(path):
+        block = os.urandom(min(size, 1024 * 1024))
+        with open(path, "wb") as f:
+            remaining = size
+            while remaining:
+                f.write(block[:remaining])
+                remaining -= min(len(block), remaining)
+    return path
+
+
+async def _drive(concurrency: int, count: int, request):
+    """Run `request(i)` for i in range(count) with `concurrency` in flight"""
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < count:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                ok = await request(index)
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def run_scenario(client, service, size, concurrency, count, payload):
+    keys = [f"bench-{format_size(size)}-c{concurrency}-{i}" for i in range(count)]
+
+    async def upload(i):
+        with open(payload, "rb") as f:
+            response = await client.post(
+                f"/upload/{BUCKET}",
+                files={"file": (keys[i], f, "application/octet-stream")},
+            )
+        return response.status_code == 200
+
+    async def download(i):
+        async with client.stream("GET", f"/download/{BUCKET}/{keys[i]}") as response:
+            received = 0
+            async for chunk in response.aiter_raw():
+                received += len(chunk)
+        return response.status_code == 200 and received == size
+
+    async def list_page(i):
+        response = await client.get(
+            f"/list/{BUCKET}",
+            params={"prefix": f"bench-{format_size(size)}-c{concurrency}-"},
+        )
+        return response.status_code == 200
+
+    async def delete(i):
+        response = await client.delete(f"/delete/{BUCKET}/{keys[i]}")
+        return response.status_code == 200
+
+    results = []
+    for operation, request in zip(OPERATIONS, (upload, download, list_page, delete)):
+        service.reset_peak_rss()
+        latencies, errors, elapsed = await _drive(concurrency, count, request)
+        moved = size * count if operation in ("upload", "download") else 0
+        results.append(
+            {
+                "operation": operation,
+                "size": size,
+                "concurrency": concurrency,
+                "requests": count,
+                "errors": errors,
+                "seconds": round(elapsed, 4),
+                "requests_per_second": round(count / elapsed, 2),
+                "mib_per_second": round(moved / elapsed / 1024**2, 2)
+                if moved
+                else None,
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+                "peak_rss_bytes": service.peak_rss(),
+            }
+        )
+        print(_summary(results[-1]), file=sys.stderr)
+    return results
+
+
+def _summary(result):
+    throughput = (
+        f"{result['mib_per_second']:>9.1f} MiB/s"
+        if result["mib_per_second"] is not None
+        else " " * 15
+    )
+    rss = result["peak_rss_bytes"]
+    return (
+        f"{result['operation']:<9}{format_size(result['size']):>6} "
+        f"c={result['concurrency']:<4}{result['requests_per_second']:>10.1f} req/s"
+        f"{throughput}  p50 {result['p50_ms']:>9.2f} ms  p99 {result['p99_ms']:>9.2f} ms"
+        f"  rss {rss / 1024**2 if rss else float('nan'):>7.1f} MiB"
+        f"  errors {result['errors']}"
+    )
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    budget = parse_size(args.max_bytes)
+    payload_dir = tempfile.mkdtemp(prefix="bench-payload-")
+
+    backend = Backend(args.backend).start()
+    service = Service(backend.settings, args.workers)
+    results = []
+    try:
+        service.start()
+        async with httpx.AsyncClient(
+            base_url=service.url,
+            timeout=None,
+            limits=httpx.Limits(max_connections=max(levels)),
+        ) as client:
+            response = await client.post(f"/create/{BUCKET}")
+            response.raise_for_status()
+            for size in sizes:
+                payload = make_payload(payload_dir, size)
+                # Large objects run fewer requests so a sweep stays bounded
+                count = max(min(args.requests, budget // size), 1)
+                for concurrency in levels:
+                    results += await run_scenario(
+                        client, service, size, concurrency, count, payload
+                    )
+    finally:
+        service.stop()
+        backend.stop()
+        shutil.rmtree(payload_dir, ignore_errors=True)
+
+    return {
+        "revision": _git_revision(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "workers": args.workers,
+        "settings": {
+            k: v for k, v in os.environ.items() if k.startswith("OBJECT_STORAGE_")
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--backend", choices=("fake", "moto", "minio", "filesystem"), default="fake"
+    )
+    parser.add_argument(
+        "--sizes", default="1KB,64KB,1MB,16MB,256MB,1GB", help="Object sizes to sweep"
+    )
+    parser.add_argument("--concurrency", default="1,8,32", help="Requests in flight")
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Requests per operation and scenario"
+    )
+    parser.add_argument(
+        "--max-bytes",
+        default="2GB",
+        help="Cap on bytes moved per operation and scenario, lowers --requests for large objects",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="uvicorn worker processes"
+    )
+    parser.add_argument(
+        "-o", "--output", help="Write JSON results here instead of stdout"
+    )
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
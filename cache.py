@@ -0,0 +1,500 @@
+import asyncio
+import fcntl
+import hashlib
+import itertools
+import json
+import math
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+from storage_base import StorageError
+
+
+class CachedObject:
+    def __init__(self, data: bytes, meta: dict):
+        self.data = data
+        self.meta = meta  # content_type, etag and last_modified of the cached body
+        self.validated_at = time.monotonic()
+
+
+class ObjectCache:
+    """Byte-bounded LRU of small object bodies, keyed on bucket/key and ETag.
+
+    Entries older than `ttl` seconds have to be revalidated against the
+    backend's current ETag before they are served again. Only touched from the
+    event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_bytes: int, max_object_size: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.max_object_size = min(max_object_size, max_bytes)
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._fills = {}  # (bucket, key) -> tokens of fills not yet invalidated
+
+    def accepts(self, size: int):
+        return 0 <= size <= self.max_object_size
+
+    def get(self, bucket_name: str, filename: str):
+        entry = self._entries.get((bucket_name, filename))
+        if entry is not None:
+            self._entries.move_to_end((bucket_name, filename))
+        return entry
+
+    def is_stale(self, entry: CachedObject):
+        return time.monotonic() - entry.validated_at > self.ttl
+
+    def revalidate(self, bucket_name: str, filename: str, etag: str):
+        """Keep the entry if the backend still has the same ETag, drop it otherwise"""
+        entry = self._entries.get((bucket_name, filename))
+        if entry is None:
+            return False
+        if etag is not None and etag == entry.meta.get("etag"):
+            entry.validated_at = time.monotonic()
+            return True
+        self._drop((bucket_name, filename))
+        return False
+
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def begin_fill(self, bucket_name: str, filename: str):
+        """Start filling from a backend read; an invalidation meanwhile voids it"""
+        token = object()
+        self._fills.setdefault((bucket_name, filename), set()).add(token)
+        return token
+
+    def end_fill(self, bucket_name: str, filename: str, token):
+        tokens = self._fills.get((bucket_name, filename))
+        if tokens is None or token not in tokens:
+            return False
+        tokens.discard(token)
+        if not tokens:
+            del self._fills[(bucket_name, filename)]
+        return True
+
+    def put(self, bucket_name: str, filename: str, data: bytes, meta: dict, token):
+        # A fill invalidated while in flight may hold the old body, so drop it
+        if not self.end_fill(bucket_name, filename, token):
+            return
+        if not self.accepts(len(data)):
+            return
+        self._drop((bucket_name, filename))
+        self._entries[(bucket_name, filename)] = CachedObject(data, meta)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.data)
+            self.evictions += 1
+
+    def invalidate(self, bucket_name: str, filename: str = None):
+        if filename is not None:
+            keys = {(bucket_name, filename)}
+        else:
+            keys = {
+                key for key in [*self._entries, *self._fills] if key[0] == bucket_name
+            }
+        for key in keys:
+            self._fills.pop(key, None)
+            self._drop(key)
+
+    def expire(self):
+        """Have every entry revalidated before it is served again, and void
+        fills in flight, when writes may have been missed"""
+        for entry in self._entries.values():
+            entry.validated_at = -math.inf
+        self._fills.clear()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.data)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+MISSING = object()  # Returned by MetadataCache.get on a miss, since None is cacheable
+
+
+class MetadataCache:
+    """Short-TTL LRU of backend lookups such as bucket existence and object stats.
+
+    Negative results (missing bucket or key) are kept for `negative_ttl`,
+    which is usually shorter so newly created objects show up quickly.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key):
+        item = self._entries.get(key)
+        if item is None or item[0] < time.monotonic():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key, value, negative: bool = False):
+        ttl = self.negative_ttl if negative else self.ttl
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class DiskEntry:
+    def __init__(self, path: str, size: int, meta: dict, validated_at: float = None):
+        self.path = path
+        self.size = size
+        self.meta = meta
+        self.validated_at = time.monotonic() if validated_at is None else validated_at
+        self.readers = 0  # Open streams, the file is only removed after they close
+        self.evicted = False
+
+
+class DiskFill:
+    """A backend read being written to the disk cache, which readers follow"""
+
+    def __init__(self, bucket_name: str, filename: str, path: str, size: int, meta):
+        self.key = (bucket_name, filename)
+        self.path = path  # The .part file until the fill completes
+        self.size = size
+        self.meta = meta
+        self.written = 0
+        self.error = None
+        self.invalidated = False
+        self._changed = asyncio.Event()
+
+    def advance(self, size: int):
+        self.written += size
+        self._notify()
+
+    def fail(self, error: BaseException):
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def changed(self):
+        await self._changed.wait()
+
+
+class DiskCache:
+    """Byte-bounded LRU of object bodies in a local directory, keyed on
+    bucket/key and ETag, for objects too large for ObjectCache.
+
+    Every body has a JSON sidecar with its key and metadata, so the cache
+    survives restarts; entries found on startup are revalidated before their
+    first use. An object is fetched by a single fill at a time, which every
+    concurrent reader follows as it is written. Bookkeeping happens on the
+    event loop, reading and writing bodies is left to the caller's executor.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._fills = {}  # (bucket, key) -> DiskFill in progress
+        self._fetching = {}  # (bucket, key) -> future resolved once its fill exists
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith("worker-"):  # Left by a run with several workers
+                continue
+            if name.endswith(".part"):  # Cut short by a restart
+                _remove(path)
+            elif name.endswith(".json"):
+                try:
+                    with open(path) as f:
+                        sidecar = json.load(f)
+                    stat = os.stat(path[: -len(".json")])
+                except (OSError, ValueError):
+                    _remove(path)
+                    continue
+                if stat.st_size != sidecar["size"]:
+                    _remove(path[: -len(".json")])
+                    continue
+                found.append((stat.st_mtime, sidecar, path[: -len(".json")]))
+            elif not os.path.exists(path + ".json"):
+                _remove(path)
+        for _, sidecar, path in sorted(found, key=lambda item: item[0]):
+            key = (sidecar["bucket"], sidecar["key"])
+            self._drop(key)
+            self._entries[key] = DiskEntry(
+                path, sidecar["size"], sidecar["meta"], validated_at=-math.inf
+            )
+            self.size += sidecar["size"]
+        self._evict()
+
+    def accepts(self, size: int):
+        return 0 < size <= self.max_bytes
+
+    def get(self, bucket_name: str, filename: str):
+        entry = self._entries.get((bucket_name, filename))
+        if entry is not None:
+            self._entries.move_to_end((bucket_name, filename))
+        return entry
+
+    def is_stale(self, entry: DiskEntry):
+        return time.monotonic() - entry.validated_at > self.ttl
+
+    def revalidate(self, bucket_name: str, filename: str, etag: str):
+        """Keep the entry if the backend still has the same ETag, drop it otherwise"""
+        entry = self._entries.get((bucket_name, filename))
+        if entry is None:
+            return False
+        if etag is not None and etag == entry.meta.get("etag"):
+            entry.validated_at = time.monotonic()
+            return True
+        self._drop((bucket_name, filename))
+        return False
+
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def acquire(self, entry: DiskEntry):
+        entry.readers += 1
+
+    def release(self, entry: DiskEntry):
+        entry.readers -= 1
+        if entry.evicted and not entry.readers:
+            _remove(entry.path)
+
+    def begin_fetch(self, bucket_name: str, filename: str):
+        """Note a backend read whose fill isn't set up yet, for others to wait on"""
+        future = asyncio.get_running_loop().create_future()
+        self._fetching[(bucket_name, filename)] = future
+
+    def end_fetch(self, bucket_name: str, filename: str):
+        future = self._fetching.pop((bucket_name, filename), None)
+        if future is not None:
+            future.set_result(None)
+
+    def fetching(self, bucket_name: str, filename: str):
+        return self._fetching.get((bucket_name, filename))
+
+    def fill_for(self, bucket_name: str, filename: str):
+        return self._fills.get((bucket_name, filename))
+
+    def begin_fill(self, bucket_name: str, filename: str, size: int, meta: dict):
+        """Start a fill, returning it and the file descriptor to write it to"""
+        digest = hashlib.sha256(
+            "\0".join((bucket_name, filename, meta.get("etag") or "")).encode()
+        ).hexdigest()
+        fd, path = tempfile.mkstemp(
+            prefix=digest + ".", suffix=".part", dir=self.directory
+        )
+        fill = DiskFill(bucket_name, filename, path, size, meta)
+        self._fills[fill.key] = fill
+        return fill, fd
+
+    def finish_fill(self, fill: DiskFill):
+        if self._fills.get(fill.key) is fill:
+            del self._fills[fill.key]
+        if fill.invalidated:  # May hold an outdated body
+            _remove(fill.path)
+            return
+        path = fill.path[: -len(".part")]
+        with open(path + ".json", "w") as f:
+            json.dump(
+                {
+                    "bucket": fill.key[0],
+                    "key": fill.key[1],
+                    "size": fill.size,
+                    "meta": fill.meta,
+                },
+                f,
+            )
+        os.replace(fill.path, path)
+        self._drop(fill.key)
+        self._entries[fill.key] = DiskEntry(path, fill.size, fill.meta)
+        self.size += fill.size
+        self._evict()
+
+    def abort_fill(self, fill: DiskFill, error: BaseException):
+        fill.fail(error)
+        if self._fills.get(fill.key) is fill:
+            del self._fills[fill.key]
+        _remove(fill.path)
+
+    def invalidate(self, bucket_name: str, filename: str):
+        fill = self._fills.pop((bucket_name, filename), None)
+        if fill is not None:
+            fill.invalidated = True
+        self._drop((bucket_name, filename))
+
+    def expire(self):
+        """Like ObjectCache.expire"""
+        for entry in self._entries.values():
+            entry.validated_at = -math.inf
+        for key in list(self._fills):
+            self._fills.pop(key).invalidated = True
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            key = next(iter(self._entries))
+            self._drop(key)
+            self.evictions += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        entry.evicted = True
+        if not entry.readers:
+            _remove(entry.path)
+        else:  # Removed from the index now, from disk once the last reader is done
+            _remove(entry.path + ".json")
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "fills_in_progress": len(self._fills),
+        }
+
+
+class FileStream:
+    """Async iterable over `length` bytes of an open file, from `offset`.
+
+    With a `fill`, the file is still being written and reads wait for the
+    bytes to arrive. Reaching the end or calling `aclose` closes the file,
+    so a stream that is never iterated can still be released.
+    """
+
+    def __init__(self, fd, offset, length, run, chunk_size, fill=None, on_close=None):
+        self.fd = fd
+        self.offset = offset
+        self.length = length
+        self.position = offset
+        self.fill = fill
+        self._run = run
+        self._chunk_size = chunk_size
+        self._on_close = on_close
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self._read()
+        except BaseException:
+            await self.aclose()
+            raise
+        if not chunk:
+            await self.aclose()
+            raise StopAsyncIteration
+        return chunk
+
+    async def _read(self):
+        end = self.offset + self.length
+        while self.position < end:
+            available = end if self.fill is None else min(end, self.fill.written)
+            if self.position >= available:
+                if self.fill.error is not None:
+                    raise StorageError(f"Cache fill failed: {self.fill.error}")
+                await self.fill.changed()
+                continue
+            chunk = await self._run(
+                os.pread,
+                self.fd,
+                min(self._chunk_size, available - self.position),
+                self.position,
+            )
+            if not chunk:
+                raise StorageError("Cached file ended early")
+            self.position += len(chunk)
+            return chunk
+        return None
+
+    async def aclose(self):
+        if self.fd is None:
+            return
+        os.close(self.fd)
+        self.fd = None
+        if self._on_close is not None:
+            self._on_close()
+
+
+def claim_directory(directory: str):
+    """A subdirectory of `directory` that no other live process has claimed,
+    so worker processes each keep a disk cache of their own. Claims are
+    flocks, released when the process exits, so restarted workers reuse them"""
+    os.makedirs(directory, exist_ok=True)
+    for slot in itertools.count():
+        path = os.path.join(directory, f"worker-{slot}")
+        fd = os.open(path + ".lock", os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        _claims.append(fd)
+        return path
+
+
+_claims = []  # Lock files of claimed directories, held open for the process's life
+
+
+def _remove(path: str):
+    for name in (path, path + ".json"):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
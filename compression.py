@@ -0,0 +1,97 @@
+import zlib
+from fnmatch import fnmatch
+
+try:
+    import zstandard
+except ImportError:  # Optional, gzip is always available
+    zstandard = None
+
+READ_SIZE = 1024 * 1024  # Raw bytes compressed per step of a streaming upload
+
+
+class _Gzip:
+    name = "gzip"
+
+    def compressor(self):
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 writes a gzip header
+
+    def decompressor(self):
+        return zlib.decompressobj(31)
+
+
+class _Zstd:
+    name = "zstd"
+
+    def compressor(self):
+        return zstandard.ZstdCompressor(level=3).compressobj()
+
+    def decompressor(self):
+        return zstandard.ZstdDecompressor().decompressobj()
+
+
+# Codec names double as Content-Encoding tokens
+CODECS = {"gzip": _Gzip()}
+if zstandard is not None:
+    CODECS["zstd"] = _Zstd()
+
+
+class CompressionPolicy:
+    """Decides which uploads are compressed, and with what codec.
+
+    An upload is compressed when its bucket is listed (or "*" is) and its
+    content type matches one of the patterns, such as "text/*".
+    """
+
+    def __init__(self, buckets, content_types, codec: str, min_size: int):
+        if codec == "auto":
+            codec = "zstd" if "zstd" in CODECS else "gzip"
+        if codec not in CODECS:
+            raise ValueError(f"Unavailable compression codec: {codec}")
+        self.codec = CODECS[codec]
+        self.buckets = set(buckets)
+        self.content_types = list(content_types)
+        self.min_size = min_size
+
+    def covers(self, bucket_name: str):
+        return "*" in self.buckets or bucket_name in self.buckets
+
+    def codec_for(self, bucket_name: str, content_type: str, size: int = None):
+        if not self.covers(bucket_name):
+            return None
+        if size is None or size < self.min_size:
+            # Small bodies don't pay for the framing, and without a size the
+            # original length couldn't be recorded for stats and ranges
+            return None
+        content_type = (content_type or "").partition(";")[0].strip().lower()
+        if not any(fnmatch(content_type, pattern) for pattern in self.content_types):
+            return None
+        return self.codec
+
+
+class CompressingReader:
+    """File-like view of `fileobj` that yields its bytes compressed.
+
+    Lets the backend client stream a compressed upload of unknown length
+    without the whole object being compressed up front. Blocking, run it
+    off-loop.
+    """
+
+    def __init__(self, fileobj, codec):
+        self._fileobj = fileobj
+        self._compressor = codec.compressor()
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, size: int = -1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._fileobj.read(READ_SIZE)
+            if chunk:
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
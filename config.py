@@ -1,5 +1,6 @@
 # config.py
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -19,11 +20,16 @@ class StorageConfig:  # docker practically skips all the logic below since it lo
             self._load_nebius_config()
         elif self.OBJECT_STORAGE_SERVICE == "aws":
             self._load_aws_config()
+        elif self.OBJECT_STORAGE_SERVICE == "filesystem":
+            self._load_filesystem_config()
         else:
             raise ValueError(
                 f"Unsupported storage service: {self.OBJECT_STORAGE_SERVICE}"
             )
 
+        self._load_transfer_config()
+        self._load_routing_config()
+
     def _load_minio_config(self):
         if os.path.exists(".env.minio"):
             load_dotenv(".env.minio", override=True)
@@ -75,5 +81,232 @@ class StorageConfig:  # docker practically skips all the logic below since it lo
             os.getenv("OBJECT_STORAGE_SECURE", "true").lower() == "true"
         )
 
+    def _load_filesystem_config(self):
+        if os.path.exists(".env.filesystem"):
+            load_dotenv(".env.filesystem", override=True)
+        self.OBJECT_STORAGE_ROOT = os.path.abspath(
+            os.getenv("OBJECT_STORAGE_ROOT", "data")
+        )  # Directory holding the buckets and their index
+        self.OBJECT_STORAGE_FSYNC = (
+            os.getenv("OBJECT_STORAGE_FSYNC", "true").lower() == "true"
+        )  # Flush each upload to disk before it becomes visible
+        # There's nothing to connect or sign requests to, the directory is the endpoint
+        self.OBJECT_STORAGE_ENDPOINT = self.OBJECT_STORAGE_ROOT
+        self.OBJECT_STORAGE_ACCESS_KEY = None
+        self.OBJECT_STORAGE_SECRET_KEY = None
+        self.OBJECT_STORAGE_REGION = None
+        self.OBJECT_STORAGE_SECURE = False
+
+    def _load_transfer_config(self):  # Shared by every backend
+        self.OBJECT_STORAGE_WORKERS = (
+            int(os.getenv("OBJECT_STORAGE_WORKERS", os.getenv("WEB_CONCURRENCY", "1")))
+            or os.cpu_count()
+        )  # Worker processes, 0 for one per CPU; uvicorn and gunicorn read WEB_CONCURRENCY
+        self.OBJECT_STORAGE_WORKER_SOCKET_DIR = os.getenv(
+            "OBJECT_STORAGE_WORKER_SOCKET_DIR",
+            os.path.join(
+                tempfile.gettempdir(), f"object-storage-workers-{os.getpgrp()}"
+            ),
+        )  # Where workers bind the sockets telling each other about writes, per process group
+        self.OBJECT_STORAGE_CHUNK_SIZE = int(
+            os.getenv("OBJECT_STORAGE_CHUNK_SIZE", str(1024 * 1024))
+        )  # Bytes read from the backend per chunk when streaming downloads
+        self.OBJECT_STORAGE_PART_SIZE = int(
+            os.getenv("OBJECT_STORAGE_PART_SIZE", str(16 * 1024 * 1024))
+        )  # Multipart upload part size, S3 requires at least 5 MiB
+        self.OBJECT_STORAGE_PARALLEL_UPLOADS = int(
+            os.getenv("OBJECT_STORAGE_PARALLEL_UPLOADS", "3")
+        )  # Parts uploaded concurrently per request, each holds one part in memory
+        self.OBJECT_STORAGE_UPLOAD_MAX_CHUNK_SIZE = int(
+            os.getenv("OBJECT_STORAGE_UPLOAD_MAX_CHUNK_SIZE", str(64 * 1024 * 1024))
+        )  # Largest chunk of a resumable upload, each is held in memory
+        self.OBJECT_STORAGE_UPLOAD_SESSION_TTL = float(
+            os.getenv("OBJECT_STORAGE_UPLOAD_SESSION_TTL", "86400")
+        )  # Seconds a resumable upload may sit idle before it is aborted
+        self.OBJECT_STORAGE_UPLOAD_REAP_INTERVAL = float(
+            os.getenv("OBJECT_STORAGE_UPLOAD_REAP_INTERVAL", "300")
+        )  # Seconds between sweeps for idle resumable uploads
+        self.OBJECT_STORAGE_MAX_WORKERS = int(
+            os.getenv("OBJECT_STORAGE_MAX_WORKERS", "32")
+        )  # Threads running blocking backend calls off the event loop
+        self.OBJECT_STORAGE_CACHE_MAX_BYTES = int(
+            os.getenv("OBJECT_STORAGE_CACHE_MAX_BYTES", "0")
+        )  # In-memory object cache budget, 0 disables it
+        self.OBJECT_STORAGE_CACHE_MAX_OBJECT_SIZE = int(
+            os.getenv("OBJECT_STORAGE_CACHE_MAX_OBJECT_SIZE", str(1024 * 1024))
+        )  # Larger objects are never cached in memory
+        self.OBJECT_STORAGE_CACHE_TTL = float(
+            os.getenv("OBJECT_STORAGE_CACHE_TTL", "30")
+        )  # Seconds before a cached object is revalidated against its ETag
+        self.OBJECT_STORAGE_DISK_CACHE_DIR = os.getenv(
+            "OBJECT_STORAGE_DISK_CACHE_DIR", ""
+        )  # Local directory caching objects too large for memory, empty disables it
+        self.OBJECT_STORAGE_DISK_CACHE_MAX_BYTES = int(
+            os.getenv("OBJECT_STORAGE_DISK_CACHE_MAX_BYTES", str(10 * 1024**3))
+        )  # Disk cache budget per backend, least recently used objects go first
+        self.OBJECT_STORAGE_SINGLE_FLIGHT = (
+            os.getenv("OBJECT_STORAGE_SINGLE_FLIGHT", "true").lower() == "true"
+        )  # Concurrent identical downloads, stats and listings share one request
+        self.OBJECT_STORAGE_SINGLE_FLIGHT_BUFFER = int(
+            os.getenv("OBJECT_STORAGE_SINGLE_FLIGHT_BUFFER", str(16 * 1024 * 1024))
+        )  # How far a shared download may run ahead of its slowest reader
+        self.OBJECT_STORAGE_WARMUP_MANIFEST = os.getenv(
+            "OBJECT_STORAGE_WARMUP_MANIFEST", ""
+        )  # File of `bucket` or `bucket/key` lines loaded into the caches on startup
+        self.OBJECT_STORAGE_WARMUP_ACCESS_LOG = os.getenv(
+            "OBJECT_STORAGE_WARMUP_ACCESS_LOG", ""
+        )  # Access log whose most requested buckets and objects are loaded on startup
+        self.OBJECT_STORAGE_WARMUP_MAX_OBJECTS = int(
+            os.getenv("OBJECT_STORAGE_WARMUP_MAX_OBJECTS", "1000")
+        )  # Objects loaded on startup at most
+        self.OBJECT_STORAGE_WARMUP_TIMEOUT = float(
+            os.getenv("OBJECT_STORAGE_WARMUP_TIMEOUT", "60")
+        )  # Seconds startup waits for the warm-up, which then finishes in the background
+        self.OBJECT_STORAGE_READ_AHEAD = (
+            os.getenv("OBJECT_STORAGE_READ_AHEAD", "false").lower() == "true"
+        )  # Fetch small objects returned by /list into the caches in the background
+        self.OBJECT_STORAGE_READ_AHEAD_MAX_SIZE = int(
+            os.getenv("OBJECT_STORAGE_READ_AHEAD_MAX_SIZE", str(1024 * 1024))
+        )  # Larger listed objects aren't fetched ahead
+        self.OBJECT_STORAGE_READ_AHEAD_CONCURRENCY = int(
+            os.getenv("OBJECT_STORAGE_READ_AHEAD_CONCURRENCY", "4")
+        )  # Read-ahead fetches in flight at once
+        self.OBJECT_STORAGE_READ_AHEAD_MAX_PENDING = int(
+            os.getenv("OBJECT_STORAGE_READ_AHEAD_MAX_PENDING", "1000")
+        )  # Queued read-ahead fetches, beyond which listings don't add more
+        self.OBJECT_STORAGE_METADATA_TTL = float(
+            os.getenv("OBJECT_STORAGE_METADATA_TTL", "5")
+        )  # Seconds bucket existence and object stats are reused, 0 disables it
+        self.OBJECT_STORAGE_METADATA_NEGATIVE_TTL = float(
+            os.getenv("OBJECT_STORAGE_METADATA_NEGATIVE_TTL", "1")
+        )  # Same for missing buckets and keys
+        self.OBJECT_STORAGE_METADATA_MAX_ENTRIES = int(
+            os.getenv("OBJECT_STORAGE_METADATA_MAX_ENTRIES", "10000")
+        )
+        self.OBJECT_STORAGE_BATCH_CONCURRENCY = int(
+            os.getenv("OBJECT_STORAGE_BATCH_CONCURRENCY", "8")
+        )  # Backend requests in flight per bulk operation
+        self.OBJECT_STORAGE_POOL_SIZE = int(
+            os.getenv("OBJECT_STORAGE_POOL_SIZE", "64")
+        )  # Kept-alive backend connections, one per busy thread or streamed download
+        self.OBJECT_STORAGE_POOL_BLOCK = (
+            os.getenv("OBJECT_STORAGE_POOL_BLOCK", "false").lower() == "true"
+        )  # Wait for a free connection instead of opening a throwaway one
+        self.OBJECT_STORAGE_CONNECT_TIMEOUT = float(
+            os.getenv("OBJECT_STORAGE_CONNECT_TIMEOUT", "5")
+        )
+        self.OBJECT_STORAGE_READ_TIMEOUT = float(
+            os.getenv("OBJECT_STORAGE_READ_TIMEOUT", "300")
+        )  # Seconds without a byte from the backend before a request fails
+        self.OBJECT_STORAGE_MAX_RETRIES = int(
+            os.getenv("OBJECT_STORAGE_MAX_RETRIES", "5")
+        )  # Retries on connection errors and 500, 502 and 504 responses
+        self.OBJECT_STORAGE_RETRY_BACKOFF = float(
+            os.getenv("OBJECT_STORAGE_RETRY_BACKOFF", "0.2")
+        )  # Exponential backoff factor between retries, in seconds
+        self.OBJECT_STORAGE_RETRY_MAX_BACKOFF = float(
+            os.getenv("OBJECT_STORAGE_RETRY_MAX_BACKOFF", "10")
+        )  # Longest wait before retrying a throttled request, in seconds
+        self.OBJECT_STORAGE_THROTTLE_RETRIES = int(
+            os.getenv("OBJECT_STORAGE_THROTTLE_RETRIES", "3")
+        )  # Retries of idempotent requests the backend throttled (SlowDown, 503)
+        self.OBJECT_STORAGE_BUCKET_CONCURRENCY = int(
+            os.getenv(
+                "OBJECT_STORAGE_BUCKET_CONCURRENCY",
+                str(self.OBJECT_STORAGE_MAX_WORKERS),
+            )
+        )  # Backend requests in flight per bucket, lowered while the backend throttles
+        self.OBJECT_STORAGE_BUCKET_MIN_CONCURRENCY = int(
+            os.getenv("OBJECT_STORAGE_BUCKET_MIN_CONCURRENCY", "1")
+        )  # Floor throttling can lower a bucket's concurrency to
+        self.OBJECT_STORAGE_BUCKET_MAX_QUEUE = int(
+            os.getenv("OBJECT_STORAGE_BUCKET_MAX_QUEUE", "1000")
+        )  # Requests waiting per bucket, beyond which clients get a 429
+        self.OBJECT_STORAGE_TCP_KEEPALIVE = (
+            os.getenv("OBJECT_STORAGE_TCP_KEEPALIVE", "true").lower() == "true"
+        )  # So idle pooled connections dropped by a middlebox are detected
+        self.OBJECT_STORAGE_COMPRESS_BUCKETS = _split(
+            os.getenv("OBJECT_STORAGE_COMPRESS_BUCKETS", "")
+        )  # Buckets whose uploads are compressed, "*" for all, empty disables it
+        self.OBJECT_STORAGE_COMPRESS_TYPES = _split(
+            os.getenv(
+                "OBJECT_STORAGE_COMPRESS_TYPES",
+                "text/*,application/json,application/x-ndjson,application/xml,"
+                "application/javascript,application/x-yaml",
+            )
+        )  # Content type patterns worth compressing
+        self.OBJECT_STORAGE_COMPRESS_CODEC = os.getenv(
+            "OBJECT_STORAGE_COMPRESS_CODEC", "auto"
+        ).lower()  # gzip, zstd (needs the zstandard package) or auto
+        self.OBJECT_STORAGE_COMPRESS_MIN_SIZE = int(
+            os.getenv("OBJECT_STORAGE_COMPRESS_MIN_SIZE", "1024")
+        )
+        self.OBJECT_STORAGE_DEDUP_BUCKETS = _split(
+            os.getenv("OBJECT_STORAGE_DEDUP_BUCKETS", "")
+        )  # Buckets whose uploads are deduplicated by content, "*" for all, empty disables it
+        self.OBJECT_STORAGE_DEDUP_MIN_SIZE = int(
+            os.getenv("OBJECT_STORAGE_DEDUP_MIN_SIZE", str(1024 * 1024))
+        )  # Smaller uploads are sent as-is, a copy costs about as much as sending them
+        self.OBJECT_STORAGE_DEDUP_INDEX = os.getenv(
+            "OBJECT_STORAGE_DEDUP_INDEX", ""
+        )  # SQLite file mapping content hashes to stored objects, shared by workers;
+        # empty for one per backend endpoint and access key in the temp directory
+        self.OBJECT_STORAGE_PRESIGN_ENDPOINT = (
+            os.getenv("OBJECT_STORAGE_PRESIGN_ENDPOINT", self.OBJECT_STORAGE_ENDPOINT)
+            .replace("https://", "")
+            .replace("http://", "")
+        )  # Host clients use to reach the backend, if not the one this service uses
+        self.OBJECT_STORAGE_PRESIGN_EXPIRY = int(
+            os.getenv("OBJECT_STORAGE_PRESIGN_EXPIRY", "3600")
+        )  # Default lifetime of presigned URLs in seconds
+        self.OBJECT_STORAGE_PRESIGN_MAX_EXPIRY = int(
+            os.getenv("OBJECT_STORAGE_PRESIGN_MAX_EXPIRY", str(7 * 24 * 3600))
+        )  # Longest lifetime a client may ask for, S3 allows up to 7 days
+
+    def _load_routing_config(self):  # Extra backends that buckets can be routed to
+        self.OBJECT_STORAGE_BACKENDS = {
+            name: self._load_backend_config(name)
+            for name in _split(os.getenv("OBJECT_STORAGE_BACKENDS", "").lower())
+        }  # Named backends besides the one above, which is called "default"
+        if "default" in self.OBJECT_STORAGE_BACKENDS:
+            raise ValueError('"default" is reserved for the main backend')
+        self.OBJECT_STORAGE_ROUTES = _split(
+            os.getenv("OBJECT_STORAGE_ROUTES", "")
+        )  # bucket[/prefix]=primary[+replica...], unmatched keys use "default"
+        self.OBJECT_STORAGE_REPLICATION_CONCURRENCY = int(
+            os.getenv("OBJECT_STORAGE_REPLICATION_CONCURRENCY", "4")
+        )  # Objects copied to replicas at once, in the background
+        self.OBJECT_STORAGE_FAILOVER_COOLDOWN = float(
+            os.getenv("OBJECT_STORAGE_FAILOVER_COOLDOWN", "30")
+        )  # Seconds a failing backend is only read from as a last resort
+
+    def _load_backend_config(self, name: str):
+        # e.g. OBJECT_STORAGE_US_ENDPOINT for a backend named "us"
+        env = f"OBJECT_STORAGE_{name.upper().replace('-', '_')}_"
+        endpoint = os.getenv(env + "ENDPOINT")
+        if not endpoint:
+            raise ValueError(f"Backend '{name}' needs {env}ENDPOINT")
+        access_key = os.getenv(env + "ACCESS_KEY")
+        secret_key = os.getenv(env + "SECRET_KEY")
+        if not access_key or not secret_key:
+            # Never fall back to the default backend's, which would send them
+            # to another endpoint
+            raise ValueError(
+                f"Backend '{name}' needs {env}ACCESS_KEY and {env}SECRET_KEY"
+            )
+        return {
+            "endpoint": endpoint.replace("https://", "")
+            .replace("http://", "")
+            .replace(":443", ""),
+            "access_key": access_key,
+            "secret_key": secret_key,
+            "region": os.getenv(env + "REGION", "us-east-1"),
+            "secure": os.getenv(env + "SECURE", "true").lower() == "true",
+        }
+
+
+def _split(value: str):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
 
 config = StorageConfig()
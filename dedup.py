@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from collections import namedtuple
+
+HASH_CHUNK_SIZE = 1024 * 1024  # Bytes read from a spooled upload per hash update
+SHA256_HEX = re.compile(r"[0-9a-f]{64}")
+
+_Content = namedtuple("_Content", "bucket key etag size metadata")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS content (
+    scope TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    etag TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    metadata TEXT NOT NULL,
+    PRIMARY KEY (scope, sha256)
+);
+"""
+
+
+class ContentIndex:
+    """Where content with a given SHA-256 was stored, per backend, so that
+    identical uploads become server-side copies of it.
+
+    Entries aren't removed when their object is overwritten or deleted.
+    Copies are conditional on the recorded ETag instead, and entries found
+    stale that way are dropped. SQLite in WAL mode, so worker processes share
+    one index. Blocking, run it off-loop.
+    """
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()  # One connection shared by executor threads
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Losing the last few entries to a crash only costs their uploads
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def get(self, scope: str, sha256: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT bucket, key, etag, size, metadata FROM content"
+                " WHERE scope = ? AND sha256 = ?",
+                (scope, sha256),
+            ).fetchone()
+        if row is None:
+            return None
+        return _Content(*row[:4], json.loads(row[4]))
+
+    def put(self, scope, sha256, bucket, key, etag, size, metadata: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scope, sha256, bucket, key, etag, size, json.dumps(metadata)),
+            )
+
+    def discard(self, scope: str, sha256: str, etag: str):
+        """Drop an entry found stale, unless it was replaced meanwhile"""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM content WHERE scope = ? AND sha256 = ? AND etag = ?",
+                (scope, sha256, etag),
+            )
+
+
+def default_index_path(endpoint: str, access_key: str):
+    """An index file of its own for each backend and set of credentials, so
+    deployments sharing a host never copy from objects they can't read"""
+    owner = hashlib.sha256(f"{endpoint}\0{access_key}".encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"object-storage-dedup-{owner}.sqlite3")
+
+
+def hash_file(fileobj):
+    """Hex SHA-256 of a file's contents, leaving it rewound. Blocking"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    while chunk := fileobj.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
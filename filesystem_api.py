@@ -0,0 +1,445 @@
+# filesystem_api.py
+import collections
+import functools
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from fastapi import UploadFile
+
+from cache import FileStream
+from config import config
+from storage_base import (
+    StorageAPI,
+    decode_continuation_token,
+    encode_continuation_token,
+)
+
+BUCKET_NAME = re.compile(r"^[a-z0-9][a-z0-9.-]{1,61}[a-z0-9]$")  # As in S3
+MAX_KEY_BYTES = 1024  # As in S3
+LAST_CHAR = "\U0010ffff"  # Sorts after every other character a key can hold
+STALE_UPLOAD_AGE = 3600  # Seconds a temporary upload file may go untouched
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    created REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    file TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT NOT NULL,
+    content_type TEXT,
+    modified TEXT NOT NULL,  -- ISO 8601 in UTC, as listings report it
+    PRIMARY KEY (bucket, key)
+) WITHOUT ROWID;
+"""
+
+
+class ObjectIndex:
+    """SQLite index of every object's metadata and file.
+
+    Listings are range scans over (bucket, key) instead of directory walks,
+    and a key's file changes in one transaction. Blocking, run it off-loop.
+    """
+
+    def __init__(self, path: str):
+        # Autocommit, transactions are opened explicitly where needed
+        self._db = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()  # One connection shared by executor threads
+        self._db.execute("PRAGMA journal_mode=WAL")  # Readers don't block writers
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def bucket_exists(self, bucket: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM buckets WHERE name = ?", (bucket,)
+            ).fetchone()
+        return row is not None
+
+    def add_bucket(self, bucket: str):
+        """Whether the bucket is new"""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO buckets VALUES (?, ?)", (bucket, time.time())
+            )
+        return cursor.rowcount == 1
+
+    def get(self, bucket: str, key: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT file, size, etag, content_type, modified FROM objects"
+                " WHERE bucket = ? AND key = ?",
+                (bucket, key),
+            ).fetchone()
+        return None if row is None else _Object(*row)
+
+    def put(self, bucket: str, key: str, obj):
+        """Points `key` at `obj`, returning the file it replaced, if any"""
+        with self._lock, self._transaction():
+            replaced = self._db.execute(
+                "SELECT file FROM objects WHERE bucket = ? AND key = ?", (bucket, key)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (bucket, key, *obj),
+            )
+        return replaced and replaced[0]
+
+    def delete(self, bucket: str, keys: list):
+        """Removes `keys`, returning the files they pointed at"""
+        files = []
+        with self._lock, self._transaction():
+            for key in keys:
+                row = self._db.execute(
+                    "SELECT file FROM objects WHERE bucket = ? AND key = ?",
+                    (bucket, key),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "DELETE FROM objects WHERE bucket = ? AND key = ?",
+                        (bucket, key),
+                    )
+                    files.append(row[0])
+        return files
+
+    def list(self, bucket: str, prefix: str, recursive: bool, start_after, limit):
+        """Up to `limit` objects and common prefixes after `start_after`, in key
+        order, and whether there are more"""
+        prefix = prefix or ""
+        if start_after is not None and start_after >= prefix:
+            bound, inclusive = start_after, False
+        else:
+            bound, inclusive = prefix, True
+        entries = []
+        with self._lock:
+            while len(entries) <= limit:
+                rows = self._db.execute(
+                    "SELECT key, size, modified FROM objects WHERE bucket = ?"
+                    f" AND key {'>=' if inclusive else '>'} ? AND key < ?"
+                    " ORDER BY key LIMIT ?",
+                    (bucket, bound, prefix + LAST_CHAR, limit + 1 - len(entries)),
+                ).fetchall()
+                if not rows:
+                    break
+                for key, size, modified in rows:
+                    bound, inclusive = key, False
+                    slash = -1 if recursive else key.find("/", len(prefix))
+                    if slash < 0:
+                        entries.append((key, size, modified))
+                        continue
+                    # Everything under a common prefix is reported once, so
+                    # seek past it rather than reading its keys
+                    common = key[: slash + 1]
+                    entries.append((common, None, None))
+                    bound = common + LAST_CHAR
+                    break
+        return entries[:limit], len(entries) > limit
+
+    def _transaction(self):
+        return _Transaction(self._db)
+
+
+class _Transaction:
+    def __init__(self, db):
+        self._db = db
+
+    def __enter__(self):
+        self._db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self._db.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+_Object = collections.namedtuple(
+    "_Object", ["file", "size", "etag", "content_type", "modified"]
+)
+
+
+class FileSystemAPI(StorageAPI):
+    """Stores objects as plain files under a local directory.
+
+    Each upload is written to a temporary file and renamed into place under
+    a name of its own, then the key is pointed at it in the index. Readers
+    that already opened the previous file keep reading it.
+    """
+
+    def __init__(self, root=None, fsync: bool = None):
+        super().__init__(endpoint=root or config.OBJECT_STORAGE_ROOT)
+        self.root = self.endpoint
+        self.chunk_size = config.OBJECT_STORAGE_CHUNK_SIZE
+        self.fsync = fsync if fsync is not None else config.OBJECT_STORAGE_FSYNC
+        self._tmp = os.path.join(self.root, ".tmp")
+        os.makedirs(self._tmp, exist_ok=True)
+        for name in os.listdir(self._tmp):
+            path = os.path.join(self._tmp, name)
+            # Uploads cut short by a crash; other processes may be writing the rest
+            if os.stat(path).st_mtime < time.time() - STALE_UPLOAD_AGE:
+                _unlink(path)
+        self.index = ObjectIndex(os.path.join(self.root, ".index.sqlite3"))
+        self._readers = collections.Counter()  # Open downloads per file
+        self._garbage = set()  # Replaced files to remove once nobody reads them
+
+    async def list_files(
+        self,
+        bucket_name: str,
+        prefix: str = None,
+        recursive: bool = False,
+        max_keys: int = 1000,
+        continuation_token: str = None,
+        sizes: bool = False,  # Objects are stored as uploaded, so sizes are original
+    ):
+        try:
+            start_after = decode_continuation_token(continuation_token)
+        except ValueError:
+            return {"error": "Invalid continuation token"}
+        if not await self._run(self.index.bucket_exists, bucket_name):
+            return {"error": f"Bucket '{bucket_name}' does not exist"}
+
+        entries, is_truncated = await self._run(
+            self.index.list, bucket_name, prefix, recursive, start_after, max_keys
+        )
+        return {
+            "bucket": bucket_name,
+            "files": [
+                {"name": name, "size": size, "last_modified": modified}
+                for name, size, modified in entries
+                if size is not None
+            ],
+            "prefixes": [name for name, size, _ in entries if size is None],
+            "is_truncated": is_truncated,
+            "next_continuation_token": encode_continuation_token(
+                entries[-1][0], entries[-1][1] is None
+            )
+            if is_truncated
+            else None,
+        }
+
+    async def upload_file(self, bucket_name: str, file: UploadFile):
+        error = _check_key(file.filename)
+        if error is None and not await self._run(self.index.bucket_exists, bucket_name):
+            error = f"Bucket '{bucket_name}' does not exist"
+        if error is not None:
+            return {"error": f"Error uploading file: {error}"}
+        try:
+            obj = await self._run(
+                self._store, bucket_name, file.file, file.content_type
+            )
+        except OSError as e:
+            return {"error": f"Error uploading file: {str(e)}"}
+        try:
+            replaced = await self._run(self.index.put, bucket_name, file.filename, obj)
+        except sqlite3.Error as e:
+            self._discard(obj.file)
+            return {"error": f"Error uploading file: {str(e)}"}
+        self._discard(replaced)
+        return {"message": "File uploaded successfully", "etag": obj.etag}
+
+    def _store(self, bucket_name: str, source, content_type: str):
+        """Blocking. Writes `source` to a new file in the bucket"""
+        digest = hashlib.md5()  # The ETag S3 gives single-part uploads
+        size = 0
+        fd, temp = tempfile.mkstemp(dir=self._tmp)
+        try:
+            with open(fd, "wb") as f:
+                while chunk := source.read(self.chunk_size):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                if self.fsync:
+                    os.fsync(f.fileno())
+            name = uuid.uuid4().hex
+            file = os.path.join(bucket_name, name[:2], name)
+            os.makedirs(os.path.dirname(self._path(file)), exist_ok=True)
+            os.replace(temp, self._path(file))  # Never visible half written
+        except BaseException:
+            _unlink(temp)
+            raise
+        return _Object(file, size, f'"{digest.hexdigest()}"', content_type, _now())
+
+    async def download_file(
+        self,
+        bucket_name: str,
+        filename: str,
+        offset: int = 0,
+        length: int = None,
+        accept_encoding: str = None,
+    ):
+        # Objects are stored as uploaded, so there's no encoding to negotiate
+        obj, fd = await self._open(bucket_name, filename)
+        if obj is None:
+            return {"error": "Error downloading file: NoSuchKey"}
+        if offset and offset >= obj.size:
+            self._close(obj.file, fd)
+            return {"error": "Error downloading file: InvalidRange"}
+
+        size = min(length, obj.size - offset) if length else obj.size - offset
+        result = {
+            "body": FileStream(
+                fd,
+                offset,
+                size,
+                self._run,
+                self.chunk_size,
+                on_close=functools.partial(self._close, obj.file),
+            ),
+            "content_length": size,
+            **_metadata(obj),
+        }
+        if offset == 0 and not length and config.OBJECT_STORAGE_WORKERS == 1:
+            # Sent with sendfile when possible. Another worker could remove the
+            # file before it is opened again by path, so then only the fd is used
+            result["path"] = self._path(obj.file)
+        return result
+
+    async def _open(self, bucket_name: str, filename: str):
+        # A file can be replaced and removed between the lookup and the open,
+        # in which case the key now points at its successor
+        for _ in range(3):
+            obj = await self._run(self.index.get, bucket_name, filename)
+            if obj is None:
+                return None, None
+            self._readers[obj.file] += 1
+            try:
+                return obj, await self._run(os.open, self._path(obj.file), os.O_RDONLY)
+            except FileNotFoundError:
+                self._close(obj.file)
+        return None, None
+
+    def _close(self, file: str, fd: int = None):
+        if fd is not None:
+            os.close(fd)
+        self._readers[file] -= 1
+        if not self._readers[file]:
+            del self._readers[file]
+            if file in self._garbage:
+                self._garbage.discard(file)
+                self.executor.submit(_unlink, self._path(file))
+
+    def _discard(self, file: str):
+        if not file:
+            return
+        if self._readers[file]:
+            self._garbage.add(file)  # Removed by the last reader to close it
+        else:
+            self.executor.submit(_unlink, self._path(file))
+
+    def _path(self, file: str):
+        return os.path.join(self.root, file)
+
+    async def stat_file(self, bucket_name: str, filename: str):
+        obj = await self._run(self.index.get, bucket_name, filename)
+        if obj is None:
+            return {"error": "Error getting file info: NoSuchKey"}
+        return {"size": obj.size, **_metadata(obj)}
+
+    async def delete_file(self, bucket_name: str, filename: str):
+        if not await self._run(self.index.bucket_exists, bucket_name):
+            return {"error": "Error deleting file: NoSuchBucket"}
+        for file in await self._run(self.index.delete, bucket_name, [filename]):
+            self._discard(file)
+        return {"message": "File deleted successfully"}
+
+    async def _delete_batch(self, bucket_name: str, keys: list):
+        # One transaction per batch instead of one per key
+        if not await self._run(self.index.bucket_exists, bucket_name):
+            return [{"name": key, "error": "NoSuchBucket"} for key in keys]
+        for file in await self._run(self.index.delete, bucket_name, keys):
+            self._discard(file)
+        return [{"name": key, "deleted": True} for key in keys]
+
+    async def copy_file(
+        self, bucket_name: str, filename: str, dest_bucket: str, dest_filename: str
+    ):
+        error = _check_key(dest_filename)
+        if error is None and not await self._run(self.index.bucket_exists, dest_bucket):
+            error = f"Bucket '{dest_bucket}' does not exist"
+        if error is not None:
+            return {"error": f"Error copying file: {error}"}
+        obj, fd = await self._open(bucket_name, filename)
+        if obj is None:
+            return {"error": "Error copying file: NoSuchKey"}
+        try:
+            copy = await self._run(self._link, dest_bucket, obj, fd)
+        except OSError as e:
+            return {"error": f"Error copying file: {str(e)}"}
+        finally:
+            self._close(obj.file, fd)
+        try:
+            replaced = await self._run(self.index.put, dest_bucket, dest_filename, copy)
+        except sqlite3.Error as e:
+            self._discard(copy.file)
+            return {"error": f"Error copying file: {str(e)}"}
+        self._discard(replaced)
+        return {"message": "File copied successfully", "etag": copy.etag}
+
+    def _link(self, bucket_name: str, obj, fd: int):
+        """Blocking. Files are never modified once written, so a copy can
+        share the source's data through a hard link"""
+        name = uuid.uuid4().hex
+        file = os.path.join(bucket_name, name[:2], name)
+        os.makedirs(os.path.dirname(self._path(file)), exist_ok=True)
+        try:
+            os.link(self._path(obj.file), self._path(file))
+        except OSError:  # e.g. a filesystem without hard links
+            with os.fdopen(os.dup(fd), "rb") as source:
+                return self._store(bucket_name, source, obj.content_type)
+        return obj._replace(file=file, modified=_now())
+
+    async def create_bucket(self, bucket_name: str):
+        if not BUCKET_NAME.match(bucket_name):
+            return {
+                "error": f"Error creating bucket: Invalid bucket name '{bucket_name}'"
+            }
+        if not await self._run(self.index.add_bucket, bucket_name):
+            return {"message": f"Bucket '{bucket_name}' already exists"}
+        return {"message": f"Bucket '{bucket_name}' created successfully"}
+
+    def stats(self):
+        stats = super().stats()
+        stats["filesystem"] = {
+            "open_files": sum(self._readers.values()),
+            "pending_removals": len(self._garbage),
+        }
+        return stats
+
+
+def _check_key(key: str):
+    if not key:
+        return "Object key is empty"
+    if len(key.encode()) > MAX_KEY_BYTES:
+        return f"Object key is longer than {MAX_KEY_BYTES} bytes"
+    return None
+
+
+def _metadata(obj):
+    return {
+        "content_type": obj.content_type,
+        "etag": obj.etag,
+        "last_modified": format_datetime(
+            datetime.fromisoformat(obj.modified), usegmt=True
+        ),
+    }
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _unlink(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,117 @@
+from email.utils import parsedate_to_datetime
+
+MAX_RANGES = 32  # More ranges than this is treated as abuse and served in full
+
+
+def parse_range_header(header: str, size: int):
+    """Parse a `Range: bytes=...` header against an object of `size` bytes.
+
+    Returns a sorted list of inclusive (start, end) pairs with overlapping
+    ranges merged, an empty list when no range is satisfiable (416), or None
+    when the header should be ignored and the whole object served (200).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        first, sep, last = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if not first:  # Suffix range: the last N bytes
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+        except ValueError:
+            return None
+        if start >= size:
+            continue  # Unsatisfiable on its own, the others may still be served
+        ranges.append((start, min(end, size - 1)))
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def _etag_value(etag: str):
+    return etag.strip().removeprefix("W/").strip('"')
+
+
+def encoded_etag(etag: str, encoding: str):
+    """The ETag of an object's bytes sent in a content coding, which RFC 9110
+    requires to differ from the ETag of its decoded bytes"""
+    return f'"{_etag_value(etag)}-{encoding}"'
+
+
+def etag_matches(header: str, etag: str):
+    """Weak comparison of an If-None-Match / If-Range value against an ETag"""
+    if header.strip() == "*":
+        return True
+    return _etag_value(etag) in {_etag_value(tag) for tag in header.split(",")}
+
+
+def _parse_http_date(value: str):
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_not_modified(stat: dict, if_none_match: str = None, if_modified_since=None):
+    """Whether a conditional GET can be answered with 304 Not Modified"""
+    if if_none_match:  # Takes precedence over If-Modified-Since (RFC 9110)
+        return bool(stat.get("etag")) and etag_matches(if_none_match, stat["etag"])
+    if if_modified_since and stat.get("last_modified"):
+        since = _parse_http_date(if_modified_since)
+        modified = _parse_http_date(stat["last_modified"])
+        return since is not None and modified is not None and modified <= since
+    return False
+
+
+def range_still_valid(stat: dict, if_range: str):
+    """Whether an If-Range validator still matches, so the Range applies"""
+    if_range = if_range.strip()
+    if if_range.startswith("W/"):
+        return False  # If-Range requires a strong validator
+    if if_range.startswith('"'):
+        return bool(stat.get("etag")) and etag_matches(if_range, stat["etag"])
+    modified = _parse_http_date(stat.get("last_modified"))
+    return modified is not None and modified == _parse_http_date(if_range)
+
+
+def accepts_encoding(header: str, encoding: str):
+    """Whether an Accept-Encoding header allows `encoding` (RFC 9110 12.5.3)"""
+    if not header:
+        return False
+    wildcard = None
+    for item in header.split(","):
+        token, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        token = token.strip().lower()
+        if token == encoding:
+            return quality > 0
+        if token == "*":
+            wildcard = quality > 0
+    return bool(wildcard)
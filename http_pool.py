@@ -0,0 +1,117 @@
+import os
+import socket
+import threading
+import time
+
+import certifi
+import urllib3
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import Retry, Timeout
+
+
+class PoolStats:
+    """Connection checkout counters shared by every pool of one PoolManager.
+
+    Updated from executor threads, unlike the metrics registry, hence the lock.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.overflows = 0  # Checkouts beyond max_size, closed again when returned
+        self.connections_created = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def checked_out(self, waited: float):
+        with self._lock:
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.checkouts += 1
+            self.overflows += self.in_use > self.max_size
+            self.wait_seconds += waited
+
+    def returned(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def created(self):
+        with self._lock:
+            self.connections_created += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "checkouts": self.checkouts,
+                "overflows": self.overflows,
+                "connections_created": self.connections_created,
+                "wait_seconds": round(self.wait_seconds, 6),
+            }
+
+
+class _InstrumentedPoolMixin:
+    stats: PoolStats = None
+
+    def _get_conn(self, timeout=None):
+        start = time.perf_counter()
+        conn = super()._get_conn(timeout)
+        self.stats.checked_out(time.perf_counter() - start)
+        return conn
+
+    def _put_conn(self, conn):
+        self.stats.returned()
+        super()._put_conn(conn)
+
+    def _new_conn(self):
+        self.stats.created()
+        return super()._new_conn()
+
+
+def make_pool_manager(config):
+    """A PoolManager sized and tuned from `config`, plus the stats it reports to.
+
+    Minio's own default is 10 connections per host, far fewer than the
+    executor threads and in-flight streamed downloads that share it.
+    """
+    stats = PoolStats(config.OBJECT_STORAGE_POOL_SIZE)
+    socket_options = list(HTTPConnection.default_socket_options)  # TCP_NODELAY
+    if config.OBJECT_STORAGE_TCP_KEEPALIVE:
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+
+    manager = urllib3.PoolManager(
+        maxsize=config.OBJECT_STORAGE_POOL_SIZE,
+        block=config.OBJECT_STORAGE_POOL_BLOCK,
+        timeout=Timeout(
+            connect=config.OBJECT_STORAGE_CONNECT_TIMEOUT,
+            read=config.OBJECT_STORAGE_READ_TIMEOUT,
+        ),
+        retries=Retry(
+            total=config.OBJECT_STORAGE_MAX_RETRIES,
+            backoff_factor=config.OBJECT_STORAGE_RETRY_BACKOFF,
+            backoff_jitter=config.OBJECT_STORAGE_RETRY_BACKOFF,
+            # 503 means slow down, which is left to the backpressure in _call
+            status_forcelist=[500, 502, 504],
+        ),
+        socket_options=socket_options,
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+    )
+    manager.pool_classes_by_scheme = {
+        "http": type(
+            "InstrumentedHTTPConnectionPool",
+            (_InstrumentedPoolMixin, HTTPConnectionPool),
+            {"stats": stats},
+        ),
+        "https": type(
+            "InstrumentedHTTPSConnectionPool",
+            (_InstrumentedPoolMixin, HTTPSConnectionPool),
+            {"stats": stats},
+        ),
+    }
+    return manager, stats
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import socket
+
+MAX_MESSAGE = 32 * 1024  # Bytes of keys packed into one datagram
+FLUSH = b"*"  # Expire everything, for peers that missed messages
+FLUSH_RETRY_DELAY = 0.05  # Seconds before a full peer is tried again
+
+_channel = None
+
+
+class InvalidationChannel:
+    """Tells the other worker processes on this host which cached keys a write
+    made stale, over Unix datagram sockets in a shared directory.
+
+    Each process binds one socket there, named after its pid, and publishing
+    sends to every other socket in the directory. Keys published during one
+    event loop iteration go out together. A peer whose socket buffer is full
+    is owed a flush, sent once it has room, which expires everything it
+    cached instead of the keys it missed.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = None
+        self._socket = None
+        self._handlers = {}  # scope -> callback(bucket_name, filename)
+        self._outbox = []
+        self._owed = set()  # Peers that missed messages
+        self._retry = None
+        self.sent = 0
+        self.received = 0
+        self.flushes_sent = 0
+
+    def subscribe(self, scope: str, callback):
+        """Have `callback(bucket_name, filename)` called for keys published
+        under `scope` by other processes; filename is None for the bucket's
+        existence, and both are None when everything has to go"""
+        self._handlers[scope] = callback
+
+    def start(self):
+        """Bind this process's socket and receive on the running event loop"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}.sock")
+        _unlink(self.path)  # Left by an earlier process with the same pid
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._socket.bind(self.path)
+        asyncio.get_running_loop().add_reader(self._socket.fileno(), self._receive)
+
+    def stop(self):
+        if self._socket is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+        if self._retry is not None:
+            self._retry.cancel()
+            self._retry = None
+        _unlink(self.path)
+
+    def publish(self, scope: str, bucket_name: str, filename: str = None):
+        if self._socket is None:
+            return
+        if not self._outbox:
+            asyncio.get_running_loop().call_soon(self._send)
+        self._outbox.append(json.dumps([scope, bucket_name, filename]).encode())
+
+    def _send(self):
+        messages = _pack(self._outbox)
+        self._outbox = []
+        if self._socket is None:
+            return
+        for peer in self._peers():
+            if peer in self._owed:
+                continue  # The flush it is owed covers these
+            for message in messages:
+                if not self._send_to(peer, message):
+                    break
+
+    def _send_to(self, peer: str, message: bytes):
+        try:
+            self._socket.sendto(message, peer)
+        except BlockingIOError:
+            self._owed.add(peer)
+            if self._retry is None:
+                self._retry = asyncio.get_running_loop().call_later(
+                    FLUSH_RETRY_DELAY, self._send_flushes
+                )
+            return False
+        except (ConnectionRefusedError, FileNotFoundError):
+            _unlink(peer)  # That process is gone
+            self._owed.discard(peer)
+            return False
+        self.sent += 1
+        return True
+
+    def _send_flushes(self):
+        self._retry = None
+        for peer in list(self._owed):
+            self._owed.discard(peer)
+            if self._send_to(peer, FLUSH):
+                self.flushes_sent += 1
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._socket.recv(2 * MAX_MESSAGE)
+            except BlockingIOError:
+                return
+            self.received += 1
+            if message == FLUSH:
+                for callback in self._handlers.values():
+                    callback(None, None)
+                continue
+            for line in message.splitlines():
+                scope, bucket_name, filename = json.loads(line)
+                callback = self._handlers.get(scope)
+                if callback is not None:
+                    callback(bucket_name, filename)
+
+    def _peers(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in names
+            if name.endswith(".sock")
+            and os.path.join(self.directory, name) != self.path
+        ]
+
+    def stats(self):
+        return {
+            "peers": len(self._peers()) if self._socket is not None else 0,
+            "sent": self.sent,
+            "received": self.received,
+            "flushes_sent": self.flushes_sent,
+        }
+
+
+def get_channel(config):
+    """This process's channel, or None when it is the only worker"""
+    global _channel
+    if _channel is None and config.OBJECT_STORAGE_WORKERS > 1:
+        _channel = InvalidationChannel(config.OBJECT_STORAGE_WORKER_SOCKET_DIR)
+    return _channel
+
+
+def caches_unshared(config):
+    """Whether this process caches as if it were the only worker while it
+    looks like one of several, e.g. started by `uvicorn --workers N` without
+    OBJECT_STORAGE_WORKERS or WEB_CONCURRENCY, so writes elsewhere go unseen"""
+    caching = (
+        config.OBJECT_STORAGE_METADATA_TTL > 0
+        or config.OBJECT_STORAGE_CACHE_MAX_BYTES > 0
+        or config.OBJECT_STORAGE_DISK_CACHE_DIR
+    )
+    # Workers are started by a supervisor, whose process group they join
+    supervised = os.getpgrp() != os.getpid()
+    return bool(caching) and config.OBJECT_STORAGE_WORKERS == 1 and supervised
+
+
+def _pack(lines: list):
+    messages, message = [], b""
+    for line in lines:
+        if message and len(message) + len(line) >= MAX_MESSAGE:
+            messages.append(message)
+            message = b""
+        message += line + b"\n"
+    if message:
+        messages.append(message)
+    return messages
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,207 @@
+import time
+from bisect import bisect_left
+
+# Seconds; spans cache hits through multi-second uploads
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def _samples(self):
+        for labels, value in self._values.items():
+            yield self.name, self._labels(labels), value
+
+    def _labels(self, values, extra=()):
+        pairs = [*zip(self.labelnames, values), *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        # Per-bucket counts are kept apart and only made cumulative on scrape,
+        # so an observation is one bisect and three additions
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def get(self, *labels):
+        series = self._values.get(labels)
+        return series[2] if series else 0
+
+    def _samples(self):
+        bounds = [*(repr(float(b)) for b in self.buckets), "+Inf"]
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                yield (
+                    f"{self.name}_bucket",
+                    self._labels(labels, [("le", bound)]),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", self._labels(labels), total
+            yield f"{self.name}_count", self._labels(labels), count
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Recording is a dict lookup and an addition with no locking, so metrics
+    must only be updated from the event loop, like the caches.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), **kwargs):
+        return self._register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, stats: dict = None):
+        """Exposition text for every metric, plus numeric `stats` sections as gauges"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric._samples():
+                lines.append(f"{name}{labels} {value}")
+        for section, values in (stats or {}).items():
+            if not isinstance(values, dict):
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"object_storage_{section}_{key}"
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "object_storage_http_requests_total",
+    "HTTP requests handled, by route and status",
+    ("method", "route", "status"),
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "object_storage_http_request_duration_seconds",
+    "Time from request start until the last response byte is sent",
+    ("method", "route"),
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "object_storage_http_requests_in_flight", "HTTP requests currently being handled"
+)
+HTTP_BYTES = REGISTRY.counter(
+    "object_storage_http_bytes_total",
+    "Request and response body bytes, by route",
+    ("route", "direction"),
+)
+BACKEND_LATENCY = REGISTRY.histogram(
+    "object_storage_backend_operation_duration_seconds",
+    "Latency of calls to the storage backend, by operation",
+    ("operation",),
+)
+BACKEND_IN_FLIGHT = REGISTRY.gauge(
+    "object_storage_backend_operations_in_flight",
+    "Backend calls currently running or queued for a worker thread",
+)
+BACKEND_ERRORS = REGISTRY.counter(
+    "object_storage_backend_errors_total",
+    "Failed backend calls, by operation and error code",
+    ("operation", "code"),
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording counts, latency and body bytes per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500  # Unless a response starts, the request failed
+        bytes_in = bytes_out = 0
+
+        async def counting_receive():
+            nonlocal bytes_in
+            message = await receive()
+            bytes_in += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, bytes_out
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                bytes_out += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The route template rather than the path, to keep label values bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(scope["method"], route, str(status))
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], route)
+            HTTP_BYTES.inc(route, "in", amount=bytes_in)
+            HTTP_BYTES.inc(route, "out", amount=bytes_out)
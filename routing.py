@@ -0,0 +1,501 @@
+import asyncio
+import functools
+import time
+
+from fastapi import UploadFile
+
+from config import config
+from storage_base import (
+    LIST_PAGE_SIZE,
+    StorageAPI,
+    StorageError,
+    decode_continuation_token,
+    encode_continuation_token,
+)
+
+LATENCY_SMOOTHING = 0.2  # Weight of the newest read in a backend's latency average
+
+
+class Backend:
+    """A storage API plus the health and latency its reads are ranked by"""
+
+    def __init__(self, name: str, api: StorageAPI, cooldown: float):
+        self.name = name
+        self.api = api
+        self.cooldown = cooldown
+        self.latency = None  # Seconds, moving average over successful reads
+        self.down_until = 0.0
+        self.reads = 0
+        self.failures = 0
+
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+    def succeeded(self, seconds: float):
+        self.reads += 1
+        self.down_until = 0.0
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    def failed(self):
+        self.failures += 1
+        self.down_until = time.monotonic() + self.cooldown
+
+    def stats(self):
+        return {
+            "healthy": self.healthy(),
+            "latency_ms": round(self.latency * 1000, 3)
+            if self.latency is not None
+            else None,
+            "reads": self.reads,
+            "failures": self.failures,
+            **self.api.stats(),
+        }
+
+
+class Route:
+    def __init__(self, bucket: str, prefix: str, backends: list):
+        self.bucket = bucket  # "*" matches every bucket
+        self.prefix = prefix
+        self.backends = backends  # Primary first, then its replicas
+
+    @property
+    def primary(self):
+        return self.backends[0]
+
+    @property
+    def replicas(self):
+        return self.backends[1:]
+
+    @property
+    def specificity(self):
+        return self.bucket != "*", len(self.prefix)
+
+    def matches(self, bucket_name: str, key: str):
+        return self.bucket in ("*", bucket_name) and key.startswith(self.prefix)
+
+    def read_order(self):
+        # Healthy backends fastest first, unmeasured ones up front so they get
+        # measured; backends in their cooldown are only tried as a last resort
+        return sorted(
+            self.backends,
+            key=lambda backend: (not backend.healthy(), backend.latency or 0),
+        )
+
+
+def parse_routes(specs: list, backends: dict):
+    """Routes from "bucket[/prefix]=primary[+replica...]" specs.
+
+    Keys no spec matches fall through to the "default" backend.
+    """
+    routes = []
+    for spec in specs:
+        path, sep, targets = spec.partition("=")
+        bucket, _, prefix = path.strip().partition("/")
+        names = [name.strip().lower() for name in targets.split("+")]
+        if not sep or not bucket or not all(names):
+            raise ValueError(f"Invalid route: {spec}")
+        unknown = [name for name in names if name not in backends]
+        if unknown:
+            raise ValueError(
+                f"Route {spec} uses unknown backends: {', '.join(unknown)}"
+            )
+        routes.append(Route(bucket, prefix, [backends[name] for name in names]))
+    if not any(route.bucket == "*" and not route.prefix for route in routes):
+        routes.append(Route("*", "", [backends["default"]]))
+    return routes
+
+
+class RoutingStorageAPI(StorageAPI):
+    """Spreads buckets and key prefixes over several backends.
+
+    Writes go to the primary of the most specific matching route and are
+    copied to its replicas in the background, so replicas are eventually
+    consistent. Reads go to the fastest healthy backend of the route and fall
+    over to the next one on errors. Uploads made directly through presigned
+    PUT URLs never pass through here and aren't replicated.
+    """
+
+    def __init__(self, backends: dict, routes: list):
+        super().__init__()
+        self.backends = {
+            name: Backend(name, api, config.OBJECT_STORAGE_FAILOVER_COOLDOWN)
+            for name, api in backends.items()
+        }
+        self.routes = parse_routes(routes, self.backends)
+        self.failovers = 0
+        self.replicated = 0
+        self.replication_errors = 0
+        self._replication_slots = asyncio.Semaphore(
+            config.OBJECT_STORAGE_REPLICATION_CONCURRENCY
+        )
+        self._replication_tasks = set()
+        self._last_replication = {}  # (replica, bucket, key) -> task, to keep order
+
+    def _route(self, bucket_name: str, key: str = ""):
+        return max(
+            (route for route in self.routes if route.matches(bucket_name, key)),
+            key=lambda route: route.specificity,
+        )
+
+    async def _read(self, route: Route, method: str, *args, **kwargs):
+        error = exception = None
+        for backend in route.read_order():
+            if error is not None or exception is not None:
+                self.failovers += 1
+            start = time.perf_counter()
+            try:
+                result = await getattr(backend.api, method)(*args, **kwargs)
+            except StorageError:
+                # Overloaded, e.g. throttled: the backend is up, and failing
+                # over would only move its load onto the other copies
+                raise
+            except Exception as e:  # Unreachable or failing, try the next copy
+                backend.failed()
+                exception = e
+                continue
+            if "error" not in result:
+                backend.succeeded(time.perf_counter() - start)
+                return result
+            # A replica may not have caught up with the primary yet
+            error = error or result
+        if error is not None:
+            return error
+        raise exception
+
+    def stats(self):
+        return {
+            **super().stats(),
+            "routing": {
+                "failovers": self.failovers,
+                "replication_pending": len(self._replication_tasks),
+                "replicated": self.replicated,
+                "replication_errors": self.replication_errors,
+            },
+            "backends": {
+                name: backend.stats() for name, backend in self.backends.items()
+            },
+        }
+
+    def _replicate(self, route: Route, bucket_name: str, filename: str, delete=False):
+        for replica in route.replicas:
+            key = (replica.name, bucket_name, filename)
+            task = asyncio.create_task(
+                self._replicate_one(
+                    route.primary,
+                    replica,
+                    bucket_name,
+                    filename,
+                    delete,
+                    self._last_replication.get(key),
+                )
+            )
+            self._last_replication[key] = task
+            self._track(task)
+            task.add_done_callback(functools.partial(self._forget, key))
+
+    def _forget(self, key, task):
+        if self._last_replication.get(key) is task:
+            del self._last_replication[key]
+
+    def _track(self, task):
+        self._replication_tasks.add(task)
+        task.add_done_callback(self._replication_tasks.discard)
+
+    async def _replicate_one(
+        self, primary, replica, bucket_name, filename, delete, previous
+    ):
+        if previous is not None:
+            await asyncio.wait([previous])  # Writes to one key land in order
+        async with self._replication_slots:
+            try:
+                if delete:
+                    result = await replica.api.delete_file(bucket_name, filename)
+                else:
+                    # Read back from the primary, so the latest version is copied
+                    result = await self._transfer(
+                        primary.api,
+                        bucket_name,
+                        filename,
+                        replica.api,
+                        bucket_name,
+                        filename,
+                    )
+            except Exception as e:
+                result = {"error": str(e)}
+        self._count_replication(result)
+
+    async def _replicate_deletes(self, route: Route, bucket_name: str, keys: list):
+        async with self._replication_slots:
+            for replica in route.replicas:
+                try:
+                    for result in await replica.api._delete_batch(bucket_name, keys):
+                        self._count_replication(result)
+                except Exception as e:
+                    self._count_replication({"error": str(e)})
+
+    def _count_replication(self, result: dict):
+        if "error" in result:
+            self.replication_errors += 1
+        else:
+            self.replicated += 1
+
+    async def wait_for_replication(self):
+        """Wait until the replication queued so far has finished"""
+        while self._replication_tasks:
+            await asyncio.wait(list(self._replication_tasks))
+
+    def _routes_under(self, bucket_name: str, prefix: str):
+        """One route per primary that may hold keys under `prefix`"""
+        route = self._route(bucket_name, prefix)
+        routes = {route.primary.name: route}
+        for other in self.routes:
+            if (
+                other.bucket in ("*", bucket_name)
+                and other.prefix.startswith(prefix)
+                and other.specificity > route.specificity
+            ):
+                routes.setdefault(other.primary.name, other)
+        return list(routes.values())
+
+    async def list_files(
+        self,
+        bucket_name: str,
+        prefix: str = None,
+        recursive: bool = False,
+        max_keys: int = LIST_PAGE_SIZE,
+        continuation_token: str = None,
+        sizes: bool = False,
+    ):
+        routes = self._routes_under(bucket_name, prefix or "")
+        pages = await asyncio.gather(
+            *(
+                self._read(
+                    route,
+                    "list_files",
+                    bucket_name,
+                    prefix,
+                    recursive,
+                    max_keys,
+                    continuation_token,
+                    sizes,
+                )
+                for route in routes
+            )
+        )
+        for page in pages:
+            if "error" in page:
+                return page
+        if len(pages) == 1:
+            return pages[0]
+        return self._merge_pages(bucket_name, routes, pages, max_keys)
+
+    def _merge_pages(self, bucket_name, routes, pages, max_keys):
+        files, prefixes = {}, set()
+        end = None  # Past the end of a truncated page, its backend's keys are unknown
+        for route, page in zip(routes, pages):
+            for file in page["files"]:
+                # Skip stale keys a backend holds under a prefix routed elsewhere
+                if self._route(bucket_name, file["name"]).primary is route.primary:
+                    files[file["name"]] = file
+            prefixes.update(page["prefixes"])
+            if page["is_truncated"]:
+                last = decode_continuation_token(page["next_continuation_token"])
+                end = last if end is None else min(end, last)
+
+        entries = sorted(
+            [(name, False) for name in files] + [(p, True) for p in prefixes]
+        )
+        if end is not None:
+            entries = [entry for entry in entries if entry[0] <= end]
+        is_truncated = end is not None or len(entries) > max_keys
+        entries = entries[:max_keys]
+        if not is_truncated:
+            next_token = None
+        elif entries:
+            next_token = encode_continuation_token(*entries[-1])
+        else:
+            next_token = encode_continuation_token(end)
+        return {
+            "bucket": bucket_name,
+            "files": [files[name] for name, is_dir in entries if not is_dir],
+            "prefixes": [name for name, is_dir in entries if is_dir],
+            "is_truncated": is_truncated,
+            "next_continuation_token": next_token,
+        }
+
+    async def upload_file(self, bucket_name: str, file: UploadFile):
+        route = self._route(bucket_name, file.filename)
+        result = await route.primary.api.upload_file(bucket_name, file)
+        if "error" not in result:
+            self._replicate(route, bucket_name, file.filename)
+        return result
+
+    async def upload_by_hash(
+        self, bucket_name: str, filename: str, sha256: str, content_type: str = None
+    ):
+        route = self._route(bucket_name, filename)
+        result = await route.primary.api.upload_by_hash(
+            bucket_name, filename, sha256, content_type
+        )
+        if result.get("deduplicated"):
+            self._replicate(route, bucket_name, filename)
+        return result
+
+    async def download_file(
+        self,
+        bucket_name: str,
+        filename: str,
+        offset: int = 0,
+        length: int = None,
+        accept_encoding: str = None,
+    ):
+        return await self._read(
+            self._route(bucket_name, filename),
+            "download_file",
+            bucket_name,
+            filename,
+            offset=offset,
+            length=length,
+            accept_encoding=accept_encoding,
+        )
+
+    async def warm(self, bucket_name: str, filename: str = None, size: int = None):
+        # The backend reads would go to right now
+        backend = self._route(bucket_name, filename or "").read_order()[0]
+        return await backend.api.warm(bucket_name, filename, size)
+
+    async def stat_file(self, bucket_name: str, filename: str):
+        return await self._read(
+            self._route(bucket_name, filename), "stat_file", bucket_name, filename
+        )
+
+    async def delete_file(self, bucket_name: str, filename: str):
+        route = self._route(bucket_name, filename)
+        result = await route.primary.api.delete_file(bucket_name, filename)
+        if "error" not in result:
+            self._replicate(route, bucket_name, filename, delete=True)
+        return result
+
+    async def _delete_batch(self, bucket_name: str, keys: list):
+        groups = {}
+        for key in keys:
+            route = self._route(bucket_name, key)
+            groups.setdefault(route, []).append(key)
+        routes = list(groups)
+        batches = await asyncio.gather(
+            *(
+                route.primary.api._delete_batch(bucket_name, groups[route])
+                for route in routes
+            )
+        )
+        results = []
+        for route, batch in zip(routes, batches):
+            results.extend(batch)
+            deleted = [result["name"] for result in batch if result.get("deleted")]
+            if route.replicas and deleted:
+                self._track(
+                    asyncio.create_task(
+                        self._replicate_deletes(route, bucket_name, deleted)
+                    )
+                )
+        return results
+
+    async def copy_file(
+        self, bucket_name: str, filename: str, dest_bucket: str, dest_filename: str
+    ):
+        source = self._route(bucket_name, filename).primary
+        route = self._route(dest_bucket, dest_filename)
+        if source is route.primary:
+            result = await source.api.copy_file(
+                bucket_name, filename, dest_bucket, dest_filename
+            )
+        else:  # Across backends the bytes have to pass through this process
+            result = await self._transfer(
+                source.api,
+                bucket_name,
+                filename,
+                route.primary.api,
+                dest_bucket,
+                dest_filename,
+            )
+            if "error" not in result:
+                result = {"message": "File copied successfully"}
+        if "error" not in result:
+            self._replicate(route, dest_bucket, dest_filename)
+        return result
+
+    async def create_bucket(self, bucket_name: str):
+        # Every backend a key of the bucket may be written to needs the bucket
+        routes = [route for route in self.routes if route.bucket == bucket_name]
+        if not any(not route.prefix for route in routes):
+            routes += [route for route in self.routes if route.bucket == "*"]
+        backends = {
+            backend.name: backend for route in routes for backend in route.backends
+        }
+        results = await asyncio.gather(
+            *(backend.api.create_bucket(bucket_name) for backend in backends.values())
+        )
+        results = dict(zip(backends, results))
+        for name, result in results.items():
+            if "error" in result:
+                return {"error": f"{result['error']} (backend '{name}')"}
+        return results[self._route(bucket_name).primary.name]
+
+    async def presign_url(
+        self, bucket_name: str, filename: str, method="GET", expires: int = None
+    ):
+        route = self._route(bucket_name, filename)
+        backend = route.read_order()[0] if method == "GET" else route.primary
+        return await backend.api.presign_url(bucket_name, filename, method, expires)
+
+    async def create_multipart_upload(
+        self,
+        bucket_name: str,
+        filename: str,
+        parts: int,
+        content_type: str = None,
+        expires: int = None,
+    ):
+        return await self._route(
+            bucket_name, filename
+        ).primary.api.create_multipart_upload(
+            bucket_name, filename, parts, content_type, expires
+        )
+
+    async def complete_multipart_upload(
+        self, bucket_name: str, filename: str, upload_id: str, parts: list
+    ):
+        route = self._route(bucket_name, filename)
+        result = await route.primary.api.complete_multipart_upload(
+            bucket_name, filename, upload_id, parts
+        )
+        if "error" not in result:
+            self._replicate(route, bucket_name, filename)
+        return result
+
+    async def abort_multipart_upload(
+        self, bucket_name: str, filename: str, upload_id: str
+    ):
+        return await self._route(
+            bucket_name, filename
+        ).primary.api.abort_multipart_upload(bucket_name, filename, upload_id)
+
+    async def _create_upload(self, bucket_name, filename, content_type):
+        return await self._route(bucket_name, filename).primary.api._create_upload(
+            bucket_name, filename, content_type
+        )
+
+    async def _upload_part(
+        self, bucket_name, filename, upload_id, part_number, data, content_md5
+    ):
+        return await self._route(bucket_name, filename).primary.api._upload_part(
+            bucket_name, filename, upload_id, part_number, data, content_md5
+        )
+
+    async def _list_parts(self, bucket_name, filename, upload_id):
+        return await self._route(bucket_name, filename).primary.api._list_parts(
+            bucket_name, filename, upload_id
+        )
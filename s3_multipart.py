@@ -0,0 +1,99 @@
+from minio import Minio
+from minio.commonconfig import CopySource
+from minio.datatypes import Part, parse_copy_object
+from minio.helpers import normalize_headers
+
+# minio only implements multipart upload requests, and copies without a HEAD
+# of the source first, as private methods of Minio, which may change in any
+# release. Every call goes through here, so there's one place to update, and
+# tests/test_s3_multipart.py checks them against the installed minio;
+# pyproject.toml caps minio at the releases tested.
+
+
+def create(
+    client: Minio,
+    bucket_name: str,
+    object_name: str,
+    content_type=None,
+    metadata: dict = None,
+):
+    """Start a multipart upload, returning its upload ID"""
+    headers = {"Content-Type": content_type or "application/octet-stream"}
+    headers.update(normalize_headers(metadata))
+    return client._create_multipart_upload(bucket_name, object_name, headers)
+
+
+def upload_part(
+    client: Minio,
+    bucket_name: str,
+    object_name: str,
+    upload_id: str,
+    part_number: int,
+    data: bytes,
+    content_md5: str = None,
+):
+    """Send one part, returning its ETag"""
+    headers = {"Content-MD5": content_md5} if content_md5 else None
+    return client._upload_part(
+        bucket_name, object_name, data, headers, upload_id, part_number
+    )
+
+
+def upload_part_copy(
+    client: Minio,
+    bucket_name: str,
+    object_name: str,
+    upload_id: str,
+    part_number: int,
+    source: CopySource,
+    start: int,
+    end: int,
+):
+    """Copy bytes `start` to `end` inclusive of the source as one part,
+    returning its ETag"""
+    headers = source.gen_copy_headers()
+    headers["x-amz-copy-source-range"] = f"bytes={start}-{end}"
+    etag, _ = client._upload_part_copy(
+        bucket_name, object_name, upload_id, part_number, headers
+    )
+    return etag
+
+
+def copy(client: Minio, bucket_name: str, object_name: str, source: CopySource):
+    """Copy a source of up to 5 GiB in one CopyObject request, returning the
+    ETag. Minio.copy_object stats the source first to pick between this and a
+    multipart copy, which the caller has already done"""
+    response = client._execute(
+        "PUT", bucket_name, object_name, headers=source.gen_copy_headers()
+    )
+    etag, _ = parse_copy_object(response)
+    return etag
+
+
+def list_parts(
+    client: Minio, bucket_name: str, object_name: str, upload_id: str, marker=None
+):
+    """One page of the parts received, after part number `marker`: the parts
+    and the marker of the next page, None on the last one"""
+    result = client._list_parts(
+        bucket_name, object_name, upload_id, part_number_marker=marker
+    )
+    return result.parts, result.next_part_number_marker if result.is_truncated else None
+
+
+def complete(
+    client: Minio, bucket_name: str, object_name: str, upload_id: str, parts: list
+):
+    """Assemble the object from (part number, ETag) pairs in any order,
+    returning its ETag"""
+    result = client._complete_multipart_upload(
+        bucket_name,
+        object_name,
+        upload_id,
+        [Part(number, etag.strip('"')) for number, etag in sorted(parts)],
+    )
+    return result.etag
+
+
+def abort(client: Minio, bucket_name: str, object_name: str, upload_id: str):
+    client._abort_multipart_upload(bucket_name, object_name, upload_id)
@@ -1,10 +1,98 @@
-from fastapi import FastAPI, File, HTTPException, Response, UploadFile
+import asyncio
+import json
+import logging
+import secrets
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from fastapi import (
+    FastAPI,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
 from config import config
+from http_headers import (
+    accepts_encoding,
+    encoded_etag,
+    is_not_modified,
+    parse_range_header,
+    range_still_valid,
+)
+from invalidation import caches_unshared, get_channel
+from metrics import REGISTRY, MetricsMiddleware
+from storage_base import LIST_PAGE_SIZE, MAX_UPLOAD_PARTS, Overloaded
 from storage_factory import get_storage_api
+from warmup import ReadAhead, read_access_log, read_manifest, warm_up
+
+logger = logging.getLogger(__name__)
+
+
+async def _reap_uploads():
+    while True:
+        await asyncio.sleep(config.OBJECT_STORAGE_UPLOAD_REAP_INTERVAL)
+        try:
+            await storage_api.reap_uploads()
+        except Exception:  # The backend may be down, try again next time
+            pass
+
+
+async def _warm_up():
+    targets = []
+    try:
+        if config.OBJECT_STORAGE_WARMUP_MANIFEST:
+            targets += read_manifest(config.OBJECT_STORAGE_WARMUP_MANIFEST)
+        if config.OBJECT_STORAGE_WARMUP_ACCESS_LOG:
+            targets += read_access_log(
+                config.OBJECT_STORAGE_WARMUP_ACCESS_LOG,
+                config.OBJECT_STORAGE_WARMUP_MAX_OBJECTS,
+            )
+    except OSError as e:  # Start cold rather than not at all, and say why in /stats
+        warm_up_stats["error"] = str(e)
+    if targets:
+        warm_up_stats.update(
+            await warm_up(
+                storage_api, targets, config.OBJECT_STORAGE_WARMUP_MAX_OBJECTS
+            )
+        )
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    peers = get_channel(config)  # Set when running with several workers
+    if peers is not None:
+        peers.start()
+    elif caches_unshared(config):
+        logger.warning(
+            "Caching with OBJECT_STORAGE_WORKERS=1 under a process supervisor: "
+            "if it runs several workers, set OBJECT_STORAGE_WORKERS or "
+            "WEB_CONCURRENCY to their count, or writes through one worker "
+            "won't invalidate the others' caches"
+        )
+    reaper = asyncio.create_task(_reap_uploads())
+    # Requests are only served once the caches are warm, or the timeout passed
+    warming = asyncio.create_task(_warm_up())
+    await asyncio.wait([warming], timeout=config.OBJECT_STORAGE_WARMUP_TIMEOUT)
+    try:
+        yield
+    finally:
+        reaper.cancel()
+        warming.cancel()
+        if read_ahead is not None:
+            read_ahead.cancel()
+        if peers is not None:
+            peers.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -14,9 +102,51 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    # Shed load instead of queueing without bound, clients come back later
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 
 # Initialize storage API
 storage_api = get_storage_api(config.OBJECT_STORAGE_SERVICE)
+warm_up_stats = {}
+read_ahead = (
+    ReadAhead(
+        storage_api,
+        config.OBJECT_STORAGE_READ_AHEAD_MAX_SIZE,
+        config.OBJECT_STORAGE_READ_AHEAD_CONCURRENCY,
+        config.OBJECT_STORAGE_READ_AHEAD_MAX_PENDING,
+    )
+    if config.OBJECT_STORAGE_READ_AHEAD
+    else None
+)
+
+
+class BatchRequest(BaseModel):
+    keys: list[str] | None = None  # Either explicit keys...
+    prefix: str | None = None  # ...or every key under a non-empty prefix
+
+
+class CopyRequest(BatchRequest):
+    to_bucket: str | None = None  # Defaults to the source bucket
+    to_prefix: str = ""  # Replaces `prefix` in the copied keys
+
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str  # As returned in the ETag header of the part's PUT
+
+
+class CompleteMultipartRequest(BaseModel):
+    parts: list[UploadedPart]
 
 
 @app.get("/health")
@@ -28,6 +158,29 @@ async def health_check():
     }
 
 
+def _stats():
+    stats = storage_api.stats()
+    if warm_up_stats:
+        stats["warm_up"] = warm_up_stats
+    if read_ahead is not None:
+        stats["read_ahead"] = read_ahead.stats()
+    return stats
+
+
+@app.get("/stats")
+async def stats():
+    return _stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    # Cache (and other) stats are sampled at scrape time from the backend
+    return Response(
+        REGISTRY.render(_stats()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.post("/create/{bucket_name}")
 async def create_bucket(bucket_name: str):
     result = await storage_api.create_bucket(bucket_name)
@@ -44,25 +197,251 @@ async def upload_file(bucket_name: str, file: UploadFile = File(...)):
     return result
 
 
+@app.post("/upload/{bucket_name}/by-hash/{filename:path}")
+async def upload_by_hash(
+    bucket_name: str, filename: str, sha256: str, content_type: str = None
+):
+    result = await storage_api.upload_by_hash(
+        bucket_name, filename, sha256.lower(), content_type
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    if not result["deduplicated"]:
+        raise HTTPException(
+            status_code=404, detail="No stored object has this content, upload it"
+        )
+    return result
+
+
+async def _ndjson_lines(entries):
+    async for entry in entries:
+        yield json.dumps(entry) + "\n"
+
+
+@app.post("/upload/{bucket_name}/batch")
+async def upload_files(
+    bucket_name: str,
+    files: list[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    prefix: str = "",
+):
+    if archive is not None:  # A zip or tar (optionally compressed) extracted on the fly
+        result = await storage_api.upload_archive(bucket_name, archive, prefix)
+    elif files:
+        result = await storage_api.upload_files(bucket_name, files, prefix)
+    else:
+        raise HTTPException(status_code=400, detail="Send files or an archive")
+    return result
+
+
 @app.get("/list/{bucket_name}")
-async def list_files(bucket_name: str):
-    result = await storage_api.list_files(bucket_name)
+async def list_files(
+    bucket_name: str,
+    prefix: str = None,
+    recursive: bool = False,
+    max_keys: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_PAGE_SIZE),
+    continuation_token: str = None,
+    stream: bool = False,
+    sizes: bool = False,
+):
+    if stream:  # NDJSON, one entry per line as backend pages arrive
+        result = await storage_api.stream_files(
+            bucket_name, prefix, recursive, continuation_token
+        )
+        if "error" in result:
+            raise HTTPException(status_code=400, detail=result["error"])
+        return StreamingResponse(
+            _ndjson_lines(result["entries"]), media_type="application/x-ndjson"
+        )
+
+    result = await storage_api.list_files(
+        bucket_name, prefix, recursive, max_keys, continuation_token, sizes
+    )
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
+    if read_ahead is not None:
+        read_ahead.schedule(bucket_name, result["files"])
     return result
 
 
-@app.get("/download/{bucket_name}/{filename}")
-async def download_file(bucket_name: str, filename: str):
-    result = await storage_api.download_file(bucket_name, filename)
-    if isinstance(result, dict) and "error" in result:
+class _LocalFileResponse(FileResponse):
+    """FileResponse that leaves Range handling to the route, which already did it"""
+
+    chunk_size = config.OBJECT_STORAGE_CHUNK_SIZE  # Starlette reads 64 KiB at a time
+
+    async def __call__(self, scope, receive, send):
+        headers = [
+            (name, value)
+            for name, value in scope["headers"]
+            if name not in (b"range", b"if-range")
+        ]
+        await super().__call__({**scope, "headers": headers}, receive, send)
+
+
+def _validator_headers(meta: dict):
+    headers = {"Accept-Ranges": "bytes"}
+    if meta.get("etag"):
+        headers["ETag"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["Last-Modified"] = meta["last_modified"]
+    return headers
+
+
+async def _stream_byteranges(bucket_name, filename, parts, boundary):
+    for (start, end), part_header in parts:
+        part = await storage_api.download_file(
+            bucket_name, filename, offset=start, length=end - start + 1
+        )
+        if "error" in part:  # Headers are already sent, so all we can do is stop
+            return
+        yield part_header
+        async for chunk in part["body"]:
+            yield chunk
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+@app.post("/download/{bucket_name}")
+async def download_files(
+    bucket_name: str,
+    request: BatchRequest,
+    archive_format: str = Query("zip", alias="format"),
+):
+    result = await storage_api.download_archive(
+        bucket_name, request.keys, request.prefix, archive_format
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    # Entries are written as object bytes arrive, never materialized in full
+    return StreamingResponse(
+        result["body"],
+        media_type=result["media_type"],
+        headers={
+            "Content-Disposition": f'attachment; filename="{bucket_name}.{archive_format}"'
+        },
+    )
+
+
+@app.get("/download/{bucket_name}/{filename:path}")
+async def download_file(bucket_name: str, filename: str, request: Request):
+    range_header = request.headers.get("range")
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+
+    ranges = None
+    if range_header or if_none_match or if_modified_since:
+        # Conditional and partial reads need the stat before touching the body
+        stat = await storage_api.stat_file(bucket_name, filename)
+        if "error" in stat:
+            raise HTTPException(status_code=400, detail=stat["error"])
+
+        validators = stat
+        if (
+            stat.get("codec")
+            and stat.get("etag")
+            and not range_header
+            and accepts_encoding(request.headers.get("accept-encoding"), stat["codec"])
+        ):
+            # The stored bytes would be sent as-is, a representation of their own
+            validators = {**stat, "etag": encoded_etag(stat["etag"], stat["codec"])}
+        if is_not_modified(validators, if_none_match, if_modified_since):
+            return Response(status_code=304, headers=_validator_headers(validators))
+
+        # Ranges address the decoded bytes, so the encoded ETag never matches
+        # If-Range, and the whole object is sent instead
+        if_range = request.headers.get("if-range")
+        if range_header and (not if_range or range_still_valid(stat, if_range)):
+            ranges = parse_range_header(range_header, stat["size"])
+        if ranges == []:
+            raise HTTPException(
+                status_code=416, headers={"Content-Range": f"bytes */{stat['size']}"}
+            )
+
+    if ranges and len(ranges) > 1:
+        content_type = stat.get("content_type") or "application/octet-stream"
+        boundary = secrets.token_hex(16)
+        parts = [
+            (
+                (start, end),
+                (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{stat['size']}\r\n\r\n"
+                ).encode(),
+            )
+            for start, end in ranges
+        ]
+        headers = _validator_headers(stat)
+        headers["Content-Length"] = str(
+            sum(len(header) + end - start + 3 for (start, end), header in parts)
+            + len(f"--{boundary}--\r\n")
+        )
+        return StreamingResponse(
+            _stream_byteranges(bucket_name, filename, parts, boundary),
+            status_code=206,
+            media_type=f"multipart/byteranges; boundary={boundary}",
+            headers=headers,
+        )
+
+    if ranges:
+        start, end = ranges[0]
+        result = await storage_api.download_file(
+            bucket_name, filename, offset=start, length=end - start + 1
+        )
+    else:
+        result = await storage_api.download_file(
+            bucket_name,
+            filename,
+            accept_encoding=request.headers.get("accept-encoding"),
+        )
+    if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
 
-    # Just return the raw bytes
-    return Response(content=result)
+    headers = _validator_headers(result)
+    if result["content_length"] is not None:
+        headers["Content-Length"] = str(result["content_length"])
+    if result.get("codec"):  # Stored compressed, sent as-is or decoded
+        headers["Vary"] = "Accept-Encoding"
+    if result.get("content_encoding"):
+        headers["Content-Encoding"] = result["content_encoding"]
+        if result.get("etag"):
+            headers["ETag"] = encoded_etag(result["etag"], result["content_encoding"])
+    status_code = 200
+    if ranges:
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat['size']}"
+        status_code = 206
+
+    if result.get("path") and not ranges:
+        # A local file, from the disk cache or a filesystem backend, which is
+        # kept until it's sent
+        return _LocalFileResponse(
+            result["path"],
+            media_type=result.get("content_type") or "application/octet-stream",
+            headers=headers,
+            background=BackgroundTask(result["body"].aclose),
+        )
+
+    # Stream chunks straight through instead of buffering the whole object
+    return StreamingResponse(
+        result["body"],
+        status_code=status_code,
+        media_type=result.get("content_type") or "application/octet-stream",
+        headers=headers,
+    )
+
+
+@app.post("/delete/{bucket_name}")
+async def delete_files(bucket_name: str, request: BatchRequest):
+    result = await storage_api.delete_files(bucket_name, request.keys, request.prefix)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    # One NDJSON line per key, written as each backend batch completes
+    return StreamingResponse(
+        _ndjson_lines(result["results"]), media_type="application/x-ndjson"
+    )
 
 
-@app.delete("/delete/{bucket_name}/{filename}")
+@app.delete("/delete/{bucket_name}/{filename:path}")
 async def delete_file(bucket_name: str, filename: str):
     result = await storage_api.delete_file(bucket_name, filename)
     if "error" in result:
@@ -70,7 +449,187 @@ async def delete_file(bucket_name: str, filename: str):
     return result
 
 
+# Copies run inside the backend, so object bytes never pass through here
+@app.post("/copy/{bucket_name}/{filename:path}")
+async def copy_file(bucket_name: str, filename: str, to: str, to_bucket: str = None):
+    result = await storage_api.copy_file(
+        bucket_name, filename, to_bucket or bucket_name, to
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.post("/move/{bucket_name}/{filename:path}")
+async def move_file(bucket_name: str, filename: str, to: str, to_bucket: str = None):
+    result = await storage_api.move_file(
+        bucket_name, filename, to_bucket or bucket_name, to
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+async def _copy_files(bucket_name: str, request: CopyRequest, move: bool):
+    result = await storage_api.copy_files(
+        bucket_name,
+        request.to_bucket or bucket_name,
+        request.keys,
+        request.prefix,
+        request.to_prefix,
+        move,
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    # One NDJSON line per key as each copy completes
+    return StreamingResponse(
+        _ndjson_lines(result["results"]), media_type="application/x-ndjson"
+    )
+
+
+@app.post("/copy/{bucket_name}")
+async def copy_files(bucket_name: str, request: CopyRequest):
+    return await _copy_files(bucket_name, request, move=False)
+
+
+@app.post("/move/{bucket_name}")
+async def move_files(bucket_name: str, request: CopyRequest):
+    return await _copy_files(bucket_name, request, move=True)
+
+
+# Presigned URLs: clients transfer bytes with the backend directly and only
+# come here for the signatures
+@app.get("/presign/{bucket_name}/{filename:path}")
+async def presign_url(
+    bucket_name: str,
+    filename: str,
+    method: Literal["GET", "PUT"] = "GET",
+    expires: int = Query(None, ge=1),
+):
+    result = await storage_api.presign_url(bucket_name, filename, method, expires)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.post("/presign/{bucket_name}/{filename:path}/multipart")
+async def create_multipart_upload(
+    bucket_name: str,
+    filename: str,
+    parts: int = Query(..., ge=1, le=MAX_UPLOAD_PARTS),
+    content_type: str = None,
+    expires: int = Query(None, ge=1),
+):
+    result = await storage_api.create_multipart_upload(
+        bucket_name, filename, parts, content_type, expires
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.post("/presign/{bucket_name}/{filename:path}/multipart/{upload_id}")
+async def complete_multipart_upload(
+    bucket_name: str, filename: str, upload_id: str, request: CompleteMultipartRequest
+):
+    result = await storage_api.complete_multipart_upload(
+        bucket_name,
+        filename,
+        upload_id,
+        [part.model_dump() for part in request.parts],
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.delete("/presign/{bucket_name}/{filename:path}/multipart/{upload_id}")
+async def abort_multipart_upload(bucket_name: str, filename: str, upload_id: str):
+    result = await storage_api.abort_multipart_upload(bucket_name, filename, upload_id)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+# Resumable uploads: the client sends numbered chunks through the service, in
+# parallel or resuming where it stopped, and asks which ones arrived. Keys may
+# contain "/", so starting one ends in /start to tell it from completing one
+@app.post("/uploads/{bucket_name}/{filename:path}/start")
+async def start_upload(
+    bucket_name: str,
+    filename: str,
+    content_type: str = None,
+    size: int = Query(None, ge=0),
+    chunk_size: int = Query(None, ge=1),
+):
+    result = await storage_api.start_upload(
+        bucket_name, filename, content_type, size, chunk_size
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.put("/uploads/{bucket_name}/{filename:path}/{upload_id}/{part_number}")
+async def upload_chunk(
+    bucket_name: str,
+    filename: str,
+    upload_id: str,
+    part_number: int,
+    request: Request,
+):
+    limit = config.OBJECT_STORAGE_UPLOAD_MAX_CHUNK_SIZE
+    data = bytearray()
+    async for chunk in request.stream():
+        data += chunk
+        if len(data) > limit:
+            raise HTTPException(
+                status_code=413, detail=f"Chunks are at most {limit} bytes"
+            )
+    result = await storage_api.upload_chunk(
+        bucket_name,
+        filename,
+        upload_id,
+        part_number,
+        bytes(data),
+        request.headers.get("content-md5"),
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.get("/uploads/{bucket_name}/{filename:path}/{upload_id}")
+async def upload_status(bucket_name: str, filename: str, upload_id: str):
+    result = await storage_api.upload_status(bucket_name, filename, upload_id)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.post("/uploads/{bucket_name}/{filename:path}/{upload_id}")
+async def complete_upload(bucket_name: str, filename: str, upload_id: str):
+    result = await storage_api.complete_upload(bucket_name, filename, upload_id)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.delete("/uploads/{bucket_name}/{filename:path}/{upload_id}")
+async def abort_upload(bucket_name: str, filename: str, upload_id: str):
+    result = await storage_api.abort_upload(bucket_name, filename, upload_id)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=59090)
+    # Workers are separate processes importing the app themselves
+    uvicorn.run(
+        "service:app",
+        host="0.0.0.0",
+        port=59090,
+        workers=config.OBJECT_STORAGE_WORKERS,
+    )
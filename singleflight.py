@@ -0,0 +1,225 @@
+import asyncio
+import itertools
+from collections import deque
+
+_closing = set()  # Bodies being closed in the background, kept referenced
+
+
+class SingleFlight:
+    """Lets concurrent identical backend reads share one request.
+
+    The first caller for a key starts the call, and callers arriving while
+    it is in flight wait for its result instead of making their own.
+    """
+
+    def __init__(self, max_buffer: int):
+        self.max_buffer = max_buffer
+        self._flights = {}
+        self.started = 0
+        self.joined = 0
+
+    async def do(self, key, func):
+        """Result of `func()`, or of the call already in flight for `key`"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._start(key, func)
+        else:
+            self.joined += 1
+        # Shielded, so a caller going away doesn't cancel the call for the rest
+        result = await asyncio.shield(flight.task)
+        return dict(result) if isinstance(result, dict) else result
+
+    async def stream(self, key, func):
+        """Like `do`, for download results whose "body" streams the object.
+
+        Every caller reads the body from its first chunk, so a download can be
+        joined until its slowest reader has moved past that chunk.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._start(key, func, self.max_buffer)
+        else:
+            self.joined += 1
+        reader = flight.broadcast.join()
+        try:
+            result = await asyncio.shield(flight.task)
+        except BaseException:
+            flight.broadcast.leave(reader)
+            raise
+        if "body" not in result:
+            flight.broadcast.leave(reader)
+            return dict(result)
+        return {**result, "body": _Reader(flight.broadcast, reader)}
+
+    def forget(self, match):
+        """Stop new callers from joining calls whose key `match`es, e.g. after
+        a write made their results stale. Callers already waiting still share it."""
+        for key in [key for key in self._flights if match(key)]:
+            del self._flights[key]
+
+    def stats(self):
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "joined": self.joined,
+        }
+
+    def _start(self, key, func, max_buffer: int = None):
+        flight = _Flight(asyncio.ensure_future(func()))
+        self._flights[key] = flight
+        self.started += 1
+        if max_buffer is None:
+            flight.task.add_done_callback(lambda _: self._end(key, flight))
+        else:
+            flight.broadcast = _Broadcast(max_buffer, lambda: self._end(key, flight))
+            flight.task.add_done_callback(flight.broadcast.landed)
+        return flight
+
+    def _end(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.broadcast = None
+
+
+class _Broadcast:
+    """Fans one streamed body out to several readers, each from its first chunk.
+
+    Chunks are kept until every reader has had them, and the body isn't read
+    further ahead of the slowest reader than `max_buffer` bytes.
+    """
+
+    def __init__(self, max_buffer: int, on_sealed):
+        self.max_buffer = max_buffer
+        self.on_sealed = on_sealed
+        self.body = None
+        self.chunks = deque()
+        self.base = 0  # Index of chunks[0] in the body
+        self.buffered = 0
+        self.positions = {}  # Index of the next chunk of each reader
+        self.sealed = False  # No more readers may join
+        self.done = False
+        self.error = None
+        self._pulling = None  # Task reading the next chunk from the body
+        self._trimmed = asyncio.Event()
+        self._ids = itertools.count()
+
+    def join(self):
+        reader = next(self._ids)
+        self.positions[reader] = 0
+        return reader
+
+    def leave(self, reader):
+        if self.positions.pop(reader, None) is None:
+            return None
+        if self.positions:
+            self._trim()
+            return None
+        # Nobody is reading, so don't hold the backend response open for
+        # readers that may never come
+        self._seal()
+        if self.body is not None:
+            return self._close()
+        return None
+
+    def landed(self, task):
+        if task.cancelled() or task.exception() is not None:
+            self._seal()
+            return
+        self.body = task.result().get("body")
+        if self.body is None:
+            self._seal()
+        elif not self.positions:  # Every caller went away while it was in flight
+            self._close()
+
+    async def read(self, reader):
+        while True:
+            index = self.positions[reader]
+            if index < self.base + len(self.chunks):
+                self.positions[reader] = index + 1
+                chunk = self.chunks[index - self.base]
+                self._trim()
+                yield chunk
+            elif self.error is not None:
+                raise self.error
+            elif self.done:
+                return
+            else:
+                await self._pull()
+
+    async def _pull(self):
+        # The reader ahead of the rest waits for them to catch up
+        while self.buffered and self.buffered >= self.max_buffer:
+            await self._trimmed.wait()
+        if self._pulling is None:
+            self._pulling = asyncio.ensure_future(self._pull_next())
+        await asyncio.shield(self._pulling)
+
+    async def _pull_next(self):
+        try:
+            chunk = await self.body.__anext__()
+        except StopAsyncIteration:
+            self.done = True
+        except Exception as e:
+            self.done, self.error = True, e
+        else:
+            self.chunks.append(chunk)
+            self.buffered += len(chunk)
+        finally:
+            self._pulling = None
+
+    def _trim(self):
+        slowest = min(self.positions.values(), default=self.base + len(self.chunks))
+        if slowest == self.base:
+            return
+        while self.base < slowest:
+            self.buffered -= len(self.chunks.popleft())
+            self.base += 1
+        self._seal()  # Readers joining now would miss the first chunk
+        self._trimmed.set()
+        self._trimmed = asyncio.Event()
+
+    def _seal(self):
+        if not self.sealed:
+            self.sealed = True
+            self.on_sealed()
+
+    def _close(self):
+        async def close(pulling):
+            if pulling is not None:
+                await asyncio.wait([pulling])  # Can't close a generator mid-read
+            await self.body.aclose()
+
+        task = asyncio.ensure_future(close(self._pulling))
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+        return task
+
+
+class _Reader:
+    """One caller's view of a shared body, closed like any other body"""
+
+    def __init__(self, broadcast: _Broadcast, reader: int):
+        self._broadcast = broadcast
+        self._reader = reader
+        self._chunks = broadcast.read(reader)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._chunks.__anext__()
+        except BaseException:  # The end, a failed read, or the caller cancelled
+            self._broadcast.leave(self._reader)
+            raise
+
+    async def aclose(self):
+        closing = self._broadcast.leave(self._reader)
+        await self._chunks.aclose()
+        if closing is not None:  # The last reader waits for the backend to let go
+            await asyncio.shield(closing)
@@ -1,34 +1,836 @@
-# storage_base.py
+import asyncio
+import base64
+import binascii
+import functools
+import tempfile
+import time
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
 from fastapi import UploadFile
+from starlette.datastructures import Headers
 
+from archive import ARCHIVE_WRITERS, guess_content_type, iter_archive_members
+from backpressure import Backpressure, is_throttled
 from config import config
+from metrics import BACKEND_ERRORS, BACKEND_IN_FLIGHT, BACKEND_LATENCY
+from uploads import UploadSession, UploadSessions
+
+LIST_PAGE_SIZE = 1000  # Keys per backend page, the S3 maximum
+DELETE_BATCH_SIZE = 1000  # Keys per multi-object delete request, the S3 maximum
+ARCHIVE_READ_AHEAD_CHUNKS = 4  # Chunks buffered per object fetched ahead of the archive
+MAX_UPLOAD_PARTS = 10000  # Parts per multipart upload, the S3 maximum
+MIN_PART_SIZE = 5 * 1024 * 1024  # Smallest part but the last, the S3 minimum
+# Backend calls that can be repeated with the same arguments and outcome, so
+# are retried when throttled; uploads from streams and creations are not
+RETRYABLE_OPERATIONS = frozenset(
+    {
+        "abort_multipart_upload",
+        "bucket_exists",
+        "copy_object",
+        "get_object",
+        "list_objects",
+        "list_parts",
+        "remove_object",
+        "remove_objects",
+        "stat_object",
+        "upload_part",
+        "upload_part_copy",
+    }
+)
+
+
+class StorageError(Exception):
+    """Raised inside streamed batch operations, where there's no result dict to return"""
+
+
+class Overloaded(StorageError):
+    """Raised instead of calling the backend when too many calls are queued
+    for a bucket, or once the backend kept throttling them; clients get a
+    429 asking them to come back after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def encode_continuation_token(last_name: str, is_prefix: bool = False):
+    # A common prefix stands for every key under it, so resume after all of them
+    if is_prefix:
+        last_name += "\U0010ffff"
+    return base64.urlsafe_b64encode(last_name.encode()).decode()
+
+
+def decode_continuation_token(token: str):
+    if not token:
+        return None
+    try:
+        return base64.b64decode(token.encode(), altchars=b"-_", validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError("Invalid continuation token") from e
 
 
 class StorageAPI(ABC):
-    def __init__(self):
-        self.endpoint = config.OBJECT_STORAGE_ENDPOINT
-        self.access_key = config.OBJECT_STORAGE_ACCESS_KEY
-        self.secret_key = config.OBJECT_STORAGE_SECRET_KEY
-        self.secure = config.OBJECT_STORAGE_SECURE
+    def __init__(
+        self, endpoint=None, access_key=None, secret_key=None, secure: bool = None
+    ):
+        # Defaults to the configured backend, routed backends pass their own
+        # endpoint and keys, and never get the default backend's keys
+        if endpoint is None:
+            access_key = access_key or config.OBJECT_STORAGE_ACCESS_KEY
+            secret_key = secret_key or config.OBJECT_STORAGE_SECRET_KEY
+        self.endpoint = endpoint or config.OBJECT_STORAGE_ENDPOINT
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.secure = secure if secure is not None else config.OBJECT_STORAGE_SECURE
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.OBJECT_STORAGE_MAX_WORKERS,
+            thread_name_prefix=type(self).__name__,
+        )  # Bounded, so a slow backend queues calls instead of spawning threads
+        self.batch_concurrency = config.OBJECT_STORAGE_BATCH_CONCURRENCY
+        self.uploads = UploadSessions(config.OBJECT_STORAGE_UPLOAD_SESSION_TTL)
+        self.backpressure = Backpressure(
+            config.OBJECT_STORAGE_BUCKET_CONCURRENCY,
+            config.OBJECT_STORAGE_BUCKET_MIN_CONCURRENCY,
+            config.OBJECT_STORAGE_BUCKET_MAX_QUEUE,
+            config.OBJECT_STORAGE_THROTTLE_RETRIES,
+            config.OBJECT_STORAGE_RETRY_BACKOFF,
+            config.OBJECT_STORAGE_RETRY_MAX_BACKOFF,
+        )
+
+    async def _run(self, func, *args, **kwargs):
+        # Client libraries are synchronous, so every call goes through the
+        # executor to keep one slow round-trip from freezing the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def _call(self, operation: str, func, *args, bucket: str = None, **kwargs):
+        """`_run` a backend request, recording its latency and error code.
+
+        Requests for a `bucket` are held to its adaptive concurrency limit.
+        Throttled ones are retried after a jittered backoff when they are
+        RETRYABLE_OPERATIONS, and raise Overloaded once that gives up, as
+        they do when too many are queued for the bucket.
+        """
+        limit = self.backpressure.limit(bucket) if bucket is not None else None
+        attempt = 0
+        while True:
+            if limit is not None and not await limit.acquire():
+                raise Overloaded(
+                    f"Too many requests queued for bucket '{bucket}'",
+                    limit.retry_after(),
+                )
+            start = time.perf_counter()
+            BACKEND_IN_FLIGHT.inc()
+            try:
+                result = await self._run(func, *args, **kwargs)
+            except Exception as e:
+                code = getattr(e, "code", None) or type(e).__name__
+                BACKEND_ERRORS.inc(operation, code)
+                if not is_throttled(e):
+                    raise
+                if limit is not None:
+                    limit.throttled()
+                error = e
+            else:
+                if limit is not None:
+                    limit.succeeded(time.perf_counter() - start)
+                return result
+            finally:
+                BACKEND_IN_FLIGHT.dec()
+                BACKEND_LATENCY.observe(time.perf_counter() - start, operation)
+                if limit is not None:
+                    limit.release()  # Not held through the backoff
+
+            if (
+                operation not in RETRYABLE_OPERATIONS
+                or attempt >= self.backpressure.retries
+            ):
+                raise Overloaded(
+                    f"The storage backend is throttling requests: {error}",
+                    limit.retry_after() if limit is not None else 1,
+                ) from error
+            self.backpressure.retried += 1
+            await asyncio.sleep(self.backpressure.delay(attempt))
+            attempt += 1
+
+    async def _bounded(self, items, func):
+        """Apply `func` to each item of an async iterable, at most batch_concurrency
+        at a time, yielding results in completion order"""
+        pending = set()
+        try:
+            error = None
+            try:
+                async for item in items:
+                    if len(pending) >= self.batch_concurrency:
+                        done, pending = await asyncio.wait(
+                            pending, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        for task in done:
+                            yield task.result()
+                    pending.add(asyncio.ensure_future(func(item)))
+            except Exception as e:  # Report work already started before failing
+                error = e
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+            if error is not None:
+                raise error
+        finally:  # The consumer went away, stop whatever hasn't started
+            for task in pending:
+                task.cancel()
+
+    async def _key_batches(self, bucket_name: str, keys=None, prefix=None):
+        if keys is not None:
+            for start in range(0, len(keys), DELETE_BATCH_SIZE):
+                yield keys[start : start + DELETE_BATCH_SIZE]
+            return
+
+        continuation_token = None
+        while True:
+            page = await self._list_names(
+                bucket_name, prefix, DELETE_BATCH_SIZE, continuation_token
+            )
+            if "error" in page:
+                raise StorageError(page["error"])
+            if page["files"]:
+                yield [file["name"] for file in page["files"]]
+            if not page["is_truncated"]:
+                return
+            continuation_token = page["next_continuation_token"]
+
+    async def _list_names(self, bucket_name, prefix, max_keys, continuation_token):
+        """A recursive listing page for batch operations, which only use the
+        names, so backends can skip working out anything else"""
+        return await self.list_files(
+            bucket_name, prefix, True, max_keys, continuation_token
+        )
+
+    def stats(self):
+        return {"service": type(self).__name__, "uploads": self.uploads.stats()}
 
     @abstractmethod
-    async def list_files(self, bucket_name: str):
+    async def list_files(
+        self,
+        bucket_name: str,
+        prefix: str = None,
+        recursive: bool = False,
+        max_keys: int = LIST_PAGE_SIZE,
+        continuation_token: str = None,
+        sizes: bool = False,  # Original sizes of compressed objects, where it costs extra
+    ):
         pass
 
+    async def stream_files(
+        self,
+        bucket_name: str,
+        prefix: str = None,
+        recursive: bool = False,
+        continuation_token: str = None,
+    ):
+        # Fetch the first page up front so errors surface before streaming starts
+        page = await self.list_files(
+            bucket_name, prefix, recursive, LIST_PAGE_SIZE, continuation_token
+        )
+        if "error" in page:
+            return page
+        return {
+            "bucket": bucket_name,
+            "entries": self._iter_pages(page, prefix, recursive),
+        }
+
+    async def _iter_pages(self, page, prefix, recursive):
+        while True:
+            for name in page["prefixes"]:
+                yield {"prefix": name}
+            for file in page["files"]:
+                yield file
+            if not page["is_truncated"]:
+                return
+            try:
+                page = await self.list_files(
+                    page["bucket"],
+                    prefix,
+                    recursive,
+                    LIST_PAGE_SIZE,
+                    page["next_continuation_token"],
+                )
+            except StorageError as e:
+                # The response has started, so end it with an error record
+                page = {"error": f"Error listing files: {str(e)}"}
+            if "error" in page:
+                yield page
+                return
+
     @abstractmethod
     async def upload_file(self, bucket_name: str, file: UploadFile):
         pass
 
+    async def upload_files(self, bucket_name: str, files: list, prefix: str = ""):
+        async def items():
+            for file in files:
+                file.filename = prefix + file.filename
+                yield file
+
+        return await self._upload_many(bucket_name, items())
+
+    async def upload_archive(self, bucket_name: str, archive: UploadFile, prefix=""):
+        # Members are extracted one at a time while earlier ones are uploading
+        members = iter_archive_members(archive.file, config.OBJECT_STORAGE_PART_SIZE)
+
+        async def items():
+            try:
+                while (member := await self._run(next, members, None)) is not None:
+                    name, file, size = member
+                    yield UploadFile(
+                        file,
+                        size=size,
+                        filename=prefix + name,
+                        headers=Headers({"content-type": guess_content_type(name)}),
+                    )
+            finally:
+                members.close()
+
+        return await self._upload_many(bucket_name, items(), archive.filename)
+
+    async def _upload_many(self, bucket_name, files, archive_name=None):
+        results = []
+        try:
+            async for result in self._bounded(
+                files, functools.partial(self._upload_one, bucket_name)
+            ):
+                results.append(result)
+        except ValueError as e:  # The archive turned out to be unreadable
+            results.append({"name": archive_name, "error": str(e)})
+
+        failed = sum(1 for result in results if "error" in result)
+        return {
+            "bucket": bucket_name,
+            "uploaded": len(results) - failed,
+            "failed": failed,
+            "files": results,
+        }
+
+    async def _upload_one(self, bucket_name: str, file: UploadFile):
+        try:
+            result = await self.upload_file(bucket_name, file)
+        except Overloaded as e:  # Reported per file, like any other failure
+            result = {"error": str(e)}
+        finally:
+            await file.close()  # Frees spooled archive members as soon as possible
+        if "error" in result:
+            return {"name": file.filename, "error": result["error"]}
+        return {"name": file.filename, "uploaded": True}
+
+    @abstractmethod
+    async def download_file(
+        self,
+        bucket_name: str,
+        filename: str,
+        offset: int = 0,
+        length: int = None,
+        accept_encoding: str = None,
+    ):
+        """Objects stored compressed come back decoded, unless `accept_encoding`
+        allows their codec, in which case the result names it in "content_encoding"
+        """
+        pass
+
+    async def download_archive(
+        self, bucket_name: str, keys: list = None, prefix=None, archive_format="zip"
+    ):
+        if keys is None and prefix is None:
+            return {"error": "Either keys or prefix is required"}
+        if archive_format not in ARCHIVE_WRITERS:
+            return {"error": f"Unsupported archive format: {archive_format}"}
+        writer = ARCHIVE_WRITERS[archive_format]()
+        return {
+            "body": self._stream_archive(bucket_name, keys, prefix, writer),
+            "media_type": writer.media_type,
+        }
+
+    async def _stream_archive(self, bucket_name, keys, prefix, writer):
+        # Up to batch_concurrency objects are fetched ahead into small bounded
+        # queues while entries are written in key order as their bytes arrive
+        errors = []
+        fetches = deque()
+        names = self._archive_keys(bucket_name, keys, prefix, errors)
+        listing = True
+        try:
+            while True:
+                while listing and len(fetches) < self.batch_concurrency:
+                    try:
+                        key = await names.__anext__()
+                    except StopAsyncIteration:
+                        listing = False
+                    else:
+                        fetches.append(self._fetch_ahead(bucket_name, key))
+                if not fetches:
+                    break
+
+                key, queue, _ = fetches.popleft()
+                result = await queue.get()
+                if "error" in result:
+                    errors.append(f"{key}: {result['error']}")
+                    continue
+                yield writer.begin(
+                    key,
+                    result["content_length"],
+                    _modified(result.get("last_modified")),
+                )
+                while (chunk := await queue.get()) is not None:
+                    if isinstance(chunk, Exception):
+                        raise chunk  # Mid-entry, the archive can't be completed
+                    yield writer.write(chunk)
+                yield writer.end()
+
+            if errors:  # Failed keys are listed in the archive itself
+                report = "\n".join(errors).encode() + b"\n"
+                yield writer.begin(
+                    "ERRORS.txt", len(report), datetime.now(timezone.utc)
+                )
+                yield writer.write(report)
+                yield writer.end()
+            yield writer.close()
+        finally:
+            for _, _, task in fetches:
+                task.cancel()
+
+    async def _archive_keys(self, bucket_name, keys, prefix, errors):
+        try:
+            async for batch in self._key_batches(bucket_name, keys, prefix):
+                for key in batch:
+                    yield key
+        except StorageError as e:
+            errors.append(f"Error listing files: {str(e)}")
+
+    def _fetch_ahead(self, bucket_name: str, key: str):
+        queue = asyncio.Queue(maxsize=ARCHIVE_READ_AHEAD_CHUNKS)
+
+        async def fetch():
+            try:
+                result = await self.download_file(bucket_name, key)
+            except Overloaded as e:
+                result = {"error": str(e)}
+            if "error" in result:
+                await queue.put(result)
+                return
+            body = result.pop("body")
+            await queue.put(result)
+            try:
+                async for chunk in body:
+                    await queue.put(chunk)
+                await queue.put(None)
+            except Exception as e:
+                await queue.put(e)
+            finally:
+                await body.aclose()
+
+        return key, queue, asyncio.ensure_future(fetch())
+
+    async def warm(self, bucket_name: str, filename: str = None, size: int = None):
+        """Load what serving `filename`, or just `bucket_name` when it is None,
+        needs into this backend's caches; `size` saves a stat if it's known"""
+        if filename is None:
+            return {}
+        if size is None:
+            stat = await self.stat_file(bucket_name, filename)
+            if "error" in stat:
+                return stat
+            size = stat["size"]
+        if not self._caches(size):
+            return {"cached": False}
+        result = await self.download_file(bucket_name, filename, accept_encoding="*")
+        if "error" in result:
+            return result
+        try:
+            async for _ in result["body"]:  # The caches fill as the body is read
+                pass
+        finally:
+            await result["body"].aclose()
+        return {"cached": True}
+
+    def _caches(self, size: int):
+        """Whether downloads of objects of `size` bytes are kept in a cache"""
+        return False
+
     @abstractmethod
-    async def download_file(self, bucket_name: str, filename: str):
+    async def stat_file(self, bucket_name: str, filename: str):
         pass
 
     @abstractmethod
     async def delete_file(self, bucket_name: str, filename: str):
         pass
 
+    async def delete_files(self, bucket_name: str, keys: list = None, prefix=None):
+        if keys is None and prefix is None:
+            return {"error": "Either keys or prefix is required"}
+        if keys is None and not prefix:
+            # Would empty the bucket, which is never what a bulk delete means
+            return {"error": "Prefix must not be empty"}
+        return {
+            "bucket": bucket_name,
+            "results": self._delete_in_batches(bucket_name, keys, prefix),
+        }
+
+    async def _delete_in_batches(self, bucket_name, keys, prefix):
+        batches = self._key_batches(bucket_name, keys, prefix)
+        try:
+            async for results in self._bounded(
+                batches, functools.partial(self._delete_batch, bucket_name)
+            ):
+                for result in results:
+                    yield result
+        except StorageError as e:
+            yield {"error": f"Error listing files to delete: {str(e)}"}
+
+    async def _delete_batch(self, bucket_name: str, keys: list):
+        # Backends without a multi-object delete fall back to one call per key
+        results = []
+        for key in keys:
+            result = await self.delete_file(bucket_name, key)
+            if "error" in result:
+                results.append({"name": key, "error": result["error"]})
+            else:
+                results.append({"name": key, "deleted": True})
+        return results
+
+    async def copy_file(
+        self, bucket_name: str, filename: str, dest_bucket: str, dest_filename: str
+    ):
+        # Backends without a server-side copy pass the bytes through this process
+        return await self._transfer(
+            self, bucket_name, filename, self, dest_bucket, dest_filename
+        )
+
+    async def _transfer(
+        self, source, bucket_name, filename, dest, dest_bucket, dest_filename
+    ):
+        """Copy an object from the `source` storage API to `dest` via a spool file"""
+        result = await source.download_file(bucket_name, filename)
+        if "error" in result:
+            return result
+        spooled = tempfile.SpooledTemporaryFile(
+            max_size=config.OBJECT_STORAGE_PART_SIZE
+        )
+        try:
+            async for chunk in result["body"]:
+                await self._run(spooled.write, chunk)
+            await self._run(spooled.seek, 0)
+            result = await dest.upload_file(
+                dest_bucket,
+                UploadFile(
+                    spooled,
+                    size=result["content_length"],
+                    filename=dest_filename,
+                    headers=Headers(
+                        {
+                            "content-type": result.get("content_type")
+                            or "application/octet-stream"
+                        }
+                    ),
+                ),
+            )
+        finally:
+            spooled.close()
+        if "error" in result:
+            return result
+        return {"message": "File copied successfully"}
+
+    async def move_file(
+        self, bucket_name: str, filename: str, dest_bucket: str, dest_filename: str
+    ):
+        if (bucket_name, filename) == (dest_bucket, dest_filename):
+            return {"error": "Source and destination are the same"}
+        result = await self.copy_file(bucket_name, filename, dest_bucket, dest_filename)
+        if "error" in result:
+            return result
+        result = await self.delete_file(bucket_name, filename)
+        if "error" in result:
+            return {"error": f"Copied, but the source was kept: {result['error']}"}
+        return {"message": "File moved successfully"}
+
+    async def copy_files(
+        self,
+        bucket_name: str,
+        dest_bucket: str,
+        keys: list = None,
+        prefix=None,
+        dest_prefix: str = "",
+        move: bool = False,
+    ):
+        if keys is None and prefix is None:
+            return {"error": "Either keys or prefix is required"}
+        if (
+            keys is None
+            and bucket_name == dest_bucket
+            and dest_prefix.startswith(prefix)
+        ):
+            # The listing would pick up the copies and never finish
+            return {"error": "Destination prefix must not be inside the source prefix"}
+        return {
+            "bucket": bucket_name,
+            "results": self._copy_in_parallel(
+                bucket_name, dest_bucket, keys, prefix, dest_prefix, move
+            ),
+        }
+
+    async def _copy_in_parallel(
+        self, bucket_name, dest_bucket, keys, prefix, dest_prefix, move
+    ):
+        errors = []
+
+        async def names():
+            try:
+                async for batch in self._key_batches(bucket_name, keys, prefix):
+                    for key in batch:
+                        yield key
+            except StorageError as e:
+                errors.append({"error": f"Error listing files to copy: {str(e)}"})
+
+        async def copy_one(key):
+            # Under a prefix, keys keep their path relative to it
+            dest = dest_prefix + key.removeprefix(prefix or "")
+            operation = self.move_file if move else self.copy_file
+            try:
+                result = await operation(bucket_name, key, dest_bucket, dest)
+            except Overloaded as e:
+                result = {"error": str(e)}
+            if "error" in result:
+                return {"name": key, "error": result["error"]}
+            return {
+                "name": key,
+                "destination": dest,
+                "moved" if move else "copied": True,
+            }
+
+        async for result in self._bounded(names(), copy_one):
+            yield result
+        for error in errors:
+            yield error
+
     @abstractmethod
     async def create_bucket(self, bucket_name: str):
         pass
+
+    # Presigned URLs let clients move object bytes to and from the backend
+    # directly; backends that can't sign requests report it as an error
+    async def presign_url(
+        self, bucket_name: str, filename: str, method="GET", expires: int = None
+    ):
+        return {"error": f"{type(self).__name__} does not support presigned URLs"}
+
+    async def upload_by_hash(
+        self, bucket_name: str, filename: str, sha256: str, content_type: str = None
+    ):
+        """Store `filename` as a copy of content already stored with this
+        SHA-256, so clients that hashed it don't have to send it"""
+        return {"error": f"{type(self).__name__} does not support deduplication"}
+
+    async def create_multipart_upload(
+        self,
+        bucket_name: str,
+        filename: str,
+        parts: int,
+        content_type: str = None,
+        expires: int = None,
+    ):
+        return {"error": f"{type(self).__name__} does not support presigned URLs"}
+
+    async def complete_multipart_upload(
+        self, bucket_name: str, filename: str, upload_id: str, parts: list
+    ):
+        return {"error": f"{type(self).__name__} does not support presigned URLs"}
+
+    async def abort_multipart_upload(
+        self, bucket_name: str, filename: str, upload_id: str
+    ):
+        return {"error": f"{type(self).__name__} does not support presigned URLs"}
+
+    # Resumable uploads: the client sends numbered chunks over as many requests
+    # as it takes, in parallel or resuming after a failure, and the backend
+    # assembles them as a multipart upload. Its list of received parts is what
+    # progress is read from, so a restart loses nothing but the session's TTL.
+    async def start_upload(
+        self,
+        bucket_name: str,
+        filename: str,
+        content_type: str = None,
+        size: int = None,
+        chunk_size: int = None,
+    ):
+        chunk_size = chunk_size or config.OBJECT_STORAGE_PART_SIZE
+        max_chunk_size = config.OBJECT_STORAGE_UPLOAD_MAX_CHUNK_SIZE
+        if not MIN_PART_SIZE <= chunk_size <= max_chunk_size:
+            return {
+                "error": f"Chunk size must be between {MIN_PART_SIZE} and {max_chunk_size} bytes"
+            }
+        if size is not None and size > chunk_size * MAX_UPLOAD_PARTS:
+            return {"error": f"Size needs more than {MAX_UPLOAD_PARTS} chunks"}
+        result = await self._create_upload(bucket_name, filename, content_type)
+        if "error" in result:
+            return result
+        session = UploadSession(
+            bucket_name, filename, result["upload_id"], chunk_size, size
+        )
+        self.uploads.add(session)
+        return self._upload_state(session, [])
+
+    async def upload_chunk(
+        self,
+        bucket_name: str,
+        filename: str,
+        upload_id: str,
+        part_number: int,
+        data: bytes,
+        content_md5: str = None,
+    ):
+        if not 1 <= part_number <= MAX_UPLOAD_PARTS:
+            return {"error": f"Chunk number must be between 1 and {MAX_UPLOAD_PARTS}"}
+        session = self.uploads.get(bucket_name, filename, upload_id)
+        count = session.chunk_count()
+        if count is not None and part_number > count:
+            return {"error": f"The upload has {count} chunks"}
+        expected = session.expected_length(part_number)
+        if expected is not None and len(data) != expected:
+            return {"error": f"Chunk {part_number} must be {expected} bytes"}
+        if session.chunk_size and len(data) > session.chunk_size:
+            return {"error": f"Chunks are at most {session.chunk_size} bytes"}
+        session.uploading += 1
+        try:
+            result = await self._upload_part(
+                bucket_name, filename, upload_id, part_number, data, content_md5
+            )
+        finally:
+            session.uploading -= 1
+            session.touch()
+        if "error" not in result:
+            self.uploads.adopt(session)
+        return result
+
+    async def upload_status(self, bucket_name: str, filename: str, upload_id: str):
+        result = await self._list_parts(bucket_name, filename, upload_id)
+        if "error" in result:
+            return result
+        session = self.uploads.adopt(self.uploads.get(bucket_name, filename, upload_id))
+        return self._upload_state(session, result["parts"])
+
+    async def complete_upload(self, bucket_name: str, filename: str, upload_id: str):
+        result = await self._list_parts(bucket_name, filename, upload_id)
+        if "error" in result:
+            return result
+        session = self.uploads.get(bucket_name, filename, upload_id)
+        session.touch()
+        parts = result["parts"]
+        state = self._upload_state(session, parts)
+        if state.get("missing"):
+            return {"error": f"Missing chunks: {_ranges(state['missing'])}"}
+        if not parts:
+            return {"error": "No chunks received"}
+        numbers = {part["part_number"] for part in parts}
+        gaps = [number for number in range(1, max(numbers)) if number not in numbers]
+        if gaps:
+            return {"error": f"Missing chunks: {_ranges(gaps)}"}
+        result = await self.complete_multipart_upload(
+            bucket_name, filename, upload_id, parts
+        )
+        if "error" not in result:
+            self.uploads.remove(upload_id, completed=True)
+        return result
+
+    async def abort_upload(self, bucket_name: str, filename: str, upload_id: str):
+        result = await self.abort_multipart_upload(bucket_name, filename, upload_id)
+        if "error" not in result:
+            self.uploads.remove(upload_id)
+        return result
+
+    async def reap_uploads(self):
+        """Abort resumable uploads nobody has touched for the session TTL, so
+        their parts don't take up backend storage forever"""
+        for session in self.uploads.stale():
+            key = (session.bucket_name, session.filename, session.upload_id)
+            # Chunks may have gone to another worker meanwhile, so the parts'
+            # upload times have the final say
+            result = await self._list_parts(*key)
+            if "error" not in result:
+                cutoff = datetime.now(timezone.utc).timestamp() - self.uploads.ttl
+                if any(
+                    part["last_modified"] and part["last_modified"].timestamp() > cutoff
+                    for part in result["parts"]
+                ):
+                    session.touch()
+                    continue
+                result = await self.abort_upload(*key)
+            if "error" in result and "NoSuchUpload" in result["error"]:
+                self.uploads.remove(session.upload_id)  # Already gone
+            elif "error" not in result:
+                self.uploads.reaped += 1
+
+    def _upload_state(self, session: UploadSession, parts: list):
+        state = {
+            "upload_id": session.upload_id,
+            "bucket": session.bucket_name,
+            "filename": session.filename,
+            "chunk_size": session.chunk_size,
+            "size": session.size,
+            "received_bytes": sum(part["size"] for part in parts),
+            "parts": [
+                {
+                    **part,
+                    # Where each chunk starts, when chunks are known to be equal
+                    "offset": (part["part_number"] - 1) * session.chunk_size
+                    if session.chunk_size
+                    else None,
+                }
+                for part in parts
+            ],
+        }
+        if session.chunk_count() is not None:
+            received = {part["part_number"] for part in parts}
+            state["missing"] = [
+                number
+                for number in range(1, session.chunk_count() + 1)
+                if number not in received
+            ]
+        return state
+
+    # Backends supporting resumable uploads implement these three, along with
+    # complete_multipart_upload and abort_multipart_upload
+    async def _create_upload(self, bucket_name, filename, content_type):
+        return {"error": f"{type(self).__name__} does not support resumable uploads"}
+
+    async def _upload_part(
+        self, bucket_name, filename, upload_id, part_number, data, content_md5
+    ):
+        return {"error": f"{type(self).__name__} does not support resumable uploads"}
+
+    async def _list_parts(self, bucket_name, filename, upload_id):
+        return {"error": f"{type(self).__name__} does not support resumable uploads"}
+
+
+def _ranges(numbers: list):
+    """e.g. "2-4, 7" for [2, 3, 4, 7]"""
+    spans = []
+    for number in numbers:
+        if spans and spans[-1][1] == number - 1:
+            spans[-1][1] = number
+        else:
+            spans.append([number, number])
+    return ", ".join(
+        str(first) if first == last else f"{first}-{last}" for first, last in spans
+    )
+
+
+def _modified(last_modified: str):
+    try:
+        return parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return datetime.now(timezone.utc)
@@ -1,8 +1,20 @@
+from config import config
+from filesystem_api import FileSystemAPI
+from routing import RoutingStorageAPI
 from s3_api import S3API
 
 
 def get_storage_api(storage_service="minio"):
     if storage_service in ["minio", "nebius", "aws"]:
-        return S3API()
+        if not config.OBJECT_STORAGE_BACKENDS and not config.OBJECT_STORAGE_ROUTES:
+            return S3API()
+        backends = {
+            name: S3API(**settings)
+            for name, settings in config.OBJECT_STORAGE_BACKENDS.items()
+        }
+        backends["default"] = S3API()
+        return RoutingStorageAPI(backends, config.OBJECT_STORAGE_ROUTES)
+    elif storage_service == "filesystem":
+        return FileSystemAPI()
     else:
         raise ValueError(f"Unsupported storage type: {storage_service}")
@@ -1,3 +1,4 @@
+import io
 import os
 import pytest
 from unittest.mock import Mock, patch
@@ -61,4 +62,6 @@ def mock_upload_file():
         return b"test content"
 
     mock_file.read = async_read
+    mock_file.file = io.BytesIO(b"test content")
+    mock_file.size = len(b"test content")
     return mock_file
\ No newline at end of file
@@ -0,0 +1,124 @@
+import io
+import tarfile
+import zipfile
+from datetime import datetime, timezone
+
+import pytest
+
+from archive import (
+    TarStreamWriter,
+    ZipStreamWriter,
+    guess_content_type,
+    iter_archive_members,
+)
+
+
+def make_zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def make_tar(entries, mode="w:gz"):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in entries.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+        directory = tarfile.TarInfo("empty-dir")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+    buffer.seek(0)
+    return buffer
+
+
+def read_members(fileobj, spool_size=1024):
+    members = {}
+    for name, file, size in iter_archive_members(fileobj, spool_size):
+        members[name] = file.read()
+        assert size == len(members[name])
+        file.close()
+    return members
+
+
+class TestIterArchiveMembers:
+
+    def test_zip_members(self):
+        """Test that zip members are yielded with their data, skipping directories"""
+        fileobj = make_zip({"a.txt": b"alpha", "dir/": b"", "dir/b.json": b"{}"})
+
+        assert read_members(fileobj) == {"a.txt": b"alpha", "dir/b.json": b"{}"}
+
+    @pytest.mark.parametrize("mode", ["w", "w:gz", "w:bz2"])
+    def test_tar_members(self, mode):
+        """Test that plain and compressed tar streams are read in order"""
+        fileobj = make_tar({"a.txt": b"alpha", "nested/b.bin": b"\x00" * 5000}, mode)
+
+        assert read_members(fileobj) == {"a.txt": b"alpha", "nested/b.bin": b"\x00" * 5000}
+
+    def test_large_members_spill_to_disk(self):
+        """Test that members above the spool size are not held in memory"""
+        fileobj = make_zip({"big.bin": b"x" * 4096})
+
+        name, file, size = next(iter_archive_members(fileobj, spool_size=1024))
+        assert file._rolled
+        file.close()
+
+    def test_paths_cannot_escape_root(self):
+        """Test that ./ and ../ segments are stripped from keys"""
+        fileobj = make_tar({"./a.txt": b"a", "../../etc/passwd": b"p"}, "w")
+
+        assert set(read_members(fileobj)) == {"a.txt", "etc/passwd"}
+
+    def test_not_an_archive(self):
+        """Test that garbage input raises ValueError"""
+        with pytest.raises(ValueError):
+            read_members(io.BytesIO(b"definitely not an archive"))
+
+    def test_guess_content_type(self):
+        """Test content type guessing for archive members"""
+        assert guess_content_type("a.json") == "application/json"
+        assert guess_content_type("no-extension") == "application/octet-stream"
+
+
+def write_archive(writer, entries):
+    output = io.BytesIO()
+    modified = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    for name, chunks in entries.items():
+        output.write(writer.begin(name, sum(len(c) for c in chunks), modified))
+        for chunk in chunks:
+            output.write(writer.write(chunk))
+        output.write(writer.end())
+    output.write(writer.close())
+    output.seek(0)
+    return output
+
+
+class TestStreamWriters:
+
+    def test_zip_stream_writer(self):
+        """Test that the streamed zip is readable and keeps entry order"""
+        entries = {"a.txt": [b"al", b"pha"], "dir/b.bin": [b"\x00" * 3000], "empty": []}
+        output = write_archive(ZipStreamWriter(), entries)
+
+        with zipfile.ZipFile(output) as archive:
+            assert archive.namelist() == ["a.txt", "dir/b.bin", "empty"]
+            assert archive.read("a.txt") == b"alpha"
+            assert archive.read("dir/b.bin") == b"\x00" * 3000
+            assert archive.getinfo("a.txt").date_time == (2023, 1, 1, 0, 0, 0)
+            assert archive.testzip() is None
+
+    def test_tar_stream_writer(self):
+        """Test that the streamed tar is readable with padded entries"""
+        entries = {"a.txt": [b"al", b"pha"], "a/very/" + "long/" * 30 + "name": [b"x" * 513]}
+        output = write_archive(TarStreamWriter(), entries)
+
+        assert len(output.getvalue()) % tarfile.BLOCKSIZE == 0
+        with tarfile.open(fileobj=output) as archive:
+            assert archive.getnames() == list(entries)
+            assert archive.extractfile("a.txt").read() == b"alpha"
+            assert archive.getmember("a.txt").mtime == datetime(2023, 1, 1, tzinfo=timezone.utc).timestamp()
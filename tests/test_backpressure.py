@@ -0,0 +1,189 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from minio.error import S3Error, ServerError
+
+from backpressure import AdaptiveLimit, Backpressure, is_throttled
+from storage_base import Overloaded, StorageAPI
+
+
+class ConcreteStorage(StorageAPI):
+    list_files = upload_file = download_file = stat_file = None
+    delete_file = create_bucket = None
+
+
+def s3_error(code):
+    return S3Error(response=Mock(), code=code, message="", resource="", request_id="", host_id="")
+
+
+def storage(retries=2):
+    api = ConcreteStorage()
+    api.backpressure = Backpressure(max_concurrency=4, max_queue=2, retries=retries, backoff=0)
+    return api
+
+
+class TestAdaptiveLimit:
+
+    def test_is_throttled(self):
+        """Test that throttling is recognised by error code, or status when there's no body"""
+        assert is_throttled(s3_error("SlowDown"))
+        assert is_throttled(ServerError("server failed with HTTP status code 503", 503))
+        assert not is_throttled(s3_error("NoSuchKey"))
+        assert not is_throttled(ServerError("server failed with HTTP status code 500", 500))
+
+    def test_aimd(self):
+        """Test that throttling halves the limit once per burst, down to the floor, and successes win it back"""
+        limit = AdaptiveLimit(max_limit=8, min_limit=2, cooldown=60)
+
+        limit.throttled()
+        limit.throttled()  # Same burst
+        assert limit.limit == 4
+
+        limit._last_decrease -= 60
+        limit.throttled()
+        limit._last_decrease -= 60
+        limit.throttled()
+        assert limit.limit == 2
+
+        for _ in range(5):
+            limit.succeeded(0.1)
+        assert 3 < limit.limit < 4
+        assert limit.stats()["throttled"] == 4
+
+    @pytest.mark.asyncio
+    async def test_queue(self):
+        """Test that requests over the limit wait their turn, and are refused once the queue is full"""
+        limit = AdaptiveLimit(max_limit=1, max_queue=2)
+        assert await limit.acquire()
+        first = asyncio.ensure_future(limit.acquire())
+        second = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0)
+
+        assert not await limit.acquire()
+        assert limit.stats() == {"limit": 1, "in_flight": 1, "queued": 2, "throttled": 0, "rejected": 1}
+
+        second.cancel()
+        await asyncio.sleep(0)
+        limit.release()
+        assert await first
+        assert limit.stats()["in_flight"] == 1
+        assert limit.stats()["queued"] == 0
+        assert 1 <= limit.retry_after() <= 60
+
+    def test_buckets_are_bounded(self):
+        """Test that limits at rest are forgotten first, then idle ones least recently used, and busy ones kept"""
+        backpressure = Backpressure(max_concurrency=4, max_buckets=3)
+        backpressure.limit("busy").in_flight = 1
+        backpressure.limit("throttled").limit = 2
+        backpressure.limit("rest")
+        backpressure.limit("new")
+        assert list(backpressure.stats()["buckets"]) == ["busy", "throttled", "new"]
+
+        backpressure.limit("throttled")
+        backpressure.limit("other").limit = 2
+        backpressure.limit("newest")
+        assert list(backpressure.stats()["buckets"]) == ["busy", "other", "newest"]
+        assert backpressure.limit("busy").in_flight == 1
+
+
+class TestBackpressuredCalls:
+
+    @pytest.mark.asyncio
+    async def test_throttled_reads_are_retried(self, mock_config):
+        """Test that idempotent calls are retried through throttling, which lowers the bucket's limit"""
+        api = storage()
+        func = Mock(side_effect=[s3_error("SlowDown"), s3_error("SlowDown"), "result"])
+
+        assert await api._call("get_object", func, "bucket", "a.txt", bucket="bucket") == "result"
+
+        assert func.call_count == 3
+        stats = api.backpressure.stats()
+        assert stats["retried"] == 2
+        assert stats["buckets"]["bucket"]["limit"] < 4
+        assert stats["buckets"]["bucket"]["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_persistent_throttling_is_overloaded(self, mock_config):
+        """Test that throttling outlasting the retries, or of calls that can't be repeated, raises Overloaded"""
+        api = storage(retries=1)
+        func = Mock(side_effect=s3_error("SlowDown"))
+
+        with pytest.raises(Overloaded) as raised:
+            await api._call("stat_object", func, "bucket", "a.txt", bucket="bucket")
+        assert func.call_count == 2
+        assert raised.value.retry_after >= 1
+
+        func.reset_mock()
+        with pytest.raises(Overloaded):
+            await api._call("put_object", func, "bucket", "a.txt", bucket="bucket")
+        func.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_other_errors_pass_through(self, mock_config):
+        """Test that errors other than throttling are raised as before, without retries"""
+        api = storage()
+        func = Mock(side_effect=s3_error("NoSuchKey"))
+
+        with pytest.raises(S3Error):
+            await api._call("get_object", func, "bucket", "a.txt", bucket="bucket")
+        func.assert_called_once()
+        assert api.backpressure.stats()["buckets"]["bucket"]["limit"] == 4
+
+    @pytest.mark.asyncio
+    async def test_full_queue_is_overloaded(self, mock_config):
+        """Test that calls beyond a bucket's queue are refused without reaching the backend, other buckets unaffected"""
+        api = storage()
+        limit = api.backpressure.limit("busy")
+        limit.in_flight = 4
+        waiting = [asyncio.ensure_future(limit.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+        func = Mock(return_value="result")
+
+        with pytest.raises(Overloaded):
+            await api._call("get_object", func, "busy", "a.txt", bucket="busy")
+        func.assert_not_called()
+        assert await api._call("get_object", func, "idle", "a.txt", bucket="idle") == "result"
+        for task in waiting:
+            task.cancel()
+
+    @pytest.mark.asyncio
+    async def test_s3_api_reports_backpressure(self, s3_api_with_mock):
+        """Test that S3 downloads go through the bucket's limit and show up in stats"""
+        api = s3_api_with_mock
+        api.backpressure.backoff = 0
+        response = Mock(headers={"Content-Length": "4"})
+        response.read.side_effect = [b"data", b""]
+        api.client.get_object.side_effect = [s3_error("SlowDown"), response]
+
+        result = await api.download_file("bucket", "a.txt")
+
+        assert "error" not in result
+        assert api.stats()["backpressure"]["retried"] == 1
+        assert api.stats()["backpressure"]["buckets"]["bucket"]["throttled"] == 1
+
+
+class TestOverloadedRoutes:
+
+    def test_overloaded_is_429(self, test_client):
+        """Test that clients are told to come back later instead of getting a 400"""
+        with patch("service.storage_api") as storage_api:
+            storage_api.download_file = AsyncMock(side_effect=Overloaded("Too many requests queued for bucket 'bucket'", 3))
+
+            response = test_client.get("/download/bucket/a.txt")
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "3"
+        assert response.json() == {"detail": "Too many requests queued for bucket 'bucket'"}
+
+    @pytest.mark.asyncio
+    async def test_batches_report_overloaded_per_item(self, mock_config):
+        """Test that one overloaded file in a batch upload fails alone"""
+        api = storage()
+        api.upload_file = AsyncMock(side_effect=[{"message": "File uploaded successfully"}, Overloaded("busy", 1)])
+        files = [Mock(filename=name, close=AsyncMock()) for name in ("a.txt", "b.txt")]
+
+        result = await api.upload_files("bucket", files)
+
+        assert result["uploaded"] == 1
+        assert result["failed"] == 1
@@ -0,0 +1,83 @@
+import io
+
+import pytest
+from minio import Minio
+
+from benchmarks.compare import compare
+from benchmarks.fake_s3 import FakeS3Server
+from benchmarks.run import format_size, parse_size, percentile
+
+
+class TestBenchmarkHelpers:
+
+    def test_sizes_round_trip(self):
+        """Test that sweep sizes parse and print in binary units"""
+        assert parse_size("1KB") == 1024
+        assert parse_size("1gb") == 1024**3
+        assert parse_size("512") == 512
+        assert format_size(parse_size("64MB")) == "64MB"
+        assert format_size(1500) == "1500B"
+
+    def test_percentile_nearest_rank(self):
+        """Test nearest-rank percentiles on unsorted samples"""
+        values = list(range(100, 0, -1))
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([7], 0.99) == 7
+        assert percentile([], 0.5) is None
+
+    def test_compare_flags_regressions(self):
+        """Test that slower throughput and higher p99 count as regressions past the threshold"""
+        def report(rps, p99):
+            return {"results": [{
+                "operation": "download", "size": 1024, "concurrency": 8,
+                "requests_per_second": rps, "p99_ms": p99, "peak_rss_bytes": 100,
+            }]}
+
+        rows = {row[1]: row for row in compare(report(100, 10), report(80, 10.5), threshold=10)}
+        assert rows["requests_per_second"][5] is True
+        assert rows["p99_ms"][5] is False
+        assert rows["peak_rss_bytes"][4] == 0
+
+
+class TestFakeS3:
+
+    @pytest.fixture
+    def client(self):
+        with FakeS3Server() as server:
+            yield Minio(server.endpoint, access_key="a", secret_key="b", secure=False, region="us-east-1")
+
+    def test_object_round_trip(self, client):
+        """Test that objects written through the minio client read back, including ranges"""
+        client.make_bucket("bucket")
+        client.put_object("bucket", "dir/a.txt", io.BytesIO(b"hello world"), length=11)
+
+        assert client.bucket_exists("bucket")
+        assert client.get_object("bucket", "dir/a.txt").read() == b"hello world"
+        assert client.get_object("bucket", "dir/a.txt", offset=6, length=3).read() == b"wor"
+        assert client.stat_object("bucket", "dir/a.txt").size == 11
+
+    def test_listing_and_multi_delete(self, client):
+        """Test delimiter listing, pagination and multi-object delete"""
+        from minio.deleteobjects import DeleteObject
+
+        client.make_bucket("bucket")
+        for name in ["a/1", "a/2", "b", "c"]:
+            client.put_object("bucket", name, io.BytesIO(b"x"), length=1)
+
+        top = {(o.object_name, o.is_dir) for o in client.list_objects("bucket")}
+        assert top == {("a/", True), ("b", False), ("c", False)}
+        assert [o.object_name for o in client.list_objects("bucket", recursive=True, start_after="a/2")] == ["b", "c"]
+
+        assert list(client.remove_objects("bucket", [DeleteObject("a/1"), DeleteObject("b")])) == []
+        assert [o.object_name for o in client.list_objects("bucket", recursive=True)] == ["a/2", "c"]
+
+    def test_multipart_upload(self, client):
+        """Test that uploads above the part size are assembled from their parts"""
+        client.make_bucket("bucket")
+        data = bytes(range(256)) * (6 * 1024 * 1024 // 256)
+
+        result = client.put_object("bucket", "big", io.BytesIO(data), length=len(data), part_size=5 * 1024 * 1024)
+
+        assert result.etag.endswith("-2")
+        assert client.get_object("bucket", "big").read() == data
@@ -0,0 +1,253 @@
+import asyncio
+import os
+from unittest.mock import patch
+
+import pytest
+
+from cache import MISSING, DiskCache, FileStream, MetadataCache, ObjectCache
+from storage_base import StorageError
+
+META = {"content_type": "text/plain", "etag": '"abc123"', "last_modified": None}
+
+
+def fill(cache, bucket_name, filename, data, meta=META):
+    token = cache.begin_fill(bucket_name, filename)
+    cache.put(bucket_name, filename, data, meta, token)
+
+
+class TestObjectCache:
+
+    def test_put_and_get(self):
+        """Test that a completed fill can be read back"""
+        cache = ObjectCache(max_bytes=100, max_object_size=50, ttl=30)
+        fill(cache, "bucket", "a", b"hello")
+
+        entry = cache.get("bucket", "a")
+        assert entry.data == b"hello"
+        assert entry.meta["etag"] == '"abc123"'
+        assert cache.stats()["bytes"] == 5
+
+    def test_evicts_least_recently_used_over_budget(self):
+        """Test that the byte budget evicts the least recently used entry"""
+        cache = ObjectCache(max_bytes=10, max_object_size=10, ttl=30)
+        fill(cache, "bucket", "a", b"aaaa")
+        fill(cache, "bucket", "b", b"bbbb")
+        cache.get("bucket", "a")  # Touch a so b becomes the LRU entry
+        fill(cache, "bucket", "c", b"cccc")
+
+        assert cache.get("bucket", "b") is None
+        assert cache.get("bucket", "a") is not None
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] == 8
+
+    def test_rejects_objects_over_size_cap(self):
+        """Test that objects above the per-object cap are not cached"""
+        cache = ObjectCache(max_bytes=100, max_object_size=4, ttl=30)
+        fill(cache, "bucket", "a", b"too big")
+
+        assert cache.get("bucket", "a") is None
+        assert not cache.accepts(5)
+
+    def test_invalidation_during_fill_discards_it(self):
+        """Test that an upload or delete racing a fill keeps the old body out"""
+        cache = ObjectCache(max_bytes=100, max_object_size=50, ttl=30)
+        token = cache.begin_fill("bucket", "a")
+        cache.invalidate("bucket", "a")
+        cache.put("bucket", "a", b"old", META, token)
+
+        assert cache.get("bucket", "a") is None
+
+    def test_invalidate_bucket(self):
+        """Test that invalidating a bucket drops all of its keys"""
+        cache = ObjectCache(max_bytes=100, max_object_size=50, ttl=30)
+        fill(cache, "bucket", "a", b"a")
+        fill(cache, "bucket", "b", b"b")
+        fill(cache, "other", "a", b"a")
+        cache.invalidate("bucket")
+
+        assert cache.get("bucket", "a") is None
+        assert cache.get("bucket", "b") is None
+        assert cache.get("other", "a") is not None
+        assert cache.stats()["bytes"] == 1
+
+    def test_staleness_and_revalidation(self):
+        """Test that entries go stale after the TTL and revalidate on a matching ETag"""
+        cache = ObjectCache(max_bytes=100, max_object_size=50, ttl=30)
+        with patch("cache.time.monotonic", return_value=0):
+            fill(cache, "bucket", "a", b"hello")
+        entry = cache.get("bucket", "a")
+
+        with patch("cache.time.monotonic", return_value=31):
+            assert cache.is_stale(entry)
+            assert cache.revalidate("bucket", "a", '"abc123"')
+            assert not cache.is_stale(entry)
+
+        assert not cache.revalidate("bucket", "a", '"changed"')
+        assert cache.get("bucket", "a") is None
+
+
+class TestMetadataCache:
+
+    def test_hit_until_ttl_expires(self):
+        """Test that entries are served until their TTL runs out"""
+        cache = MetadataCache(ttl=5, negative_ttl=1, max_entries=10)
+        with patch("cache.time.monotonic", return_value=0):
+            cache.put(("bucket", "a"), True)
+        with patch("cache.time.monotonic", return_value=4):
+            assert cache.get(("bucket", "a")) is True
+        with patch("cache.time.monotonic", return_value=6):
+            assert cache.get(("bucket", "a")) is MISSING
+        assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1}
+
+    def test_negative_entries_use_shorter_ttl(self):
+        """Test that missing buckets and keys are remembered only briefly"""
+        cache = MetadataCache(ttl=5, negative_ttl=1, max_entries=10)
+        with patch("cache.time.monotonic", return_value=0):
+            cache.put(("bucket", "a"), False, negative=True)
+        with patch("cache.time.monotonic", return_value=0.5):
+            assert cache.get(("bucket", "a")) is False
+        with patch("cache.time.monotonic", return_value=2):
+            assert cache.get(("bucket", "a")) is MISSING
+
+    def test_bounded_entries_and_invalidation(self):
+        """Test that the oldest entry is dropped past max_entries and invalidate removes keys"""
+        cache = MetadataCache(ttl=5, negative_ttl=1, max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.put("c", 3)
+        assert cache.get("a") is MISSING
+        cache.invalidate("b")
+        assert cache.get("b") is MISSING
+        assert cache.get("c") == 3
+
+
+def disk_fill(cache, bucket_name, filename, data, meta=META):
+    entry_fill, fd = cache.begin_fill(bucket_name, filename, len(data), meta)
+    os.write(fd, data)
+    os.close(fd)
+    entry_fill.advance(len(data))
+    cache.finish_fill(entry_fill)
+    return entry_fill
+
+
+async def run(func, *args):
+    return func(*args)
+
+
+async def read_all(stream):
+    return b"".join([chunk async for chunk in stream])
+
+
+class TestDiskCache:
+
+    def test_fill_and_get(self, tmp_path):
+        """Test that a completed fill is indexed with its metadata"""
+        cache = DiskCache(str(tmp_path), max_bytes=100, ttl=30)
+        disk_fill(cache, "bucket", "a", b"hello")
+
+        entry = cache.get("bucket", "a")
+        with open(entry.path, "rb") as f:
+            assert f.read() == b"hello"
+        assert entry.meta["etag"] == '"abc123"'
+        assert cache.stats()["bytes"] == 5
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+
+    def test_evicts_least_recently_used_over_budget(self, tmp_path):
+        """Test that the byte budget evicts the least recently used file"""
+        cache = DiskCache(str(tmp_path), max_bytes=10, ttl=30)
+        disk_fill(cache, "bucket", "a", b"aaaa")
+        disk_fill(cache, "bucket", "b", b"bbbb")
+        evicted = cache.get("bucket", "b").path
+        cache.get("bucket", "a")
+        disk_fill(cache, "bucket", "c", b"cccc")
+
+        assert cache.get("bucket", "b") is None
+        assert not os.path.exists(evicted)
+        assert cache.stats()["evictions"] == 1
+
+    def test_evicted_file_kept_until_readers_finish(self, tmp_path):
+        """Test that files being read are only removed once released"""
+        cache = DiskCache(str(tmp_path), max_bytes=100, ttl=30)
+        disk_fill(cache, "bucket", "a", b"aaaa")
+        entry = cache.get("bucket", "a")
+        cache.acquire(entry)
+
+        cache.invalidate("bucket", "a")
+        assert os.path.exists(entry.path)
+        cache.release(entry)
+        assert not os.path.exists(entry.path)
+
+    def test_invalidation_during_fill_discards_it(self, tmp_path):
+        """Test that a fill invalidated midway is never indexed"""
+        cache = DiskCache(str(tmp_path), max_bytes=100, ttl=30)
+        entry_fill, fd = cache.begin_fill("bucket", "a", 3, META)
+        os.write(fd, b"old")
+        os.close(fd)
+        cache.invalidate("bucket", "a")
+        cache.finish_fill(entry_fill)
+
+        assert cache.get("bucket", "a") is None
+        assert os.listdir(tmp_path) == []
+
+    def test_survives_restart(self, tmp_path):
+        """Test that the index is rebuilt from the directory, pending revalidation"""
+        cache = DiskCache(str(tmp_path), max_bytes=100, ttl=30)
+        disk_fill(cache, "bucket", "a", b"hello")
+        cache.begin_fill("bucket", "b", 5, META)  # Cut short by the restart
+
+        reloaded = DiskCache(str(tmp_path), max_bytes=100, ttl=30)
+        entry = reloaded.get("bucket", "a")
+        assert entry.size == 5
+        assert reloaded.is_stale(entry)
+        assert reloaded.get("bucket", "b") is None
+        assert len(os.listdir(tmp_path)) == 2  # Body and sidecar
+
+        assert not reloaded.revalidate("bucket", "a", '"changed"')
+        assert os.listdir(tmp_path) == []
+
+    @pytest.mark.asyncio
+    async def test_stream_follows_fill(self, tmp_path):
+        """Test that a reader streams a fill's bytes as they're written"""
+        cache = DiskCache(str(tmp_path), max_bytes=100, ttl=30)
+        entry_fill, fd = cache.begin_fill("bucket", "a", 6, META)
+        stream = FileStream(os.open(entry_fill.path, os.O_RDONLY), 0, 6, run, 4, fill=entry_fill)
+        reader = asyncio.create_task(read_all(stream))
+
+        for chunk in (b"abc", b"def"):
+            await asyncio.sleep(0)
+            os.write(fd, chunk)
+            entry_fill.advance(len(chunk))
+        os.close(fd)
+        cache.finish_fill(entry_fill)
+
+        assert await reader == b"abcdef"
+        assert stream.fd is None
+
+    @pytest.mark.asyncio
+    async def test_stream_fails_with_fill(self, tmp_path):
+        """Test that readers following a failed fill get an error instead of hanging"""
+        cache = DiskCache(str(tmp_path), max_bytes=100, ttl=30)
+        entry_fill, fd = cache.begin_fill("bucket", "a", 6, META)
+        os.close(fd)
+        stream = FileStream(os.open(entry_fill.path, os.O_RDONLY), 0, 6, run, 4, fill=entry_fill)
+        reader = asyncio.create_task(read_all(stream))
+        await asyncio.sleep(0)
+
+        cache.abort_fill(entry_fill, ConnectionError("backend went away"))
+
+        with pytest.raises(StorageError):
+            await reader
+
+    @pytest.mark.asyncio
+    async def test_unread_stream_released_on_close(self, tmp_path):
+        """Test that closing a stream that was never iterated releases its pin"""
+        cache = DiskCache(str(tmp_path), max_bytes=100, ttl=30)
+        disk_fill(cache, "bucket", "a", b"aaaa")
+        entry = cache.get("bucket", "a")
+        cache.acquire(entry)
+        stream = FileStream(
+            os.open(entry.path, os.O_RDONLY), 0, 4, run, 4, on_close=lambda: cache.release(entry)
+        )
+
+        await stream.aclose()
+        assert entry.readers == 0
@@ -0,0 +1,72 @@
+import io
+
+import pytest
+
+from compression import CODECS, CompressingReader, CompressionPolicy
+
+JSON = "application/json"
+
+
+class TestCompressionPolicy:
+
+    def test_disabled_without_buckets(self):
+        """Test nothing is compressed until a bucket is opted in"""
+        policy = CompressionPolicy([], ["*"], "gzip", 0)
+        assert policy.codec_for("logs", JSON, 10_000) is None
+
+    def test_matches_bucket_and_content_type(self):
+        """Test only listed buckets and matching content types are compressed"""
+        policy = CompressionPolicy(["logs"], ["text/*", JSON], "gzip", 1024)
+        assert policy.codec_for("logs", "text/csv; charset=utf-8", 10_000).name == "gzip"
+        assert policy.codec_for("logs", JSON, 10_000).name == "gzip"
+        assert policy.codec_for("logs", "image/png", 10_000) is None
+        assert policy.codec_for("photos", JSON, 10_000) is None
+        assert policy.codec_for("logs", None, 10_000) is None
+
+    def test_wildcard_bucket(self):
+        """Test "*" opts every bucket in"""
+        policy = CompressionPolicy(["*"], [JSON], "gzip", 0)
+        assert policy.codec_for("anything", JSON, 10) is not None
+
+    def test_small_or_unknown_size_stored_as_is(self):
+        """Test uploads below the minimum, or of unknown size, are left alone"""
+        policy = CompressionPolicy(["logs"], [JSON], "gzip", 1024)
+        assert policy.codec_for("logs", JSON, 1023) is None
+        assert policy.codec_for("logs", JSON, None) is None
+
+    def test_auto_prefers_zstd(self):
+        """Test "auto" picks zstd when it's installed and gzip otherwise"""
+        policy = CompressionPolicy(["logs"], [JSON], "auto", 0)
+        assert policy.codec.name == ("zstd" if "zstd" in CODECS else "gzip")
+
+    def test_unknown_codec(self):
+        """Test an unavailable codec is a configuration error"""
+        with pytest.raises(ValueError):
+            CompressionPolicy(["logs"], [JSON], "brotli", 0)
+
+
+class TestCompressingReader:
+
+    @pytest.mark.parametrize("name", sorted(CODECS))
+    def test_round_trip(self, name):
+        """Test reads of any size add up to a stream the codec decodes"""
+        data = b'{"event": "click"}\n' * 200_000
+        reader = CompressingReader(io.BytesIO(data), CODECS[name])
+
+        chunks = []
+        while chunk := reader.read(64 * 1024):
+            assert len(chunk) <= 64 * 1024
+            chunks.append(chunk)
+        compressed = b"".join(chunks)
+
+        assert len(compressed) < len(data) // 10
+        decompressor = CODECS[name].decompressor()
+        assert decompressor.decompress(compressed) + decompressor.flush() == data
+
+    def test_read_all(self):
+        """Test read() without a size drains the whole stream"""
+        reader = CompressingReader(io.BytesIO(b"abc" * 1000), CODECS["gzip"])
+        compressed = reader.read()
+        assert reader.read() == b""
+        decompressor = CODECS["gzip"].decompressor()
+        assert decompressor.decompress(compressed) == b"abc" * 1000
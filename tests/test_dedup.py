@@ -0,0 +1,167 @@
+import hashlib
+import io
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from minio.error import S3Error
+
+from dedup import ContentIndex, hash_file
+from s3_api import S3API
+
+CONTENT = b"the same bytes every time"
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+def upload(name, content=CONTENT, content_type="application/octet-stream"):
+    return Mock(filename=name, content_type=content_type, file=io.BytesIO(content), size=len(content))
+
+
+def s3_error(code):
+    return S3Error(response=Mock(), code=code, message="", resource="", request_id="", host_id="")
+
+
+@pytest.fixture
+def dedup_api(mock_config, mock_minio_client, tmp_path):
+    """S3API deduplicating uploads of any size to 'dedup'"""
+    from config import config
+
+    with patch.object(config, "OBJECT_STORAGE_DEDUP_BUCKETS", ["dedup"]), \
+            patch.object(config, "OBJECT_STORAGE_DEDUP_MIN_SIZE", 0), \
+            patch.object(config, "OBJECT_STORAGE_DEDUP_INDEX", str(tmp_path / "index.sqlite3")), \
+            patch("s3_api.Minio", return_value=mock_minio_client):
+        api = S3API()
+        mock_minio_client.put_object.return_value = Mock(etag="etag1")
+        yield api
+
+
+class TestContentIndex:
+
+    def test_put_get_discard(self, tmp_path):
+        """Test that entries are per scope, replaced by newer content, and only discarded while current"""
+        index = ContentIndex(str(tmp_path / "index.sqlite3"))
+        index.put("backend:9000", SHA256, "bucket", "a.bin", "etag1", 25, {"sha256": SHA256})
+
+        assert index.get("backend:9000", SHA256) == ("bucket", "a.bin", "etag1", 25, {"sha256": SHA256})
+        assert index.get("other:9000", SHA256) is None
+
+        index.put("backend:9000", SHA256, "bucket", "b.bin", "etag2", 25, {})
+        index.discard("backend:9000", SHA256, "etag1")
+        assert ContentIndex(str(tmp_path / "index.sqlite3")).get("backend:9000", SHA256).key == "b.bin"
+
+        index.discard("backend:9000", SHA256, "etag2")
+        assert index.get("backend:9000", SHA256) is None
+
+    def test_hash_file_rewinds(self):
+        """Test that the upload can be sent after being hashed"""
+        file = io.BytesIO(CONTENT)
+        file.read(4)
+
+        assert hash_file(file) == SHA256
+        assert file.read() == CONTENT
+
+
+class TestDedupUploads:
+
+    @pytest.mark.asyncio
+    async def test_repeated_content_is_copied(self, dedup_api):
+        """Test that the first upload is sent and indexed, and identical ones become copies of it"""
+        api = dedup_api
+
+        first = await api.upload_file("dedup", upload("a.bin"))
+        assert first == {"message": "File uploaded successfully", "sha256": SHA256, "deduplicated": False}
+        assert api.client.put_object.call_args.kwargs["metadata"] == {"sha256": SHA256}
+
+        second = await api.upload_file("dedup", upload("b.bin", content_type="image/png"))
+        assert second["deduplicated"] is True
+        api.client.put_object.assert_called_once()
+        args, kwargs = api.client.copy_object.call_args
+        assert args[:2] == ("dedup", "b.bin")
+        assert (args[2].bucket_name, args[2].object_name, args[2].match_etag) == ("dedup", "a.bin", "etag1")
+        assert kwargs["metadata"] == {"sha256": SHA256, "Content-Type": "image/png"}
+        assert api.stats()["dedup"] == {"deduplicated": 1, "bytes_saved": len(CONTENT), "stale": 0, "copy_errors": 0}
+
+    @pytest.mark.asyncio
+    async def test_stale_entries_fall_back_to_uploading(self, dedup_api):
+        """Test that content overwritten since it was indexed is uploaded again and re-indexed"""
+        api = dedup_api
+        await api.upload_file("dedup", upload("a.bin"))
+        api.client.copy_object.side_effect = s3_error("PreconditionFailed")
+        api.client.put_object.return_value = Mock(etag="etag2")
+
+        result = await api.upload_file("dedup", upload("b.bin"))
+
+        assert result["deduplicated"] is False
+        assert api.client.put_object.call_count == 2
+        assert api.content_index.get(api.endpoint, SHA256).key == "b.bin"
+        assert api.stats()["dedup"]["stale"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_copies_fall_back_to_uploading(self, dedup_api):
+        """Test that copies refused for other reasons send the bytes and keep the entry"""
+        api = dedup_api
+        await api.upload_file("dedup", upload("a.bin"))
+        api.client.copy_object.side_effect = s3_error("AccessDenied")
+
+        result = await api.upload_file("dedup", upload("b.bin"))
+
+        assert result["deduplicated"] is False
+        assert api.client.put_object.call_count == 2
+        assert api.stats()["dedup"]["copy_errors"] == 1
+        assert api.stats()["dedup"]["stale"] == 0
+
+    def test_default_index_is_per_backend(self):
+        """Test that backends or credentials sharing a host get separate index files"""
+        from dedup import default_index_path
+
+        assert default_index_path("a:9000", "key") == default_index_path("a:9000", "key")
+        assert default_index_path("a:9000", "key") != default_index_path("b:9000", "key")
+        assert default_index_path("a:9000", "key") != default_index_path("a:9000", "other")
+
+    @pytest.mark.asyncio
+    async def test_other_buckets_and_small_files_are_sent(self, dedup_api):
+        """Test that uploads outside the configured buckets aren't hashed or reported"""
+        api = dedup_api
+
+        result = await api.upload_file("plain", upload("a.bin"))
+
+        assert result == {"message": "File uploaded successfully"}
+        assert api.client.put_object.call_args.kwargs["metadata"] is None
+        assert api.content_index.get(api.endpoint, SHA256) is None
+
+    @pytest.mark.asyncio
+    async def test_upload_by_hash(self, dedup_api):
+        """Test that known hashes are copied without a body, and unknown ones ask for the upload"""
+        api = dedup_api
+
+        assert await api.upload_by_hash("dedup", "a.bin", SHA256) == {"sha256": SHA256, "deduplicated": False}
+        assert "error" in await api.upload_by_hash("dedup", "a.bin", "not-a-hash")
+        assert "error" in await api.upload_by_hash("plain", "a.bin", SHA256)
+
+        await api.upload_file("dedup", upload("a.bin"))
+        result = await api.upload_by_hash("dedup", "b.bin", SHA256, "text/plain")
+        assert result["deduplicated"] is True
+        assert api.client.copy_object.call_args.kwargs["metadata"]["Content-Type"] == "text/plain"
+
+    @pytest.mark.asyncio
+    async def test_unsupported_backend(self, mock_config, tmp_path):
+        """Test that backends without server-side copies say so"""
+        from filesystem_api import FileSystemAPI
+
+        api = FileSystemAPI(str(tmp_path), fsync=False)
+
+        result = await api.upload_by_hash("bucket", "a.bin", SHA256)
+        assert result == {"error": "FileSystemAPI does not support deduplication"}
+
+
+class TestDedupRoutes:
+
+    def test_upload_by_hash_route(self, test_client):
+        """Test that copies are returned, and misses are a 404 telling the client to upload"""
+        with patch("service.storage_api") as storage_api:
+            storage_api.upload_by_hash = AsyncMock(return_value={"sha256": SHA256, "deduplicated": True})
+            response = test_client.post(f"/upload/bucket/by-hash/a.bin?sha256={SHA256.upper()}&content_type=text/plain")
+            assert response.status_code == 200
+            storage_api.upload_by_hash.assert_awaited_once_with("bucket", "a.bin", SHA256, "text/plain")
+
+            storage_api.upload_by_hash = AsyncMock(return_value={"sha256": SHA256, "deduplicated": False})
+            assert test_client.post(f"/upload/bucket/by-hash/a.bin?sha256={SHA256}").status_code == 404
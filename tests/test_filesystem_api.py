@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import io
+import os
+from unittest.mock import patch
+
+import pytest
+from starlette.datastructures import Headers, UploadFile
+
+from filesystem_api import FileSystemAPI
+
+
+def upload(name, data=b"data", content_type="text/plain"):
+    return UploadFile(io.BytesIO(data), size=len(data), filename=name, headers=Headers({"content-type": content_type}))
+
+
+async def read_all(result):
+    return b"".join([chunk async for chunk in result["body"]])
+
+
+async def list_all(api, bucket_name, **kwargs):
+    names, token = [], None
+    while True:
+        page = await api.list_files(bucket_name, continuation_token=token, **kwargs)
+        names += page["prefixes"] + [file["name"] for file in page["files"]]
+        if not page["is_truncated"]:
+            return names
+        token = page["next_continuation_token"]
+
+
+@pytest.fixture
+def api(mock_config, tmp_path):
+    return FileSystemAPI(str(tmp_path), fsync=False)
+
+
+@pytest.fixture
+def bucket(api):
+    asyncio.run(api.create_bucket("test-bucket"))
+    return "test-bucket"
+
+
+class TestFileSystemAPI:
+
+    @pytest.mark.asyncio
+    async def test_create_bucket(self, api):
+        """Test that buckets are created once, with S3's naming rules"""
+        assert await api.create_bucket("test-bucket") == {"message": "Bucket 'test-bucket' created successfully"}
+        assert await api.create_bucket("test-bucket") == {"message": "Bucket 'test-bucket' already exists"}
+        assert "error" in await api.create_bucket("../etc")
+        assert "error" in await api.create_bucket("No")
+
+    @pytest.mark.asyncio
+    async def test_upload_and_download(self, api, bucket):
+        """Test that an upload reads back whole, with S3's ETag and a path to send it from"""
+        data = os.urandom(3000)
+
+        result = await api.upload_file(bucket, upload("dir/a.bin", data, "application/octet-stream"))
+        assert result["etag"] == f'"{hashlib.md5(data).hexdigest()}"'
+
+        result = await api.download_file(bucket, "dir/a.bin")
+        assert result["content_length"] == 3000
+        assert result["content_type"] == "application/octet-stream"
+        assert result["etag"] == f'"{hashlib.md5(data).hexdigest()}"'
+        with open(result["path"], "rb") as f:
+            assert f.read() == data
+        assert await read_all(result) == data
+        assert api.stats()["filesystem"]["open_files"] == 0
+
+        stat = await api.stat_file(bucket, "dir/a.bin")
+        assert stat["size"] == 3000
+        assert stat["last_modified"].endswith("GMT")
+
+    @pytest.mark.asyncio
+    async def test_download_range(self, api, bucket):
+        """Test that ranges are read from the file, clipped to its end"""
+        await api.upload_file(bucket, upload("a.txt", b"0123456789"))
+
+        result = await api.download_file(bucket, "a.txt", offset=2, length=3)
+        assert "path" not in result
+        assert await read_all(result) == b"234"
+
+        result = await api.download_file(bucket, "a.txt", offset=8, length=10)
+        assert result["content_length"] == 2
+        assert await read_all(result) == b"89"
+
+        assert "InvalidRange" in (await api.download_file(bucket, "a.txt", offset=10))["error"]
+
+    @pytest.mark.asyncio
+    async def test_missing(self, api, bucket):
+        """Test that missing keys and buckets are reported as errors"""
+        assert "NoSuchKey" in (await api.download_file(bucket, "missing.txt"))["error"]
+        assert "NoSuchKey" in (await api.stat_file(bucket, "missing.txt"))["error"]
+        assert "does not exist" in (await api.upload_file("other-bucket", upload("a.txt")))["error"]
+        assert "does not exist" in (await api.list_files("other-bucket"))["error"]
+
+    @pytest.mark.asyncio
+    async def test_overwrite_while_downloading(self, api, bucket):
+        """Test that a download in progress keeps reading what it opened"""
+        await api.upload_file(bucket, upload("a.txt", b"old"))
+        result = await api.download_file(bucket, "a.txt")
+        old_path = result["path"]
+
+        await api.upload_file(bucket, upload("a.txt", b"new"))
+
+        assert await read_all(await api.download_file(bucket, "a.txt")) == b"new"
+        assert os.path.exists(old_path)  # Still pinned by the first download
+        assert await read_all(result) == b"old"
+        api.executor.shutdown(wait=True)  # Let the removal run
+        assert not os.path.exists(old_path)
+
+    @pytest.mark.asyncio
+    async def test_list_files(self, api, bucket):
+        """Test that listings are ordered, paginated, and group keys under common prefixes"""
+        for name in ["a.txt", "b/1.txt", "b/2.txt", "b/c/3.txt", "bz.txt", "c.txt"]:
+            await api.upload_file(bucket, upload(name))
+
+        assert await list_all(api, bucket, recursive=True, max_keys=2) == [
+            "a.txt", "b/1.txt", "b/2.txt", "b/c/3.txt", "bz.txt", "c.txt"
+        ]
+        assert await list_all(api, bucket, max_keys=1) == ["a.txt", "b/", "bz.txt", "c.txt"]
+        assert await list_all(api, bucket, prefix="b/") == ["b/c/", "b/1.txt", "b/2.txt"]
+        assert await list_all(api, bucket, prefix="b") == ["b/", "bz.txt"]
+
+        page = await api.list_files(bucket, prefix="b/", recursive=True)
+        assert page["files"][0] == {"name": "b/1.txt", "size": 4, "last_modified": page["files"][0]["last_modified"]}
+
+    @pytest.mark.asyncio
+    async def test_delete(self, api, bucket):
+        """Test that deletes remove the key and its file, and bulk deletes work by prefix"""
+        for name in ["a.txt", "logs/1.txt", "logs/2.txt"]:
+            await api.upload_file(bucket, upload(name))
+        path = (await api.download_file(bucket, "a.txt"))["path"]
+
+        assert await api.delete_file(bucket, "a.txt") == {"message": "File deleted successfully"}
+        assert await api.delete_file(bucket, "a.txt") == {"message": "File deleted successfully"}
+        result = await api.delete_files(bucket, prefix="logs/")
+        deleted = [entry async for entry in result["results"]]
+
+        assert sorted(entry["name"] for entry in deleted) == ["logs/1.txt", "logs/2.txt"]
+        assert await list_all(api, bucket, recursive=True) == []
+        api.executor.shutdown(wait=True)
+        assert os.path.exists(path)  # Its download was never closed
+
+    @pytest.mark.asyncio
+    async def test_copy_and_move(self, api, bucket):
+        """Test that copies share the source's data and outlive it"""
+        await api.create_bucket("archive")
+        await api.upload_file(bucket, upload("a.txt", b"hello"))
+
+        result = await api.copy_file(bucket, "a.txt", "archive", "b.txt")
+        assert result["message"] == "File copied successfully"
+        copy_path = (await api.download_file("archive", "b.txt"))["path"]
+        assert os.stat(copy_path).st_nlink == 2
+
+        assert (await api.move_file(bucket, "a.txt", bucket, "c.txt"))["message"] == "File moved successfully"
+        await api.delete_file(bucket, "c.txt")
+
+        assert await read_all(await api.download_file("archive", "b.txt")) == b"hello"
+        assert "NoSuchKey" in (await api.copy_file(bucket, "a.txt", "archive", "d.txt"))["error"]
+        assert "does not exist" in (await api.copy_file("archive", "b.txt", "missing", "d.txt"))["error"]
+
+    @pytest.mark.asyncio
+    async def test_reopen(self, mock_config, tmp_path):
+        """Test that objects are found again after a restart, and stale partial uploads are removed"""
+        api = FileSystemAPI(str(tmp_path), fsync=False)
+        await api.create_bucket("test-bucket")
+        await api.upload_file("test-bucket", upload("a.txt", b"kept"))
+        partial = tmp_path / ".tmp" / "partial"
+        partial.write_bytes(b"x")
+        os.utime(partial, (0, 0))
+
+        api = FileSystemAPI(str(tmp_path), fsync=True)
+
+        assert await read_all(await api.download_file("test-bucket", "a.txt")) == b"kept"
+        assert not partial.exists()
+
+
+class TestFileSystemService:
+
+    def test_download_routes(self, api, test_client):
+        """Test that the service sends whole objects from their file and ranges from the backend"""
+        asyncio.run(api.create_bucket("test-bucket"))
+        asyncio.run(api.upload_file("test-bucket", upload("a.txt", b"0123456789")))
+
+        with patch("service.storage_api", api):
+            response = test_client.get("/download/test-bucket/a.txt")
+            assert response.status_code == 200
+            assert response.content == b"0123456789"
+            assert response.headers["etag"] == f'"{hashlib.md5(b"0123456789").hexdigest()}"'
+
+            response = test_client.get("/download/test-bucket/a.txt", headers={"Range": "bytes=2-4"})
+            assert response.status_code == 206
+            assert response.content == b"234"
+
+        assert api.stats()["filesystem"]["open_files"] == 0
+
+    def test_prefixed_uploads_are_reachable(self, api, test_client):
+        """Test that keys a batch upload created under a prefix can be downloaded, copied and deleted one by one"""
+        asyncio.run(api.create_bucket("test-bucket"))
+
+        with patch("service.storage_api", api):
+            response = test_client.post(
+                "/upload/test-bucket/batch?prefix=nested/dir/", files=[("files", ("b.bin", b"0123456789"))]
+            )
+            assert response.json()["uploaded"] == 1
+
+            response = test_client.get("/download/test-bucket/nested/dir/b.bin")
+            assert response.status_code == 200
+            assert response.content == b"0123456789"
+
+            assert test_client.post("/copy/test-bucket/nested/dir/b.bin?to=nested/c.bin").status_code == 200
+            assert test_client.delete("/delete/test-bucket/nested/dir/b.bin").status_code == 200
+            assert test_client.get("/download/test-bucket/nested/dir/b.bin").status_code == 400
+            assert test_client.get("/download/test-bucket/nested/c.bin").content == b"0123456789"
+
+
+    def test_bulk_delete_refuses_empty_prefix(self, api, test_client):
+        """Test that {"prefix": ""} is a 400 and leaves the bucket alone"""
+        asyncio.run(api.create_bucket("test-bucket"))
+        asyncio.run(api.upload_file("test-bucket", upload("a.txt")))
+
+        with patch("service.storage_api", api):
+            response = test_client.post("/delete/test-bucket", json={"prefix": ""})
+
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Prefix must not be empty"}
+        assert asyncio.run(list_all(api, "test-bucket")) == ["a.txt"]
+
+
+class TestStorageFactoryFileSystem:
+
+    def test_get_storage_api_filesystem(self, mock_config, tmp_path):
+        """Test that the filesystem service needs no S3 backend"""
+        from config import config
+        from storage_factory import get_storage_api
+
+        with patch.object(config, "OBJECT_STORAGE_ROOT", str(tmp_path), create=True), \
+                patch.object(config, "OBJECT_STORAGE_FSYNC", False, create=True):
+            api = get_storage_api("filesystem")
+
+        assert isinstance(api, FileSystemAPI)
+        assert api.root == str(tmp_path)
@@ -0,0 +1,109 @@
+import pytest
+
+from http_headers import (
+    accepts_encoding,
+    etag_matches,
+    is_not_modified,
+    parse_range_header,
+    range_still_valid,
+)
+
+STAT = {
+    "size": 1000,
+    "etag": '"abc123"',
+    "last_modified": "Sun, 01 Jan 2023 00:00:00 GMT",
+}
+
+
+class TestParseRangeHeader:
+
+    def test_single_range(self):
+        """Test a closed byte range"""
+        assert parse_range_header("bytes=0-99", 1000) == [(0, 99)]
+
+    def test_open_ended_range(self):
+        """Test a range without an end runs to the last byte"""
+        assert parse_range_header("bytes=900-", 1000) == [(900, 999)]
+
+    def test_suffix_range(self):
+        """Test a suffix range selects the last N bytes"""
+        assert parse_range_header("bytes=-100", 1000) == [(900, 999)]
+        assert parse_range_header("bytes=-5000", 1000) == [(0, 999)]
+
+    def test_end_clamped_to_size(self):
+        """Test an end past the object is clamped"""
+        assert parse_range_header("bytes=500-5000", 1000) == [(500, 999)]
+
+    def test_multiple_ranges_sorted_and_merged(self):
+        """Test multi-range requests are sorted and overlapping ranges merged"""
+        assert parse_range_header("bytes=500-599, 0-9, 5-20", 1000) == [(0, 20), (500, 599)]
+
+    def test_unsatisfiable(self):
+        """Test a range starting past the end is unsatisfiable"""
+        assert parse_range_header("bytes=1000-", 1000) == []
+        assert parse_range_header("bytes=0-0", 0) == []
+
+    @pytest.mark.parametrize("header", ["items=0-1", "bytes=", "bytes=a-b", "bytes=5-1", "bytes=5"])
+    def test_malformed_is_ignored(self, header):
+        """Test malformed headers are ignored so the full object is served"""
+        assert parse_range_header(header, 1000) is None
+
+    def test_too_many_ranges_is_ignored(self):
+        """Test that excessive multi-range requests fall back to a full response"""
+        header = "bytes=" + ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(50))
+        assert parse_range_header(header, 1000) is None
+
+
+class TestConditionals:
+
+    def test_etag_matches_weak_and_lists(self):
+        """Test If-None-Match uses weak comparison and accepts lists"""
+        assert etag_matches('W/"abc123"', '"abc123"')
+        assert etag_matches('"other", "abc123"', '"abc123"')
+        assert etag_matches("*", '"abc123"')
+        assert not etag_matches('"other"', '"abc123"')
+
+    def test_not_modified_by_etag(self):
+        """Test If-None-Match answers 304 for a matching ETag"""
+        assert is_not_modified(STAT, if_none_match='"abc123"')
+        assert not is_not_modified(STAT, if_none_match='"stale"')
+
+    def test_if_none_match_takes_precedence(self):
+        """Test If-Modified-Since is ignored when If-None-Match is present"""
+        assert not is_not_modified(
+            STAT, if_none_match='"stale"', if_modified_since="Mon, 01 Jan 2024 00:00:00 GMT"
+        )
+
+    def test_not_modified_by_date(self):
+        """Test If-Modified-Since compares against Last-Modified"""
+        assert is_not_modified(STAT, if_modified_since="Sun, 01 Jan 2023 00:00:00 GMT")
+        assert not is_not_modified(STAT, if_modified_since="Sat, 31 Dec 2022 00:00:00 GMT")
+        assert not is_not_modified(STAT, if_modified_since="not a date")
+
+    def test_range_still_valid(self):
+        """Test If-Range accepts only a strong matching validator"""
+        assert range_still_valid(STAT, '"abc123"')
+        assert not range_still_valid(STAT, 'W/"abc123"')
+        assert not range_still_valid(STAT, '"stale"')
+        assert range_still_valid(STAT, "Sun, 01 Jan 2023 00:00:00 GMT")
+
+
+class TestAcceptsEncoding:
+
+    def test_listed_encoding(self):
+        """Test a listed encoding is accepted, case-insensitively"""
+        assert accepts_encoding("gzip, deflate, br", "gzip")
+        assert accepts_encoding("GZIP", "gzip")
+        assert not accepts_encoding("deflate, br", "gzip")
+        assert not accepts_encoding(None, "gzip")
+
+    def test_quality_zero_refuses(self):
+        """Test q=0 rules an encoding out, even when a wildcard allows the rest"""
+        assert accepts_encoding("zstd;q=0.5", "zstd")
+        assert not accepts_encoding("gzip;q=0", "gzip")
+        assert not accepts_encoding("*, gzip;q=0", "gzip")
+
+    def test_wildcard(self):
+        """Test "*" accepts encodings that aren't listed"""
+        assert accepts_encoding("br, *", "zstd")
+        assert not accepts_encoding("*;q=0", "zstd")
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_s3 import FakeS3Server
+from http_pool import make_pool_manager
+
+
+def pool_config(**overrides):
+    settings = {
+        "OBJECT_STORAGE_POOL_SIZE": 2,
+        "OBJECT_STORAGE_POOL_BLOCK": False,
+        "OBJECT_STORAGE_CONNECT_TIMEOUT": 5,
+        "OBJECT_STORAGE_READ_TIMEOUT": 5,
+        "OBJECT_STORAGE_MAX_RETRIES": 0,
+        "OBJECT_STORAGE_RETRY_BACKOFF": 0,
+        "OBJECT_STORAGE_TCP_KEEPALIVE": True,
+    }
+    settings.update(overrides)
+    return SimpleNamespace(**settings)
+
+
+class TestPoolManager:
+
+    @pytest.fixture
+    def server(self):
+        with FakeS3Server() as server:
+            yield server
+
+    def test_settings_are_applied(self):
+        """Test that pool size, timeouts and retries come from the config"""
+        manager, stats = make_pool_manager(pool_config(OBJECT_STORAGE_MAX_RETRIES=3))
+
+        assert manager.connection_pool_kw["maxsize"] == 2
+        assert manager.connection_pool_kw["timeout"].connect_timeout == 5
+        assert manager.connection_pool_kw["retries"].total == 3
+        assert stats.snapshot()["max_size"] == 2
+
+    def test_connections_are_reused(self, server):
+        """Test that sequential requests check out the same kept-alive connection"""
+        manager, stats = make_pool_manager(pool_config())
+
+        for _ in range(3):
+            assert manager.request("HEAD", f"http://{server.endpoint}/missing").status == 404
+
+        snapshot = stats.snapshot()
+        assert snapshot["checkouts"] == 3
+        assert snapshot["connections_created"] == 1
+        assert snapshot["in_use"] == 0
+        assert snapshot["overflows"] == 0
+
+    def test_overflow_is_counted(self, server):
+        """Test that holding more connections than the pool size shows up as overflow"""
+        manager, stats = make_pool_manager(pool_config())
+
+        responses = [
+            manager.request("GET", f"http://{server.endpoint}/missing", preload_content=False)
+            for _ in range(3)
+        ]
+        assert stats.snapshot()["in_use"] == 3
+        assert stats.snapshot()["max_in_use"] == 3
+        for response in responses:
+            response.release_conn()
+
+        snapshot = stats.snapshot()
+        assert snapshot["overflows"] == 1
+        assert snapshot["in_use"] == 0
@@ -0,0 +1,145 @@
+import asyncio
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+
+from cache import DiskCache, ObjectCache, claim_directory
+from invalidation import FLUSH, InvalidationChannel, caches_unshared
+
+
+def start(directory, pid):
+    """A started channel bound as if it ran in process `pid`"""
+    channel = InvalidationChannel(str(directory))
+    with patch("invalidation.os.getpid", return_value=pid):
+        channel.start()
+    return channel
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0.01)
+
+
+class TestInvalidationChannel:
+
+    @pytest.mark.asyncio
+    async def test_publish_reaches_other_workers(self, tmp_path):
+        """Test that keys published by one worker reach the others' callbacks, in one message"""
+        a, b, c = (start(tmp_path, pid) for pid in (1, 2, 3))
+        seen_b, seen_c = [], []
+        b.subscribe("backend:9000", lambda *key: seen_b.append(key))
+        c.subscribe("backend:9000", lambda *key: seen_c.append(key))
+        c.subscribe("other:9000", lambda *key: seen_c.append(("other", *key)))
+
+        a.publish("backend:9000", "bucket", "a.txt")
+        a.publish("backend:9000", "bucket", "dir/b\nc.txt")
+        a.publish("backend:9000", "new-bucket")
+        await settle()
+
+        assert seen_b == seen_c == [("bucket", "a.txt"), ("bucket", "dir/b\nc.txt"), ("new-bucket", None)]
+        assert a.stats() == {"peers": 2, "sent": 2, "received": 0, "flushes_sent": 0}
+        assert b.stats()["received"] == 1
+        for channel in (a, b, c):
+            channel.stop()
+        assert os.listdir(tmp_path) == []
+
+    @pytest.mark.asyncio
+    async def test_dead_workers_are_cleaned_up(self, tmp_path):
+        """Test that sockets left by exited workers are removed instead of retried"""
+        a = start(tmp_path, 1)
+        b = start(tmp_path, 2)
+        b._socket.close()  # Exited without cleaning up
+
+        a.publish("scope", "bucket", "a.txt")
+        await settle()
+
+        assert os.listdir(tmp_path) == ["1.sock"]
+        a.stop()
+
+    @pytest.mark.asyncio
+    async def test_full_peer_gets_a_flush(self, tmp_path):
+        """Test that a worker that couldn't take a message is told to expire everything"""
+        a = start(tmp_path, 1)
+        b = start(tmp_path, 2)
+        seen = []
+        b.subscribe("scope", lambda *key: seen.append(key))
+        real_socket = a._socket
+        sent = []
+
+        def sendto(message, peer):
+            if not sent:
+                sent.append(None)
+                raise BlockingIOError
+            sent.append(message)
+            return real_socket.sendto(message, peer)
+
+        a._socket = Mock(wraps=real_socket, sendto=sendto, fileno=real_socket.fileno)
+
+        a.publish("scope", "bucket", "a.txt")
+        a.publish("scope", "bucket", "b.txt")
+        await asyncio.sleep(0.1)
+
+        assert sent == [None, FLUSH]
+        assert seen == [(None, None)]
+        assert a.stats()["flushes_sent"] == 1
+        a._socket = real_socket
+        a.stop()
+        b.stop()
+
+
+class TestWorkerCaches:
+
+    def test_caches_unshared(self):
+        """Test that only caching workers of a supervisor that weren't told the worker count are flagged"""
+        config = Mock(
+            OBJECT_STORAGE_WORKERS=1, OBJECT_STORAGE_METADATA_TTL=5,
+            OBJECT_STORAGE_CACHE_MAX_BYTES=0, OBJECT_STORAGE_DISK_CACHE_DIR="",
+        )
+        with patch("os.getpgrp", return_value=os.getpid() - 1):
+            assert caches_unshared(config)
+            config.OBJECT_STORAGE_METADATA_TTL = 0
+            assert not caches_unshared(config)
+            config.OBJECT_STORAGE_CACHE_MAX_BYTES = 1024
+            config.OBJECT_STORAGE_WORKERS = 4
+            assert not caches_unshared(config)
+        config.OBJECT_STORAGE_WORKERS = 1
+        with patch("os.getpgrp", return_value=os.getpid()):  # Started from a shell
+            assert not caches_unshared(config)
+
+    def test_expire_forces_revalidation(self, tmp_path):
+        """Test that expired entries stay cached but are revalidated before use"""
+        cache = ObjectCache(1024, 1024, ttl=60)
+        cache.put("bucket", "a.txt", b"data", {"etag": '"e"'}, cache.begin_fill("bucket", "a.txt"))
+        in_flight = cache.begin_fill("bucket", "b.txt")
+        disk = DiskCache(str(tmp_path), 1024, ttl=60)
+
+        cache.expire()
+        disk.expire()
+
+        assert cache.is_stale(cache.get("bucket", "a.txt"))
+        assert not cache.end_fill("bucket", "b.txt", in_flight)
+
+    def test_claim_directory(self, tmp_path):
+        """Test that each claim gets a directory of its own"""
+        first = claim_directory(str(tmp_path))
+        second = claim_directory(str(tmp_path))
+
+        assert (first, second) == (str(tmp_path / "worker-0"), str(tmp_path / "worker-1"))
+        DiskCache(str(tmp_path), 1024, ttl=60)  # Leaves worker directories alone
+
+    @pytest.mark.asyncio
+    async def test_s3_api_publishes_writes(self, s3_api_with_mock):
+        """Test that writes are published and published writes drop cached entries"""
+        api = s3_api_with_mock
+        api.peers = Mock()
+        api.metadata_cache.put(("stat", "bucket", "a.txt"), {"size": 1})
+        api.metadata_cache.put(("bucket", "bucket"), False, negative=True)
+
+        api._invalidate("bucket", "b.txt")
+        api.peers.publish.assert_called_once_with(api.endpoint, "bucket", "b.txt")
+
+        api._forget_published("bucket", "a.txt")
+        api._forget_published("bucket", None)
+        assert api.metadata_cache.stats()["entries"] == 0
+        api.peers.publish.assert_called_once()  # Not published again
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+from unittest.mock import Mock, patch
+
+import httpx
+import pytest
+from minio import Minio
+
+from s3_api import S3API
+from service import app
+
+HOLD_TIMEOUT = 2  # Seconds a backend call waits for the others before giving up
+REQUESTS_PER_LEVEL = 16
+
+
+class BlockingBackend:
+    """Minio mock whose listings block in their thread until `target` of them
+    have been in flight at once, recording the most that ever were.
+
+    Calls that can't overlap, e.g. because the event loop is blocked, each
+    wait out HOLD_TIMEOUT instead and leave the maximum at 1.
+    """
+
+    def __init__(self):
+        self.target = 1
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._condition = threading.Condition()
+        self.client = Mock(spec=Minio)
+        self.client.bucket_exists.return_value = True
+        self.client.list_objects.side_effect = self.list_objects
+
+    def list_objects(self, bucket_name, **kwargs):
+        # Like minio, the request only happens once the generator is iterated
+        with self._condition:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self._condition.notify_all()
+            self._condition.wait_for(lambda: self.max_in_flight >= self.target, HOLD_TIMEOUT)
+            self.in_flight -= 1
+        yield from ()
+
+
+async def max_concurrent_calls(client, backend, concurrency):
+    """Send REQUESTS_PER_LEVEL list requests with `concurrency` clients, return
+    the most backend calls that were in flight at once"""
+    backend.target, backend.max_in_flight = concurrency, 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request(number):
+        async with semaphore:
+            # Distinct prefixes, so single-flight doesn't merge the listings
+            response = await client.get(f"/list/test-bucket?prefix={number}/")
+            assert response.status_code == 200
+
+    await asyncio.gather(*(one_request(number) for number in range(REQUESTS_PER_LEVEL)))
+    return backend.max_in_flight
+
+
+class TestLoad:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_clients_reach_the_backend_concurrently(self, mock_config):
+        """Test that blocking backend calls no longer serialize concurrent requests"""
+        backend = BlockingBackend()
+        with patch('s3_api.Minio', return_value=backend.client):
+            api = S3API()
+
+        transport = httpx.ASGITransport(app=app)
+        with patch('service.storage_api', api):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                for concurrency in (1, 4, 16):
+                    # A blocked event loop would never have more than one call in flight
+                    assert await max_concurrent_calls(client, backend, concurrency) == concurrency
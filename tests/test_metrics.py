@@ -0,0 +1,57 @@
+from metrics import MetricsRegistry
+
+
+class TestMetricsRegistry:
+
+    def test_counter_and_gauge(self):
+        """Test that counters and gauges render one sample per label set"""
+        registry = MetricsRegistry()
+        requests = registry.counter("requests_total", "Requests", ("route",))
+        in_flight = registry.gauge("in_flight", "In flight")
+
+        requests.inc("/a")
+        requests.inc("/a")
+        requests.inc("/b", amount=3)
+        in_flight.inc()
+        in_flight.inc()
+        in_flight.dec()
+
+        output = registry.render()
+        assert "# TYPE requests_total counter" in output
+        assert 'requests_total{route="/a"} 2' in output
+        assert 'requests_total{route="/b"} 3' in output
+        assert "in_flight 1" in output
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that histogram buckets count every observation at or below their bound"""
+        registry = MetricsRegistry()
+        latency = registry.histogram("latency_seconds", "Latency", ("op",), buckets=(0.1, 1))
+
+        for value in (0.05, 0.1, 0.5, 5):
+            latency.observe(value, "get")
+
+        output = registry.render()
+        assert 'latency_seconds_bucket{op="get",le="0.1"} 2' in output
+        assert 'latency_seconds_bucket{op="get",le="1.0"} 3' in output
+        assert 'latency_seconds_bucket{op="get",le="+Inf"} 4' in output
+        assert 'latency_seconds_sum{op="get"} 5.65' in output
+        assert 'latency_seconds_count{op="get"} 4' in output
+        assert latency.get("get") == 4
+
+    def test_label_values_are_escaped(self):
+        """Test that quotes, backslashes and newlines in label values are escaped"""
+        registry = MetricsRegistry()
+        registry.counter("errors_total", "Errors", ("code",)).inc('a"b\\c\nd')
+
+        assert 'errors_total{code="a\\"b\\\\c\\nd"} 1' in registry.render()
+
+    def test_render_includes_numeric_stats(self):
+        """Test that numeric stats sections are exported as gauges"""
+        stats = {"service": "S3API", "object_cache": {"hits": 3, "bytes": 10, "enabled": True}}
+
+        output = MetricsRegistry().render(stats)
+
+        assert "object_storage_object_cache_hits 3" in output
+        assert "object_storage_object_cache_bytes 10" in output
+        assert "enabled" not in output
+        assert "S3API" not in output
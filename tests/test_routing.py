@@ -0,0 +1,302 @@
+import io
+import os
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from starlette.datastructures import Headers, UploadFile
+
+from routing import RoutingStorageAPI, parse_routes
+from storage_base import (
+    Overloaded,
+    StorageAPI,
+    decode_continuation_token,
+    encode_continuation_token,
+)
+
+
+class MemoryStorage(StorageAPI):
+    """Just enough of a backend to route to, keeping objects in a dict"""
+
+    def __init__(self):
+        super().__init__()
+        self.objects = {}
+        self.buckets = set()
+        self.down = False
+        self.calls = []
+
+    def _check(self, operation):
+        self.calls.append(operation)
+        if self.down:
+            raise ConnectionError("backend unreachable")
+
+    async def list_files(self, bucket_name, prefix=None, recursive=False, max_keys=1000, continuation_token=None, sizes=False):
+        self._check("list_files")
+        names = sorted(
+            key for bucket, key in self.objects
+            if bucket == bucket_name and key.startswith(prefix or "")
+        )
+        if continuation_token:
+            start_after = decode_continuation_token(continuation_token)
+            names = [name for name in names if name > start_after]
+        page = names[:max_keys]
+        return {
+            "bucket": bucket_name,
+            "files": [{"name": name, "size": len(self.objects[bucket_name, name])} for name in page],
+            "prefixes": [],
+            "is_truncated": len(names) > max_keys,
+            "next_continuation_token": encode_continuation_token(page[-1]) if len(names) > max_keys else None,
+        }
+
+    async def upload_file(self, bucket_name, file):
+        self._check("upload_file")
+        self.objects[bucket_name, file.filename] = file.file.read()
+        return {"message": "File uploaded successfully"}
+
+    async def download_file(self, bucket_name, filename, offset=0, length=None, accept_encoding=None):
+        self._check("download_file")
+        if (bucket_name, filename) not in self.objects:
+            return {"error": "Error downloading file: NoSuchKey"}
+        data = self.objects[bucket_name, filename]
+
+        async def body():
+            yield data
+
+        return {"body": body(), "content_length": len(data), "content_type": "text/plain"}
+
+    async def stat_file(self, bucket_name, filename):
+        self._check("stat_file")
+        if (bucket_name, filename) not in self.objects:
+            return {"error": "Error getting file info: NoSuchKey"}
+        return {"size": len(self.objects[bucket_name, filename])}
+
+    async def delete_file(self, bucket_name, filename):
+        self._check("delete_file")
+        self.objects.pop((bucket_name, filename), None)
+        return {"message": "File deleted successfully"}
+
+    async def create_bucket(self, bucket_name):
+        self._check("create_bucket")
+        self.buckets.add(bucket_name)
+        return {"message": f"Bucket '{bucket_name}' created successfully"}
+
+
+def upload(name, data=b"data"):
+    return UploadFile(io.BytesIO(data), size=len(data), filename=name, headers=Headers({"content-type": "text/plain"}))
+
+
+@pytest.fixture
+def backends(mock_config):
+    return {"default": MemoryStorage(), "eu": MemoryStorage(), "us": MemoryStorage()}
+
+
+class TestRoutes:
+
+    def test_most_specific_route_wins(self, backends):
+        """Test that a prefix route beats its bucket's route, which beats the default"""
+        api = RoutingStorageAPI(backends, ["media=eu", "media/videos/=us"])
+
+        assert api._route("media", "videos/a.mp4").primary.name == "us"
+        assert api._route("media", "images/a.png").primary.name == "eu"
+        assert api._route("logs", "a.log").primary.name == "default"
+
+    def test_replicas(self, backends):
+        """Test that backends after the first one of a route are its replicas"""
+        routes = parse_routes(["media=eu+us+default"], {name: name for name in backends})
+        assert routes[0].primary == "eu"
+        assert routes[0].replicas == ["us", "default"]
+
+    @pytest.mark.parametrize("spec", ["media", "=eu", "media=", "media=eu+"])
+    def test_invalid_route(self, backends, spec):
+        """Test that malformed routes are rejected at startup"""
+        with pytest.raises(ValueError):
+            RoutingStorageAPI(backends, [spec])
+
+    def test_unknown_backend(self, backends):
+        """Test that routes to backends that weren't configured are rejected"""
+        with pytest.raises(ValueError, match="unknown backends: asia"):
+            RoutingStorageAPI(backends, ["media=asia"])
+
+
+class TestRoutingStorageAPI:
+
+    @pytest.mark.asyncio
+    async def test_writes_go_to_the_primary_and_replicate(self, backends):
+        """Test that uploads land on the primary and reach replicas in the background"""
+        api = RoutingStorageAPI(backends, ["media=eu+us"])
+
+        result = await api.upload_file("media", upload("a.txt", b"hello"))
+        assert "error" not in result
+        assert backends["eu"].objects == {("media", "a.txt"): b"hello"}
+        assert backends["default"].objects == {}
+
+        await api.wait_for_replication()
+        assert backends["us"].objects == {("media", "a.txt"): b"hello"}
+        assert api.stats()["routing"]["replicated"] == 1
+
+        await api.delete_file("media", "a.txt")
+        await api.wait_for_replication()
+        assert backends["eu"].objects == backends["us"].objects == {}
+
+    @pytest.mark.asyncio
+    async def test_replication_of_one_key_stays_in_order(self, backends):
+        """Test that a delete queued after an upload can't be overtaken by it"""
+        api = RoutingStorageAPI(backends, ["media=eu+us"])
+
+        await api.upload_file("media", upload("a.txt"))
+        await api.delete_file("media", "a.txt")
+        await api.wait_for_replication()
+
+        assert backends["us"].objects == {}
+        assert backends["us"].calls[-1] == "delete_file"
+
+    @pytest.mark.asyncio
+    async def test_reads_prefer_the_fastest_backend(self, backends):
+        """Test that reads go to the backend with the lowest measured latency"""
+        api = RoutingStorageAPI(backends, ["media=eu+us"])
+        backends["eu"].objects["media", "a.txt"] = backends["us"].objects["media", "a.txt"] = b"x"
+        api.backends["eu"].latency, api.backends["us"].latency = 0.080, 0.005
+
+        result = await api.stat_file("media", "a.txt")
+
+        assert result == {"size": 1}
+        assert backends["us"].calls == ["stat_file"]
+        assert backends["eu"].calls == []
+
+    @pytest.mark.asyncio
+    async def test_reads_fail_over(self, backends):
+        """Test that an unreachable backend is skipped and kept out of rotation for a while"""
+        api = RoutingStorageAPI(backends, ["media=eu+us"])
+        backends["us"].objects["media", "a.txt"] = b"x"
+        backends["eu"].down = True
+        api.backends["eu"].latency, api.backends["us"].latency = 0.001, 0.050
+
+        assert await api.stat_file("media", "a.txt") == {"size": 1}
+        assert not api.backends["eu"].healthy()
+        assert api.stats()["routing"]["failovers"] == 1
+
+        assert await api.stat_file("media", "a.txt") == {"size": 1}
+        assert backends["eu"].calls == ["stat_file"]  # Not retried during its cooldown
+
+    @pytest.mark.asyncio
+    async def test_overloaded_backends_stay_in_rotation(self, backends):
+        """Test that a throttled backend's 429 reaches the client without failing over its load"""
+        api = RoutingStorageAPI(backends, ["media=eu+us"])
+        backends["eu"].stat_file = AsyncMock(side_effect=Overloaded("busy", 1))
+        api.backends["eu"].latency, api.backends["us"].latency = 0.001, 0.050
+
+        with pytest.raises(Overloaded):
+            await api.stat_file("media", "a.txt")
+
+        assert api.backends["eu"].healthy()
+        assert backends["us"].calls == []
+        assert api.stats()["routing"]["failovers"] == 0
+
+    @pytest.mark.asyncio
+    async def test_reads_fall_back_to_the_primary_while_replicas_catch_up(self, backends):
+        """Test that a key missing on a lagging replica is read from the primary, and only that read counts"""
+        api = RoutingStorageAPI(backends, ["media=eu+us"])
+        backends["eu"].objects["media", "a.txt"] = b"x"
+        api.backends["eu"].latency, api.backends["us"].latency = 0.050, 0.001
+
+        result = await api.download_file("media", "a.txt")
+
+        assert b"".join([chunk async for chunk in result["body"]]) == b"x"
+        assert (api.backends["eu"].reads, api.backends["us"].reads) == (1, 0)
+        assert api.backends["us"].latency == 0.001
+
+    @pytest.mark.asyncio
+    async def test_all_backends_down(self, backends):
+        """Test that the last error is raised when no backend can be reached"""
+        api = RoutingStorageAPI(backends, ["media=eu+us"])
+        backends["eu"].down = backends["us"].down = True
+
+        with pytest.raises(ConnectionError):
+            await api.stat_file("media", "a.txt")
+
+    @pytest.mark.asyncio
+    async def test_listing_merges_prefix_routes(self, backends):
+        """Test that a bucket listing spans the backends its prefixes are routed to"""
+        api = RoutingStorageAPI(backends, ["media=eu", "media/videos/=us"])
+        for name in ["a.png", "c.png", "z.png"]:
+            backends["eu"].objects["media", name] = b"x"
+        backends["eu"].objects["media", "videos/stale.mp4"] = b"x"  # Routed elsewhere
+        for name in ["videos/b.mp4", "videos/d.mp4"]:
+            backends["us"].objects["media", name] = b"x"
+
+        names, token = [], None
+        while True:
+            page = await api.list_files("media", max_keys=2, continuation_token=token)
+            names += [file["name"] for file in page["files"]]
+            if not page["is_truncated"]:
+                break
+            token = page["next_continuation_token"]
+
+        assert names == ["a.png", "c.png", "videos/b.mp4", "videos/d.mp4", "z.png"]
+
+    @pytest.mark.asyncio
+    async def test_copy_across_backends(self, backends):
+        """Test that copies between backends pass the bytes through"""
+        api = RoutingStorageAPI(backends, ["archive=us"])
+        backends["default"].objects["media", "a.txt"] = b"hello"
+
+        result = await api.copy_file("media", "a.txt", "archive", "a.txt")
+
+        assert result == {"message": "File copied successfully"}
+        assert backends["us"].objects == {("archive", "a.txt"): b"hello"}
+
+    @pytest.mark.asyncio
+    async def test_delete_files_by_route(self, backends):
+        """Test that bulk deletes are split by route and replicated"""
+        api = RoutingStorageAPI(backends, ["media/videos/=us+eu"])
+        backends["default"].objects["media", "a.png"] = b"x"
+        backends["us"].objects["media", "videos/b.mp4"] = b"x"
+        backends["eu"].objects["media", "videos/b.mp4"] = b"x"
+
+        result = await api.delete_files("media", keys=["a.png", "videos/b.mp4"])
+        deleted = [entry async for entry in result["results"]]
+        await api.wait_for_replication()
+
+        assert sorted(entry["name"] for entry in deleted) == ["a.png", "videos/b.mp4"]
+        assert all(backend.objects == {} for backend in backends.values())
+
+    @pytest.mark.asyncio
+    async def test_create_bucket_on_every_backend_of_its_routes(self, backends):
+        """Test that buckets are created wherever their keys may be written"""
+        api = RoutingStorageAPI(backends, ["media=eu+us"])
+
+        await api.create_bucket("media")
+        await api.create_bucket("logs")
+
+        assert backends["eu"].buckets == backends["us"].buckets == {"media"}
+        assert backends["default"].buckets == {"logs"}
+
+
+class TestStorageFactoryRouting:
+
+    def test_backends_need_their_own_credentials(self, mock_config):
+        """Test that a backend without its own keys is rejected instead of getting the default backend's"""
+        from config import StorageConfig
+
+        backend = {"OBJECT_STORAGE_BACKENDS": "eu", "OBJECT_STORAGE_EU_ENDPOINT": "https://eu.example.com"}
+        with patch.dict(os.environ, {**backend, "OBJECT_STORAGE_EU_ACCESS_KEY": "eu-key"}):
+            with pytest.raises(ValueError, match="OBJECT_STORAGE_EU_SECRET_KEY"):
+                StorageConfig()
+
+        with patch.dict(os.environ, {**backend, "OBJECT_STORAGE_EU_ACCESS_KEY": "eu-key", "OBJECT_STORAGE_EU_SECRET_KEY": "eu-secret"}):
+            settings = StorageConfig().OBJECT_STORAGE_BACKENDS["eu"]
+        assert (settings["endpoint"], settings["access_key"], settings["secret_key"]) == ("eu.example.com", "eu-key", "eu-secret")
+
+    def test_routes_configured(self, mock_config):
+        """Test that configuring routes wraps the backends in a router"""
+        from config import config
+        from storage_factory import get_storage_api
+
+        settings = {"eu": {"endpoint": "eu.example.com", "access_key": "a", "secret_key": "b", "region": "eu-west1", "secure": True}}
+        with patch.object(config, "OBJECT_STORAGE_BACKENDS", settings), \
+                patch.object(config, "OBJECT_STORAGE_ROUTES", ["media=eu+default"]), \
+                patch("storage_factory.S3API") as mock_s3_api:
+            api = get_storage_api("minio")
+
+        assert isinstance(api, RoutingStorageAPI)
+        mock_s3_api.assert_any_call(**settings["eu"])
+        assert api._route("media", "a.txt").replicas[0].name == "default"
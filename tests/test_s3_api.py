@@ -1,9 +1,13 @@
 import pytest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import AsyncMock, Mock, patch, MagicMock
 from minio.error import S3Error
+import gzip
 import io
 
+from cache import MISSING
+from compression import CompressionPolicy
 from s3_api import S3API
+from storage_base import Overloaded
 
 
 class TestS3API:
@@ -14,6 +18,8 @@ class TestS3API:
             api = S3API()
             mock_minio.assert_called_once()
             assert api.region is not None
+            assert mock_minio.call_args.kwargs["http_client"] is api.http_client
+            assert api.stats()["connection_pool"]["max_size"] == api.http_client.connection_pool_kw["maxsize"]
 
     @pytest.mark.asyncio
     async def test_list_files_success(self, s3_api_with_mock):
@@ -24,6 +30,7 @@ class TestS3API:
         # Mock list_objects
         mock_obj = Mock()
         mock_obj.object_name = "test.txt"
+        mock_obj.is_dir = False
         mock_obj.size = 1024
         mock_obj.last_modified = Mock()
         mock_obj.last_modified.isoformat.return_value = "2023-01-01T00:00:00"
@@ -39,6 +46,184 @@ class TestS3API:
         assert result["files"][0]["name"] == "test.txt"
         assert result["files"][0]["size"] == 1024
 
+    @pytest.mark.asyncio
+    async def test_list_files_paginates(self, s3_api_with_mock):
+        """Test that list_files returns one page plus a token that resumes after it"""
+        def make_obj(name, is_dir=False):
+            obj = Mock()
+            obj.object_name = name
+            obj.is_dir = is_dir
+            obj.size = None if is_dir else 1
+            obj.last_modified = None
+            return obj
+
+        s3_api_with_mock.client.bucket_exists.return_value = True
+        s3_api_with_mock.client.list_objects.return_value = iter(
+            [make_obj("a.txt"), make_obj("dir/", is_dir=True), make_obj("z.txt")]
+        )
+
+        result = await s3_api_with_mock.list_files("test-bucket", prefix="", max_keys=2)
+
+        assert [f["name"] for f in result["files"]] == ["a.txt"]
+        assert result["prefixes"] == ["dir/"]
+        assert result["is_truncated"] is True
+
+        s3_api_with_mock.client.list_objects.return_value = iter([make_obj("z.txt")])
+        result = await s3_api_with_mock.list_files(
+            "test-bucket", max_keys=2, continuation_token=result["next_continuation_token"]
+        )
+
+        _, kwargs = s3_api_with_mock.client.list_objects.call_args
+        assert kwargs["start_after"].startswith("dir/")
+        assert kwargs["start_after"] > "dir/zzzz"  # Skips everything under the prefix
+        assert [f["name"] for f in result["files"]] == ["z.txt"]
+        assert result["is_truncated"] is False
+        assert result["next_continuation_token"] is None
+
+    @pytest.mark.asyncio
+    async def test_list_files_invalid_token(self, s3_api_with_mock):
+        """Test that a garbled continuation token is reported as an error"""
+        result = await s3_api_with_mock.list_files("test-bucket", continuation_token="%%%")
+
+        assert "error" in result
+        s3_api_with_mock.client.list_objects.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_stream_files_walks_all_pages(self, s3_api_with_mock):
+        """Test that stream_files yields entries from every page"""
+        pages = [
+            {"bucket": "test-bucket", "files": [{"name": "a"}], "prefixes": ["p/"],
+             "is_truncated": True, "next_continuation_token": "tok"},
+            {"bucket": "test-bucket", "files": [{"name": "b"}], "prefixes": [],
+             "is_truncated": False, "next_continuation_token": None},
+        ]
+        s3_api_with_mock.list_files = AsyncMock(side_effect=pages)
+
+        result = await s3_api_with_mock.stream_files("test-bucket")
+        entries = [entry async for entry in result["entries"]]
+
+        assert entries == [{"prefix": "p/"}, {"name": "a"}, {"name": "b"}]
+        assert s3_api_with_mock.list_files.await_args_list[1].args[-1] == "tok"
+
+    @pytest.mark.asyncio
+    async def test_stream_files_ends_with_error_when_overloaded(self, s3_api_with_mock):
+        """Test that a later page refused for overload ends the stream with an error record"""
+        page = {"bucket": "test-bucket", "files": [{"name": "a"}], "prefixes": [],
+                "is_truncated": True, "next_continuation_token": "tok"}
+        s3_api_with_mock.list_files = AsyncMock(side_effect=[page, Overloaded("busy", 1)])
+
+        result = await s3_api_with_mock.stream_files("test-bucket")
+        entries = [entry async for entry in result["entries"]]
+
+        assert entries == [{"name": "a"}, {"error": "Error listing files: busy"}]
+
+    @pytest.mark.asyncio
+    async def test_bucket_existence_is_cached(self, s3_api_with_mock):
+        """Test that steady-state listings skip the bucket_exists round-trip"""
+        s3_api_with_mock.client.bucket_exists.return_value = True
+        s3_api_with_mock.client.list_objects.return_value = []
+
+        for _ in range(3):
+            result = await s3_api_with_mock.list_files("test-bucket")
+            assert "error" not in result
+
+        assert s3_api_with_mock.client.bucket_exists.call_count == 1
+        assert s3_api_with_mock.client.list_objects.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_create_bucket_updates_existence_cache(self, s3_api_with_mock):
+        """Test that a missing bucket is remembered until this process creates it"""
+        s3_api_with_mock.client.bucket_exists.return_value = False
+        s3_api_with_mock.client.list_objects.return_value = []
+
+        assert "error" in await s3_api_with_mock.list_files("new-bucket")
+        await s3_api_with_mock.create_bucket("new-bucket")
+        result = await s3_api_with_mock.list_files("new-bucket")
+
+        assert "error" not in result
+        assert s3_api_with_mock.client.bucket_exists.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_stat_file_cached_and_invalidated(self, s3_api_with_mock):
+        """Test that stats are cached, missing keys cached negatively, and uploads invalidate"""
+        mock_stat = Mock(size=12, content_type="text/plain", etag="abc123", last_modified=None, metadata={})
+        s3_api_with_mock.client.stat_object.return_value = mock_stat
+
+        await s3_api_with_mock.stat_file("test-bucket", "test.txt")
+        await s3_api_with_mock.stat_file("test-bucket", "test.txt")
+        assert s3_api_with_mock.client.stat_object.call_count == 1
+
+        upload = Mock(filename="test.txt", content_type="text/plain", file=io.BytesIO(b"new"), size=3)
+        await s3_api_with_mock.upload_file("test-bucket", upload)
+        await s3_api_with_mock.stat_file("test-bucket", "test.txt")
+        assert s3_api_with_mock.client.stat_object.call_count == 2
+
+        s3_api_with_mock.client.stat_object.side_effect = S3Error(
+            response=Mock(), code="NoSuchKey", message="", resource="", request_id="", host_id=""
+        )
+        assert "error" in await s3_api_with_mock.stat_file("test-bucket", "missing.txt")
+        assert "error" in await s3_api_with_mock.stat_file("test-bucket", "missing.txt")
+        assert s3_api_with_mock.client.stat_object.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_concurrent_downloads_share_one_request(self, s3_api_with_mock):
+        """Test that identical downloads in flight together make one backend request"""
+        import asyncio
+        import time
+
+        def get_object(*args, **kwargs):
+            time.sleep(0.05)
+            mock_data = Mock()
+            mock_data.read.side_effect = [b"popular", b""]
+            mock_data.headers = {"Content-Length": "7", "ETag": '"abc123"'}
+            return mock_data
+
+        s3_api_with_mock.client.get_object.side_effect = get_object
+
+        results = await asyncio.gather(
+            *(s3_api_with_mock.download_file("test-bucket", "model.bin") for _ in range(10))
+        )
+
+        for result in results:
+            assert result["etag"] == '"abc123"'
+            assert b"".join([chunk async for chunk in result["body"]]) == b"popular"
+        assert s3_api_with_mock.client.get_object.call_count == 1
+        assert s3_api_with_mock.stats()["single_flight"]["joined"] == 9
+
+        # Ranges are fetched separately from whole objects
+        await s3_api_with_mock.download_file("test-bucket", "model.bin", offset=1, length=3)
+        assert s3_api_with_mock.client.get_object.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_stats_and_listings_share_one_request(self, s3_api_with_mock):
+        """Test that identical stats and listings in flight together make one backend request"""
+        import asyncio
+        import time
+
+        def stat_object(*args):
+            time.sleep(0.05)
+            return Mock(size=12, content_type="text/plain", etag="abc123", last_modified=None, metadata={})
+
+        def list_objects(*args, **kwargs):
+            time.sleep(0.05)
+            return iter([Mock(object_name="a.txt", size=1, last_modified=None, is_dir=False)])
+
+        s3_api_with_mock.client.stat_object.side_effect = stat_object
+        s3_api_with_mock.client.list_objects.side_effect = list_objects
+        s3_api_with_mock.client.bucket_exists.return_value = True
+
+        stats = await asyncio.gather(
+            *(s3_api_with_mock.stat_file("test-bucket", "test.txt") for _ in range(5))
+        )
+        listings = await asyncio.gather(
+            *(s3_api_with_mock.list_files("test-bucket", prefix="a") for _ in range(5))
+        )
+
+        assert all(stat["size"] == 12 for stat in stats)
+        assert all(listing["files"][0]["name"] == "a.txt" for listing in listings)
+        assert s3_api_with_mock.client.stat_object.call_count == 1
+        assert s3_api_with_mock.client.list_objects.call_count == 1
+
     @pytest.mark.asyncio
     async def test_list_files_bucket_not_exists(self, s3_api_with_mock):
         """Test listing files when bucket doesn't exist"""
@@ -70,6 +255,28 @@ class TestS3API:
         assert "uploaded successfully" in result["message"]
         s3_api_with_mock.client.put_object.assert_called_once()
 
+    @pytest.mark.asyncio
+    async def test_upload_file_streams_without_buffering(self, s3_api_with_mock, mock_upload_file):
+        """Test that the upload stream is handed to put_object instead of being read into memory"""
+        await s3_api_with_mock.upload_file("test-bucket", mock_upload_file)
+
+        args, kwargs = s3_api_with_mock.client.put_object.call_args
+        assert args[2] is mock_upload_file.file
+        assert kwargs["length"] == len(b"test content")
+        assert kwargs["part_size"] == s3_api_with_mock.part_size
+        assert kwargs["num_parallel_uploads"] == s3_api_with_mock.parallel_uploads
+
+    @pytest.mark.asyncio
+    async def test_upload_file_unknown_size_uses_multipart(self, s3_api_with_mock, mock_upload_file):
+        """Test that an upload of unknown size is sent as a multipart stream"""
+        mock_upload_file.size = None
+
+        await s3_api_with_mock.upload_file("test-bucket", mock_upload_file)
+
+        _, kwargs = s3_api_with_mock.client.put_object.call_args
+        assert kwargs["length"] == -1
+        assert kwargs["part_size"] == s3_api_with_mock.part_size
+
     @pytest.mark.asyncio
     async def test_upload_file_s3_error(self, s3_api_with_mock, mock_upload_file):
         """Test file upload with S3 error"""
@@ -84,12 +291,154 @@ class TestS3API:
     async def test_download_file_success(self, s3_api_with_mock):
         """Test successful file download"""
         mock_data = Mock()
-        mock_data.read.return_value = b"file content"
+        mock_data.read.side_effect = [b"file ", b"content", b""]
+        mock_data.headers = {
+            "Content-Length": "12",
+            "Content-Type": "text/plain",
+            "ETag": '"abc123"',
+        }
         s3_api_with_mock.client.get_object.return_value = mock_data
 
         result = await s3_api_with_mock.download_file("test-bucket", "test.txt")
 
-        assert result == b"file content"
+        assert result["content_length"] == 12
+        assert result["content_type"] == "text/plain"
+        assert result["etag"] == '"abc123"'
+        chunks = [chunk async for chunk in result["body"]]
+        assert b"".join(chunks) == b"file content"
+        mock_data.release_conn.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_download_file_releases_connection_on_early_close(self, s3_api_with_mock):
+        """Test that abandoning the stream (client disconnect) releases the connection"""
+        mock_data = Mock()
+        mock_data.read.return_value = b"x" * 16
+        mock_data.headers = {"Content-Length": "1000"}
+        s3_api_with_mock.client.get_object.return_value = mock_data
+
+        result = await s3_api_with_mock.download_file("test-bucket", "test.txt")
+        body = result["body"]
+        await body.__anext__()
+        await body.aclose()
+
+        mock_data.close.assert_called_once()
+        mock_data.release_conn.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_download_file_range(self, s3_api_with_mock):
+        """Test that ranged downloads only request the needed bytes from the backend"""
+        mock_data = Mock()
+        mock_data.read.side_effect = [b"content", b""]
+        mock_data.headers = {"Content-Length": "7"}
+        s3_api_with_mock.client.get_object.return_value = mock_data
+
+        result = await s3_api_with_mock.download_file("test-bucket", "test.txt", offset=5, length=7)
+
+        s3_api_with_mock.client.get_object.assert_called_once_with(
+            "test-bucket", "test.txt", offset=5, length=7
+        )
+        assert result["content_length"] == 7
+
+    @pytest.mark.asyncio
+    async def test_stat_file_success(self, s3_api_with_mock):
+        """Test that stat_file returns HTTP-ready validators"""
+        from datetime import datetime, timezone
+
+        mock_stat = Mock()
+        mock_stat.size = 12
+        mock_stat.content_type = "text/plain"
+        mock_stat.etag = "abc123"
+        mock_stat.last_modified = datetime(2023, 1, 1, tzinfo=timezone.utc)
+        mock_stat.metadata = {}
+        s3_api_with_mock.client.stat_object.return_value = mock_stat
+
+        result = await s3_api_with_mock.stat_file("test-bucket", "test.txt")
+
+        assert result["size"] == 12
+        assert result["etag"] == '"abc123"'
+        assert result["last_modified"] == "Sun, 01 Jan 2023 00:00:00 GMT"
+
+    @pytest.mark.asyncio
+    async def test_stat_file_s3_error(self, s3_api_with_mock):
+        """Test stat_file with S3 error"""
+        s3_api_with_mock.client.stat_object.side_effect = S3Error("Stat error", "", "", "", "", "")
+
+        result = await s3_api_with_mock.stat_file("test-bucket", "test.txt")
+
+        assert "error" in result
+        assert "Error getting file info" in result["error"]
+
+    @pytest.mark.asyncio
+    async def test_download_file_served_from_object_cache(self, mock_config, mock_minio_client):
+        """Test that hot small objects are served from memory and invalidated on upload"""
+        from config import config
+
+        with patch.object(config, 'OBJECT_STORAGE_CACHE_MAX_BYTES', 1024), \
+                patch('s3_api.Minio', return_value=mock_minio_client):
+            api = S3API()
+
+        def get_object(*args, **kwargs):
+            mock_data = Mock()
+            mock_data.read.side_effect = [b"file content", b""]
+            mock_data.headers = {"Content-Length": "12", "ETag": '"abc123"'}
+            return mock_data
+
+        mock_minio_client.get_object.side_effect = get_object
+
+        for _ in range(3):
+            result = await api.download_file("test-bucket", "test.txt")
+            assert b"".join([chunk async for chunk in result["body"]]) == b"file content"
+        assert mock_minio_client.get_object.call_count == 1
+
+        result = await api.download_file("test-bucket", "test.txt", offset=5, length=4)
+        assert b"".join([chunk async for chunk in result["body"]]) == b"cont"
+        assert api.stats()["object_cache"]["hits"] == 3
+
+        upload = Mock(filename="test.txt", content_type="text/plain", file=io.BytesIO(b"new"), size=3)
+        await api.upload_file("test-bucket", upload)
+        result = await api.download_file("test-bucket", "test.txt")
+        assert mock_minio_client.get_object.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_download_file_disk_cache(self, mock_config, mock_minio_client, tmp_path):
+        """Test that concurrent misses share one backend read and later hits come from disk"""
+        import asyncio
+        from config import config
+
+        with patch.object(config, 'OBJECT_STORAGE_DISK_CACHE_DIR', str(tmp_path)), \
+                patch('s3_api.Minio', return_value=mock_minio_client):
+            api = S3API()
+
+        data = b"weights" * 1000
+
+        def get_object(*args, **kwargs):
+            mock_data = Mock()
+            mock_data.read.side_effect = [data[:4000], data[4000:], b""]
+            mock_data.headers = {"Content-Length": str(len(data)), "ETag": '"abc123"'}
+            return mock_data
+
+        mock_minio_client.get_object.side_effect = get_object
+
+        results = await asyncio.gather(*(api.download_file("test-bucket", "model.bin") for _ in range(5)))
+        for result in results:
+            assert b"".join([chunk async for chunk in result["body"]]) == data
+        assert mock_minio_client.get_object.call_count == 1
+        while api._disk_fills:
+            await asyncio.sleep(0)
+
+        result = await api.download_file("test-bucket", "model.bin")
+        with open(result["path"], "rb") as f:
+            assert f.read() == data
+        await result["body"].aclose()
+
+        result = await api.download_file("test-bucket", "model.bin", offset=7, length=7)
+        assert b"".join([chunk async for chunk in result["body"]]) == b"weights"
+        assert mock_minio_client.get_object.call_count == 1
+        assert api.stats()["disk_cache"]["hits"] == 2
+
+        upload = Mock(filename="model.bin", content_type="application/octet-stream", file=io.BytesIO(b"new"), size=3)
+        await api.upload_file("test-bucket", upload)
+        assert api.disk_cache.get("test-bucket", "model.bin") is None
 
     @pytest.mark.asyncio
     async def test_download_file_s3_error(self, s3_api_with_mock):
@@ -102,6 +451,165 @@ class TestS3API:
         assert "error" in result
         assert "Error downloading file" in result["error"]
 
+    @pytest.mark.asyncio
+    async def test_upload_file_compressed(self, s3_api_with_mock, mock_upload_file):
+        """Test that opted-in uploads are compressed and record the codec and original size"""
+        s3_api_with_mock.compression = CompressionPolicy(["test-bucket"], ["text/*"], "gzip", 0)
+
+        await s3_api_with_mock.upload_file("test-bucket", mock_upload_file)
+
+        args, kwargs = s3_api_with_mock.client.put_object.call_args
+        assert gzip.decompress(args[2].read()) == b"test content"
+        assert kwargs["length"] == -1
+        assert kwargs["metadata"] == {
+            "Content-Encoding": "gzip",
+            "codec": "gzip",
+            "uncompressed-size": "12",
+        }
+
+    @pytest.mark.asyncio
+    async def test_upload_file_not_compressed_elsewhere(self, s3_api_with_mock, mock_upload_file):
+        """Test that buckets that aren't opted in are stored as-is"""
+        s3_api_with_mock.compression = CompressionPolicy(["logs"], ["text/*"], "gzip", 0)
+
+        await s3_api_with_mock.upload_file("test-bucket", mock_upload_file)
+
+        args, kwargs = s3_api_with_mock.client.put_object.call_args
+        assert args[2] is mock_upload_file.file
+        assert kwargs["metadata"] is None
+
+    @staticmethod
+    def _compressed_object(data: bytes):
+        stored = gzip.compress(data)
+        mock_data = Mock()
+        mock_data.read.side_effect = [stored[:10], stored[10:], b""]
+        mock_data.headers = {
+            "Content-Length": str(len(stored)),
+            "Content-Type": "text/plain",
+            "x-amz-meta-codec": "gzip",
+            "x-amz-meta-uncompressed-size": str(len(data)),
+        }
+        return mock_data
+
+    @pytest.mark.asyncio
+    async def test_download_compressed_decoded(self, s3_api_with_mock):
+        """Test that clients that don't accept the codec get the original bytes"""
+        data = b"hello compressed world" * 100
+        s3_api_with_mock.client.get_object.return_value = self._compressed_object(data)
+
+        result = await s3_api_with_mock.download_file("test-bucket", "test.txt", accept_encoding="br")
+
+        assert "content_encoding" not in result
+        assert result["content_length"] == len(data)
+        assert b"".join([chunk async for chunk in result["body"]]) == data
+
+    @pytest.mark.asyncio
+    async def test_download_compressed_passthrough(self, s3_api_with_mock):
+        """Test that clients accepting the codec get the stored bytes without a decode"""
+        data = b"hello compressed world" * 100
+        mock_data = self._compressed_object(data)
+        s3_api_with_mock.client.get_object.return_value = mock_data
+
+        result = await s3_api_with_mock.download_file("test-bucket", "test.txt", accept_encoding="gzip, br")
+
+        assert result["content_encoding"] == "gzip"
+        assert result["content_length"] == int(mock_data.headers["Content-Length"])
+        body = b"".join([chunk async for chunk in result["body"]])
+        assert gzip.decompress(body) == data
+        assert all(call.kwargs == {"decode_content": False} for call in mock_data.read.call_args_list)
+
+    @pytest.mark.asyncio
+    async def test_download_compressed_range(self, s3_api_with_mock):
+        """Test that ranges of compressed objects address the original bytes"""
+        data = bytes(range(256)) * 40
+        s3_api_with_mock.client.get_object.side_effect = lambda *args, **kwargs: self._compressed_object(data)
+
+        result = await s3_api_with_mock.download_file("test-bucket", "test.txt", offset=1000, length=300)
+
+        assert result["content_length"] == 300
+        assert b"".join([chunk async for chunk in result["body"]]) == data[1000:1300]
+        assert s3_api_with_mock.client.get_object.call_args_list[-1].kwargs == {"offset": 0, "length": 0}
+
+    @pytest.mark.asyncio
+    async def test_list_files_compressed_sizes(self, s3_api_with_mock):
+        """Test that listings of compressing buckets report the same size as stat, plus the stored one"""
+        api = s3_api_with_mock
+        api.compression = CompressionPolicy(["test-bucket"], ["text/*"], "gzip", 0)
+        api.client.bucket_exists.return_value = True
+        api.client.list_objects.return_value = [
+            Mock(object_name=name, is_dir=False, size=40, etag=name, last_modified=None)
+            for name in ("a.txt", "b.bin")
+        ]
+        api.client.stat_object.side_effect = lambda bucket, name: Mock(
+            size=40, content_type="text/plain", etag=name, last_modified=None,
+            metadata={"x-amz-meta-codec": "gzip", "x-amz-meta-uncompressed-size": "10000"}
+            if name == "a.txt" else {},
+        )
+
+        files = {file["name"]: file for file in (await api.list_files("test-bucket", sizes=True))["files"]}
+
+        assert files["a.txt"] == {
+            "name": "a.txt", "size": 10000, "last_modified": None, "stored_size": 40, "content_encoding": "gzip"
+        }
+        assert files["b.bin"] == {"name": "b.bin", "size": 40, "last_modified": None}
+        assert (await api.stat_file("test-bucket", "a.txt"))["size"] == 10000
+
+    @pytest.mark.asyncio
+    async def test_list_files_backend_calls(self, s3_api_with_mock):
+        """Test that a page of a compressing bucket costs one listing, and stats only when sizes are asked for"""
+        api = s3_api_with_mock
+        api.compression = CompressionPolicy(["test-bucket"], ["text/*"], "gzip", 0)
+        api.client.bucket_exists.return_value = True
+        api.client.list_objects.return_value = [
+            Mock(object_name=f"{number}.txt", is_dir=False, size=40, etag="e", last_modified=None)
+            for number in range(100)
+        ]
+        api.client.stat_object.return_value = Mock(
+            size=40, content_type="text/plain", etag="e", last_modified=None, metadata={}
+        )
+
+        page = await api.list_files("test-bucket", max_keys=100)
+
+        assert [file["size"] for file in page["files"]] == [40] * 100
+        assert api.client.list_objects.call_count == 1
+        assert api.client.bucket_exists.call_count == 1
+        api.client.stat_object.assert_not_called()
+
+        await api.list_files("test-bucket", max_keys=100, sizes=True)
+        assert api.client.list_objects.call_count == 2
+        assert api.client.stat_object.call_count == 100
+
+    @pytest.mark.asyncio
+    async def test_download_compressed_range_past_stored_end(self, s3_api_with_mock):
+        """Test that a range beyond the stored bytes still resolves against the original size"""
+        data = b"a" * 10000
+        invalid_range = S3Error(
+            response=Mock(), code="InvalidRange", message="", resource="", request_id="", host_id=""
+        )
+        s3_api_with_mock.client.get_object.side_effect = [invalid_range, self._compressed_object(data)]
+        s3_api_with_mock.client.stat_object.return_value = Mock(
+            size=40, content_type="text/plain", etag="abc", last_modified=None,
+            metadata={"x-amz-meta-codec": "gzip", "x-amz-meta-uncompressed-size": "10000"},
+        )
+
+        result = await s3_api_with_mock.download_file("test-bucket", "test.txt", offset=9000)
+
+        assert result["content_length"] == 1000
+        assert b"".join([chunk async for chunk in result["body"]]) == data[9000:]
+
+    @pytest.mark.asyncio
+    async def test_stat_file_compressed_reports_original_size(self, s3_api_with_mock):
+        """Test that stats of compressed objects carry the original size and the codec"""
+        s3_api_with_mock.client.stat_object.return_value = Mock(
+            size=40, content_type="text/plain", etag="abc", last_modified=None,
+            metadata={"x-amz-meta-codec": "gzip", "x-amz-meta-uncompressed-size": "10000"},
+        )
+
+        result = await s3_api_with_mock.stat_file("test-bucket", "test.txt")
+
+        assert result["size"] == 10000
+        assert result["codec"] == "gzip"
+
     @pytest.mark.asyncio
     async def test_delete_file_success(self, s3_api_with_mock):
         """Test successful file deletion"""
@@ -112,6 +620,68 @@ class TestS3API:
         assert "message" in result
         assert "deleted successfully" in result["message"]
 
+    @pytest.mark.asyncio
+    async def test_delete_files_batches_keys(self, s3_api_with_mock):
+        """Test that bulk deletes send at most 1000 keys per remove_objects call"""
+        keys = [f"key-{i}" for i in range(2500)]
+        failure = Mock()
+        failure.name = "key-7"
+        failure.code = "AccessDenied"
+        failure.message = "Access Denied"
+
+        batch_sizes = []
+
+        def remove_objects(bucket_name, delete_objects):
+            # DeleteObject exposes `name` on newer minio releases and `_name` on older ones
+            names = [getattr(obj, "name", None) or obj._name for obj in delete_objects]
+            batch_sizes.append(len(names))
+            return iter([failure] if "key-7" in names else [])
+
+        s3_api_with_mock.client.remove_objects.side_effect = remove_objects
+
+        result = await s3_api_with_mock.delete_files("test-bucket", keys=keys)
+        results = [r async for r in result["results"]]
+
+        assert sorted(batch_sizes) == [500, 1000, 1000]
+        assert sorted(r["name"] for r in results) == sorted(keys)
+        errors = [r for r in results if "error" in r]
+        assert errors == [{"name": "key-7", "error": "AccessDenied: Access Denied"}]
+
+    @pytest.mark.asyncio
+    async def test_delete_files_by_prefix(self, s3_api_with_mock):
+        """Test that a prefix delete lists recursively and deletes each page"""
+        s3_api_with_mock._list_names = AsyncMock(side_effect=[
+            {"bucket": "test-bucket", "files": [{"name": "logs/a"}], "prefixes": [],
+             "is_truncated": True, "next_continuation_token": "tok"},
+            {"bucket": "test-bucket", "files": [{"name": "logs/b"}], "prefixes": [],
+             "is_truncated": False, "next_continuation_token": None},
+        ])
+        s3_api_with_mock.client.remove_objects.return_value = iter([])
+
+        result = await s3_api_with_mock.delete_files("test-bucket", prefix="logs/")
+        results = [r async for r in result["results"]]
+
+        assert sorted(r["name"] for r in results) == ["logs/a", "logs/b"]
+        assert all(r["deleted"] for r in results)
+        assert s3_api_with_mock._list_names.await_args_list[0].args == ("test-bucket", "logs/", 1000, None)
+
+    @pytest.mark.asyncio
+    async def test_delete_files_requires_keys_or_prefix(self, s3_api_with_mock):
+        """Test that a bulk delete without keys or prefix is rejected"""
+        result = await s3_api_with_mock.delete_files("test-bucket")
+
+        assert "error" in result
+
+    @pytest.mark.asyncio
+    async def test_delete_files_refuses_empty_prefix(self, s3_api_with_mock):
+        """Test that a bulk delete can't empty the whole bucket through an empty prefix"""
+        s3_api_with_mock._list_names = AsyncMock()
+
+        result = await s3_api_with_mock.delete_files("test-bucket", prefix="")
+
+        assert result == {"error": "Prefix must not be empty"}
+        s3_api_with_mock._list_names.assert_not_awaited()
+
     @pytest.mark.asyncio
     async def test_delete_file_s3_error(self, s3_api_with_mock):
         """Test file deletion with S3 error"""
@@ -151,4 +721,171 @@ class TestS3API:
         result = await s3_api_with_mock.create_bucket("test-bucket")
 
         assert "error" in result
-        assert "Error creating bucket" in result["error"]
\ No newline at end of file
+        assert "Error creating bucket" in result["error"]
+    @pytest.mark.asyncio
+    async def test_presign_url(self, s3_api_with_mock):
+        """Test that presigned URLs are signed for the requested method and expiry"""
+        s3_api_with_mock.presign_client.get_presigned_url.return_value = "http://signed"
+
+        result = await s3_api_with_mock.presign_url("test-bucket", "test.txt", "PUT", 600)
+
+        assert result == {"url": "http://signed", "method": "PUT", "expires_in": 600}
+        args, kwargs = s3_api_with_mock.presign_client.get_presigned_url.call_args
+        assert args == ("PUT", "test-bucket", "test.txt")
+        assert kwargs["expires"].total_seconds() == 600
+
+    @pytest.mark.asyncio
+    async def test_presign_url_rejects_bad_requests(self, s3_api_with_mock):
+        """Test that unsupported methods and out-of-range expiries are refused"""
+        assert "error" in await s3_api_with_mock.presign_url("test-bucket", "test.txt", "DELETE")
+        assert "error" in await s3_api_with_mock.presign_url("test-bucket", "test.txt", expires=10**9)
+        s3_api_with_mock.presign_client.get_presigned_url.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_create_multipart_upload_presigns_every_part(self, s3_api_with_mock):
+        """Test that a multipart upload is started and each part gets its own URL"""
+        s3_api_with_mock.presign_client.get_presigned_url.side_effect = (
+            lambda method, bucket, name, expires, extra_query_params: f"http://{extra_query_params['partNumber']}"
+        )
+
+        with patch("s3_multipart.create", return_value="upload-1"):
+            result = await s3_api_with_mock.create_multipart_upload("test-bucket", "big.bin", 3)
+
+        assert result["upload_id"] == "upload-1"
+        assert result["parts"] == [
+            {"part_number": 1, "url": "http://1"},
+            {"part_number": 2, "url": "http://2"},
+            {"part_number": 3, "url": "http://3"},
+        ]
+        kwargs = s3_api_with_mock.presign_client.get_presigned_url.call_args.kwargs
+        assert kwargs["extra_query_params"]["uploadId"] == "upload-1"
+
+    @pytest.mark.asyncio
+    async def test_complete_multipart_upload(self, s3_api_with_mock):
+        """Test that parts are completed in order and cached metadata is dropped"""
+        s3_api_with_mock.metadata_cache.put(("stat", "test-bucket", "big.bin"), {"size": 1})
+
+        with patch("s3_multipart.complete", return_value="abc-2") as complete:
+            result = await s3_api_with_mock.complete_multipart_upload(
+                "test-bucket",
+                "big.bin",
+                "upload-1",
+                [{"part_number": 2, "etag": '"b"'}, {"part_number": 1, "etag": '"a"'}],
+            )
+
+        assert result["etag"] == '"abc-2"'
+        assert complete.call_args.args[1:] == ("test-bucket", "big.bin", "upload-1", [(2, '"b"'), (1, '"a"')])
+        assert s3_api_with_mock.metadata_cache.get(("stat", "test-bucket", "big.bin")) is MISSING
+
+    @pytest.mark.asyncio
+    async def test_abort_multipart_upload_s3_error(self, s3_api_with_mock):
+        """Test aborting a multipart upload with S3 error"""
+        error = S3Error(response=Mock(), code="NoSuchUpload", message="", resource="", request_id="", host_id="")
+
+        with patch("s3_multipart.abort", side_effect=error):
+            result = await s3_api_with_mock.abort_multipart_upload("test-bucket", "big.bin", "upload-1")
+
+        assert "Error aborting multipart upload" in result["error"]
+
+    @pytest.mark.asyncio
+    async def test_copy_file_server_side(self, s3_api_with_mock):
+        """Test that copies run in the backend, pinned to the stat'd ETag, with one HEAD in all"""
+        stat = Mock(size=1024, content_type="text/plain", etag="abc", last_modified=None, metadata={})
+        s3_api_with_mock.client.stat_object.return_value = stat
+
+        with patch("s3_multipart.copy", return_value="abc") as copy:
+            result = await s3_api_with_mock.copy_file("test-bucket", "a.txt", "other-bucket", "b.txt")
+
+        assert result["etag"] == '"abc"'
+        client, bucket, name, source = copy.call_args.args
+        assert (bucket, name) == ("other-bucket", "b.txt")
+        assert (source.bucket_name, source.object_name, source.match_etag) == ("test-bucket", "a.txt", "abc")
+        s3_api_with_mock.client.stat_object.assert_called_once()
+        s3_api_with_mock.client.copy_object.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_copy_file_over_5_gib_uses_multipart_copy(self, s3_api_with_mock):
+        """Test that objects too large for CopyObject are copied in 5 GiB ranges, with one HEAD in all"""
+        size = 6 * 1024**3
+        stat = Mock(size=size, content_type="video/mp4", etag="abc-9", last_modified=None, metadata={})
+        s3_api_with_mock.client.stat_object.return_value = stat
+
+        with patch("s3_multipart.create", return_value="upload-1") as create, \
+                patch("s3_multipart.upload_part_copy", side_effect=["p1", "p2"]) as upload_part_copy, \
+                patch("s3_multipart.complete", return_value="def-2") as complete:
+            result = await s3_api_with_mock.copy_file("test-bucket", "big.mp4", "test-bucket", "copy.mp4")
+
+        assert result["etag"] == '"def-2"'
+        assert create.call_args.kwargs["metadata"] == {"Content-Type": "video/mp4"}
+        ranges = [call.args[4:] for call in upload_part_copy.call_args_list]
+        assert [(number, start, end) for number, _, start, end in ranges] == [
+            (1, 0, 5 * 1024**3 - 1), (2, 5 * 1024**3, size - 1),
+        ]
+        assert ranges[0][1].match_etag == "abc-9"
+        assert complete.call_args.args[-1] == [(1, "p1"), (2, "p2")]
+        s3_api_with_mock.client.stat_object.assert_called_once()
+        s3_api_with_mock.client.compose_object.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_copy_file_multipart_aborts_on_error(self, s3_api_with_mock):
+        """Test that a failed multipart copy doesn't leave its parts behind"""
+        stat = Mock(size=6 * 1024**3, content_type="video/mp4", etag="abc-9", last_modified=None, metadata={})
+        s3_api_with_mock.client.stat_object.return_value = stat
+        error = S3Error(response=Mock(), code="PreconditionFailed", message="", resource="", request_id="", host_id="")
+
+        with patch("s3_multipart.create", return_value="upload-1"), \
+                patch("s3_multipart.upload_part_copy", side_effect=["p1", error]), \
+                patch("s3_multipart.abort") as abort:
+            result = await s3_api_with_mock.copy_file("test-bucket", "big.mp4", "test-bucket", "copy.mp4")
+
+        assert "Error copying file" in result["error"]
+        assert abort.call_args.args[1:] == ("test-bucket", "copy.mp4", "upload-1")
+
+    @pytest.mark.asyncio
+    async def test_copy_file_multipart_keeps_compression_metadata(self, s3_api_with_mock):
+        """Test that a multipart copy of a compressed object sets its codec metadata again"""
+        stat = Mock(
+            size=6 * 1024**3, content_type="text/plain", etag="abc-9", last_modified=None,
+            metadata={"x-amz-meta-codec": "gzip", "x-amz-meta-uncompressed-size": str(20 * 1024**3)},
+        )
+        s3_api_with_mock.client.stat_object.return_value = stat
+
+        with patch("s3_multipart.create", return_value="upload-1") as create, \
+                patch("s3_multipart.upload_part_copy", return_value="p"), \
+                patch("s3_multipart.complete", return_value="def-2"):
+            await s3_api_with_mock.copy_file("test-bucket", "big.log", "test-bucket", "copy.log")
+
+        assert create.call_args.kwargs["metadata"] == {
+            "Content-Type": "text/plain",
+            "Content-Encoding": "gzip",
+            "codec": "gzip",
+            "uncompressed-size": str(20 * 1024**3),
+        }
+
+    @pytest.mark.asyncio
+    async def test_copy_file_compressed_uses_stored_size(self, s3_api_with_mock):
+        """Test that compressed objects under 5 GiB stored are copied in one request, whatever their original size"""
+        stat = Mock(
+            size=1024**3, content_type="text/plain", etag="abc-9", last_modified=None,
+            metadata={"x-amz-meta-codec": "gzip", "x-amz-meta-uncompressed-size": str(6 * 1024**3)},
+        )
+        s3_api_with_mock.client.stat_object.return_value = stat
+
+        with patch("s3_multipart.copy", return_value="def") as copy, patch("s3_multipart.create") as create:
+            result = await s3_api_with_mock.copy_file("test-bucket", "big.log", "test-bucket", "copy.log")
+
+        assert result["etag"] == '"def"'
+        copy.assert_called_once()
+        create.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_move_file_deletes_source(self, s3_api_with_mock):
+        """Test that a move copies first and only then removes the source"""
+        s3_api_with_mock.client.stat_object.return_value = Mock(size=1, content_type=None, etag="e", last_modified=None, metadata={})
+
+        with patch("s3_multipart.copy", return_value="e"):
+            result = await s3_api_with_mock.move_file("test-bucket", "a.txt", "test-bucket", "b.txt")
+
+        assert result == {"message": "File moved successfully"}
+        s3_api_with_mock.client.remove_object.assert_called_once_with("test-bucket", "a.txt")
+        assert "error" in await s3_api_with_mock.move_file("test-bucket", "a.txt", "test-bucket", "a.txt")
@@ -0,0 +1,90 @@
+from unittest.mock import Mock, create_autospec
+
+import pytest
+from minio import Minio
+from minio.commonconfig import CopySource
+from minio.datatypes import Part
+
+import s3_multipart
+
+
+@pytest.fixture
+def client():
+    """Minio mock whose calls are checked against the installed minio's signatures"""
+    return create_autospec(Minio, instance=True)
+
+
+class TestMultipartCalls:
+
+    def test_create(self, client):
+        """Test that uploads start with their content type, defaulting to binary"""
+        client._create_multipart_upload.return_value = "upload-1"
+
+        assert s3_multipart.create(client, "bucket", "a.bin", "video/mp4") == "upload-1"
+        client._create_multipart_upload.assert_called_with("bucket", "a.bin", {"Content-Type": "video/mp4"})
+        s3_multipart.create(client, "bucket", "a.bin")
+        client._create_multipart_upload.assert_called_with(
+            "bucket", "a.bin", {"Content-Type": "application/octet-stream"}
+        )
+        s3_multipart.create(client, "bucket", "a.log", "text/plain", {"Content-Encoding": "gzip", "codec": "gzip"})
+        client._create_multipart_upload.assert_called_with(
+            "bucket", "a.log", {"Content-Type": "text/plain", "Content-Encoding": "gzip", "X-Amz-Meta-codec": ["gzip"]}
+        )
+
+    def test_upload_part(self, client):
+        """Test that parts are sent with their Content-MD5 when given, and their ETag returned"""
+        client._upload_part.return_value = "etag1"
+
+        assert s3_multipart.upload_part(client, "bucket", "a.bin", "upload-1", 1, b"data", "md5==") == "etag1"
+        client._upload_part.assert_called_with("bucket", "a.bin", b"data", {"Content-MD5": "md5=="}, "upload-1", 1)
+        s3_multipart.upload_part(client, "bucket", "a.bin", "upload-1", 2, b"data")
+        client._upload_part.assert_called_with("bucket", "a.bin", b"data", None, "upload-1", 2)
+
+    def test_copy(self, client):
+        """Test that copies are one PUT pinned to the source ETag, without a HEAD of the source"""
+        client._execute.return_value = Mock(data=b'<CopyObjectResult><ETag>"def"</ETag></CopyObjectResult>')
+
+        assert s3_multipart.copy(client, "other", "b.txt", CopySource("bucket", "a.txt", match_etag="abc")) == "def"
+        client._execute.assert_called_once_with(
+            "PUT", "other", "b.txt",
+            headers={"x-amz-copy-source": "/bucket/a.txt", "x-amz-copy-source-if-match": "abc"},
+        )
+        client.stat_object.assert_not_called()
+
+    def test_upload_part_copy(self, client):
+        """Test that part copies name their byte range of the source, and their ETag is returned"""
+        client._upload_part_copy.return_value = ("etag1", None)
+
+        source = CopySource("bucket", "a.bin", match_etag="abc")
+        assert s3_multipart.upload_part_copy(client, "other", "b.bin", "upload-1", 2, source, 10, 19) == "etag1"
+        client._upload_part_copy.assert_called_once_with("other", "b.bin", "upload-1", 2, {
+            "x-amz-copy-source": "/bucket/a.bin",
+            "x-amz-copy-source-if-match": "abc",
+            "x-amz-copy-source-range": "bytes=10-19",
+        })
+
+    def test_list_parts(self, client):
+        """Test that pages give the next marker until the last one"""
+        parts = [Part(1, "etag1", size=5)]
+        client._list_parts.side_effect = [
+            Mock(parts=parts, is_truncated=True, next_part_number_marker="1"),
+            Mock(parts=[], is_truncated=False, next_part_number_marker="1"),
+        ]
+
+        assert s3_multipart.list_parts(client, "bucket", "a.bin", "upload-1") == (parts, "1")
+        assert s3_multipart.list_parts(client, "bucket", "a.bin", "upload-1", "1") == ([], None)
+        assert client._list_parts.call_args.kwargs["part_number_marker"] == "1"
+
+    def test_complete(self, client):
+        """Test that parts are sent in order with bare ETags, and the object's ETag returned"""
+        client._complete_multipart_upload.return_value = Mock(etag="abc-2")
+
+        assert s3_multipart.complete(client, "bucket", "a.bin", "upload-1", [(2, '"b"'), (1, "a")]) == "abc-2"
+        parts = client._complete_multipart_upload.call_args.args[3]
+        assert [(part.part_number, part.etag) for part in parts] == [(1, "a"), (2, "b")]
+
+    def test_abort(self, client):
+        """Test that aborts name the upload"""
+        s3_multipart.abort(client, "bucket", "a.bin", "upload-1")
+
+        client._abort_multipart_upload.assert_called_once_with("bucket", "a.bin", "upload-1")
@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import Mock, patch, AsyncMock
 from fastapi.testclient import TestClient
+import gzip
 import io
 
 from service import app
@@ -96,7 +97,15 @@ class TestService:
     @patch('service.storage_api')
     def test_download_file_success(self, mock_storage_api, test_client):
         """Test successful file download"""
-        mock_storage_api.download_file = AsyncMock(return_value=b"file content")
+        async def body():
+            yield b"file content"
+
+        mock_storage_api.download_file = AsyncMock(return_value={
+            "body": body(),
+            "content_length": 12,
+            "content_type": "text/plain",
+            "etag": '"abc123"',
+        })
 
         response = test_client.get("/bucket/test-bucket/download/test.txt")
         assert response.status_code == 200
@@ -129,4 +138,355 @@ class TestService:
 
         response = test_client.delete("/bucket/test-bucket/file/nonexistent.txt")
         assert response.status_code == 400
-        assert "File not found" in response.json()["detail"]
\ No newline at end of file
+        assert "File not found" in response.json()["detail"]
+    @patch('service.storage_api')
+    def test_download_file_streams_with_object_headers(self, mock_storage_api, test_client):
+        """Test that downloads stream and forward Content-Length, Content-Type and ETag"""
+        async def body():
+            yield b"file "
+            yield b"content"
+
+        mock_storage_api.download_file = AsyncMock(return_value={
+            "body": body(),
+            "content_length": 12,
+            "content_type": "text/plain",
+            "etag": '"abc123"',
+        })
+
+        response = test_client.get("/download/test-bucket/test.txt")
+        assert response.status_code == 200
+        assert response.content == b"file content"
+        assert response.headers["content-length"] == "12"
+        assert response.headers["content-type"].startswith("text/plain")
+        assert response.headers["etag"] == '"abc123"'
+
+    @patch('service.storage_api')
+    def test_download_file_compressed_passthrough(self, mock_storage_api, test_client):
+        """Test that objects sent as stored are labelled with their encoding"""
+        async def body():
+            yield gzip.compress(b"{}")
+
+        mock_storage_api.download_file = AsyncMock(return_value={
+            "body": body(),
+            "content_length": None,
+            "content_type": "application/json",
+            "codec": "gzip",
+            "content_encoding": "gzip",
+            "etag": '"abc123"',
+        })
+
+        response = test_client.get(
+            "/download/test-bucket/events.json", headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.content == b"{}"  # Decoded by the client
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["etag"] == '"abc123-gzip"'  # Not the decoded bytes' ETag
+        assert "Accept-Encoding" in response.headers["vary"]
+        mock_storage_api.download_file.assert_awaited_once_with(
+            "test-bucket", "events.json", accept_encoding="gzip"
+        )
+
+    @patch('service.storage_api')
+    def test_download_file_compressed_decoded(self, mock_storage_api, test_client):
+        """Test that decoded objects still vary by Accept-Encoding but aren't labelled"""
+        async def body():
+            yield b"{}"
+
+        mock_storage_api.download_file = AsyncMock(return_value={
+            "body": body(),
+            "content_length": 2,
+            "content_type": "application/json",
+            "codec": "gzip",
+            "etag": '"abc123"',
+        })
+
+        response = test_client.get(
+            "/download/test-bucket/events.json", headers={"Accept-Encoding": "identity"}
+        )
+        assert response.content == b"{}"
+        assert "content-encoding" not in response.headers
+        assert response.headers["etag"] == '"abc123"'
+        assert "Accept-Encoding" in response.headers["vary"]
+
+    @patch('service.storage_api')
+    def test_download_file_compressed_validators(self, mock_storage_api, test_client):
+        """Test that conditional requests compare against the ETag of the representation they'd get"""
+        mock_storage_api.stat_file = AsyncMock(return_value={
+            "size": 2, "content_type": "application/json", "etag": '"abc123"', "last_modified": None, "codec": "gzip",
+        })
+
+        async def body():
+            yield b"{}"
+
+        mock_storage_api.download_file = AsyncMock(side_effect=lambda *args, **kwargs: {
+            "body": body(), "content_length": 2, "content_type": "application/json", "codec": "gzip",
+            "etag": '"abc123"',
+        })
+
+        response = test_client.get("/download/test-bucket/events.json",
+                                   headers={"Accept-Encoding": "gzip", "If-None-Match": '"abc123-gzip"'})
+        assert response.status_code == 304
+        assert response.headers["etag"] == '"abc123-gzip"'
+
+        response = test_client.get("/download/test-bucket/events.json",
+                                   headers={"Accept-Encoding": "identity", "If-None-Match": '"abc123-gzip"'})
+        assert response.status_code == 200
+
+        response = test_client.get("/download/test-bucket/events.json",
+                                   headers={"Range": "bytes=0-0", "If-Range": '"abc123-gzip"'})
+        assert response.status_code == 200  # The encoded bytes' ETag doesn't validate decoded ranges
+        assert response.content == b"{}"
+
+    @patch('service.storage_api')
+    def test_download_file_from_disk_cache(self, mock_storage_api, test_client, tmp_path):
+        """Test that disk cache hits are sent from the file and released afterwards"""
+        path = tmp_path / "cached"
+        path.write_bytes(b"file content")
+        body = Mock(aclose=AsyncMock())
+        mock_storage_api.download_file = AsyncMock(return_value={
+            "body": body,
+            "path": str(path),
+            "content_length": 12,
+            "content_type": "text/plain",
+            "etag": '"abc123"',
+        })
+
+        response = test_client.get("/download/test-bucket/test.txt")
+        assert response.status_code == 200
+        assert response.content == b"file content"
+        assert response.headers["etag"] == '"abc123"'
+        body.aclose.assert_awaited_once()
+
+    @patch('service.storage_api')
+    def test_download_file_not_modified(self, mock_storage_api, test_client):
+        """Test that a matching If-None-Match answers 304 without fetching the body"""
+        mock_storage_api.stat_file = AsyncMock(return_value={
+            "size": 12, "content_type": "text/plain", "etag": '"abc123"', "last_modified": None,
+        })
+        mock_storage_api.download_file = AsyncMock()
+
+        response = test_client.get("/download/test-bucket/test.txt", headers={"If-None-Match": '"abc123"'})
+        assert response.status_code == 304
+        assert response.headers["etag"] == '"abc123"'
+        mock_storage_api.download_file.assert_not_called()
+
+    @patch('service.storage_api')
+    def test_download_file_single_range(self, mock_storage_api, test_client):
+        """Test that a single range is fetched with offset/length and answered with 206"""
+        async def body():
+            yield b"content"
+
+        mock_storage_api.stat_file = AsyncMock(return_value={
+            "size": 12, "content_type": "text/plain", "etag": '"abc123"', "last_modified": None,
+        })
+        mock_storage_api.download_file = AsyncMock(return_value={
+            "body": body(), "content_length": 7, "content_type": "text/plain", "etag": '"abc123"',
+        })
+
+        response = test_client.get("/download/test-bucket/test.txt", headers={"Range": "bytes=5-"})
+        assert response.status_code == 206
+        assert response.content == b"content"
+        assert response.headers["content-range"] == "bytes 5-11/12"
+        mock_storage_api.download_file.assert_awaited_once_with(
+            "test-bucket", "test.txt", offset=5, length=7
+        )
+
+    @patch('service.storage_api')
+    def test_download_file_multiple_ranges(self, mock_storage_api, test_client):
+        """Test that multi-range requests stream a multipart/byteranges body"""
+        content = b"file content"
+
+        async def download_file(bucket_name, filename, offset=0, length=None):
+            async def body():
+                yield content[offset:offset + length]
+            return {"body": body(), "content_length": length}
+
+        mock_storage_api.stat_file = AsyncMock(return_value={
+            "size": 12, "content_type": "text/plain", "etag": '"abc123"', "last_modified": None,
+        })
+        mock_storage_api.download_file = download_file
+
+        response = test_client.get("/download/test-bucket/test.txt", headers={"Range": "bytes=0-3,5-11"})
+        assert response.status_code == 206
+        assert response.headers["content-type"].startswith("multipart/byteranges; boundary=")
+        assert int(response.headers["content-length"]) == len(response.content)
+        assert b"Content-Range: bytes 0-3/12\r\n\r\nfile\r\n" in response.content
+        assert b"Content-Range: bytes 5-11/12\r\n\r\ncontent\r\n" in response.content
+
+    @patch('service.storage_api')
+    def test_download_file_range_not_satisfiable(self, mock_storage_api, test_client):
+        """Test that a range past the end of the object answers 416"""
+        mock_storage_api.stat_file = AsyncMock(return_value={
+            "size": 12, "content_type": "text/plain", "etag": '"abc123"', "last_modified": None,
+        })
+
+        response = test_client.get("/download/test-bucket/test.txt", headers={"Range": "bytes=50-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == "bytes */12"
+
+    @patch('service.storage_api')
+    def test_list_files_page_parameters(self, mock_storage_api, test_client):
+        """Test that paging parameters are passed through to the storage API"""
+        mock_storage_api.list_files = AsyncMock(return_value={
+            "bucket": "test-bucket", "files": [], "prefixes": [],
+            "is_truncated": False, "next_continuation_token": None,
+        })
+
+        response = test_client.get(
+            "/list/test-bucket",
+            params={"prefix": "logs/", "recursive": "true", "max_keys": 10, "continuation_token": "tok"},
+        )
+        assert response.status_code == 200
+        mock_storage_api.list_files.assert_awaited_once_with("test-bucket", "logs/", True, 10, "tok", False)
+
+    @patch('service.storage_api')
+    def test_list_files_stream_ndjson(self, mock_storage_api, test_client):
+        """Test that stream mode emits one JSON entry per line"""
+        async def entries():
+            yield {"prefix": "logs/"}
+            yield {"name": "a.txt", "size": 1, "last_modified": None}
+
+        mock_storage_api.stream_files = AsyncMock(return_value={"bucket": "test-bucket", "entries": entries()})
+
+        response = test_client.get("/list/test-bucket", params={"stream": "true"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = response.text.splitlines()
+        assert len(lines) == 2
+        assert '"prefix": "logs/"' in lines[0]
+
+    @patch('service.storage_api')
+    def test_delete_files_streams_results(self, mock_storage_api, test_client):
+        """Test that bulk delete streams one NDJSON result per key"""
+        async def results():
+            yield {"name": "a", "deleted": True}
+            yield {"name": "b", "error": "AccessDenied"}
+
+        mock_storage_api.delete_files = AsyncMock(return_value={"bucket": "test-bucket", "results": results()})
+
+        response = test_client.post("/delete/test-bucket", json={"keys": ["a", "b"]})
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == 2
+        mock_storage_api.delete_files.assert_awaited_once_with("test-bucket", ["a", "b"], None)
+
+    @patch('service.storage_api')
+    def test_delete_files_error(self, mock_storage_api, test_client):
+        """Test bulk delete without keys or prefix"""
+        mock_storage_api.delete_files = AsyncMock(return_value={"error": "Either keys or prefix is required"})
+
+        response = test_client.post("/delete/test-bucket", json={})
+        assert response.status_code == 400
+
+    @patch('service.storage_api')
+    def test_upload_files_batch(self, mock_storage_api, test_client):
+        """Test that several multipart files are handed over in one call"""
+        manifest = {"bucket": "test-bucket", "uploaded": 2, "failed": 0, "files": []}
+        mock_storage_api.upload_files = AsyncMock(return_value=manifest)
+
+        response = test_client.post(
+            "/upload/test-bucket/batch",
+            files=[("files", ("a.txt", b"a", "text/plain")), ("files", ("b.txt", b"b", "text/plain"))],
+        )
+        assert response.status_code == 200
+        assert response.json() == manifest
+        _, files, prefix = mock_storage_api.upload_files.await_args.args
+        assert [f.filename for f in files] == ["a.txt", "b.txt"]
+        assert prefix == ""
+
+    @patch('service.storage_api')
+    def test_upload_files_archive(self, mock_storage_api, test_client):
+        """Test that an archive upload is routed to upload_archive"""
+        mock_storage_api.upload_archive = AsyncMock(return_value={"bucket": "test-bucket", "files": []})
+
+        response = test_client.post(
+            "/upload/test-bucket/batch",
+            params={"prefix": "in/"},
+            files={"archive": ("batch.tar", b"data", "application/x-tar")},
+        )
+        assert response.status_code == 200
+        assert mock_storage_api.upload_archive.await_args.args[2] == "in/"
+
+    def test_upload_files_batch_requires_input(self, test_client):
+        """Test that an empty batch upload is rejected"""
+        response = test_client.post("/upload/test-bucket/batch")
+        assert response.status_code == 400
+
+    @patch('service.storage_api')
+    def test_download_files_archive(self, mock_storage_api, test_client):
+        """Test that batch downloads stream the archive as an attachment"""
+        async def body():
+            yield b"PK"
+
+        mock_storage_api.download_archive = AsyncMock(return_value={"body": body(), "media_type": "application/x-tar"})
+
+        response = test_client.post("/download/test-bucket", params={"format": "tar"}, json={"prefix": "logs/"})
+        assert response.status_code == 200
+        assert response.content == b"PK"
+        assert response.headers["content-disposition"] == 'attachment; filename="test-bucket.tar"'
+        mock_storage_api.download_archive.assert_awaited_once_with("test-bucket", None, "logs/", "tar")
+
+    @patch('service.storage_api')
+    def test_presign_url(self, mock_storage_api, test_client):
+        """Test that presigned URLs are returned without touching object bytes"""
+        mock_storage_api.presign_url = AsyncMock(return_value={"url": "http://signed", "method": "PUT", "expires_in": 600})
+
+        response = test_client.get("/presign/test-bucket/test.txt", params={"method": "PUT", "expires": 600})
+        assert response.status_code == 200
+        assert response.json()["url"] == "http://signed"
+        mock_storage_api.presign_url.assert_awaited_once_with("test-bucket", "test.txt", "PUT", 600)
+
+        assert test_client.get("/presign/test-bucket/test.txt", params={"method": "DELETE"}).status_code == 422
+
+    @patch('service.storage_api')
+    def test_complete_multipart_upload(self, mock_storage_api, test_client):
+        """Test completing a presigned multipart upload"""
+        mock_storage_api.complete_multipart_upload = AsyncMock(return_value={"message": "done", "etag": '"abc-1"'})
+
+        response = test_client.post(
+            "/presign/test-bucket/big.bin/multipart/upload-1",
+            json={"parts": [{"part_number": 1, "etag": '"abc"'}]},
+        )
+        assert response.status_code == 200
+        mock_storage_api.complete_multipart_upload.assert_awaited_once_with(
+            "test-bucket", "big.bin", "upload-1", [{"part_number": 1, "etag": '"abc"'}]
+        )
+
+    @patch('service.storage_api')
+    def test_metrics(self, mock_storage_api, test_client):
+        """Test that /metrics reports per-route request counts and backend stats"""
+        mock_storage_api.stats.return_value = {"service": "S3API", "object_cache": {"hits": 7}}
+
+        test_client.get("/health")
+        response = test_client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'object_storage_http_requests_total{method="GET",route="/health",status="200"}' in response.text
+        assert 'object_storage_http_bytes_total{route="/health",direction="out"}' in response.text
+        assert "object_storage_object_cache_hits 7" in response.text
+
+    @patch('service.storage_api')
+    def test_move_file(self, mock_storage_api, test_client):
+        """Test that a move defaults to the source bucket"""
+        mock_storage_api.move_file = AsyncMock(return_value={"message": "File moved successfully"})
+
+        response = test_client.post("/move/test-bucket/a.txt", params={"to": "b.txt"})
+
+        assert response.status_code == 200
+        mock_storage_api.move_file.assert_awaited_once_with("test-bucket", "a.txt", "test-bucket", "b.txt")
+
+    @patch('service.storage_api')
+    def test_copy_files(self, mock_storage_api, test_client):
+        """Test that bulk copies stream one NDJSON result per key"""
+        async def results():
+            yield {"name": "src/a", "destination": "dst/a", "copied": True}
+
+        mock_storage_api.copy_files = AsyncMock(return_value={"bucket": "test-bucket", "results": results()})
+
+        response = test_client.post(
+            "/copy/test-bucket", json={"prefix": "src/", "to_bucket": "other", "to_prefix": "dst/"}
+        )
+
+        assert response.status_code == 200
+        assert response.text == '{"name": "src/a", "destination": "dst/a", "copied": true}\n'
+        mock_storage_api.copy_files.assert_awaited_once_with("test-bucket", "other", None, "src/", "dst/", False)
@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class Body:
+    """Streamed body that hands out one chunk per `release`"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.reads = 0
+        self.closed = False
+        self.ready = asyncio.Semaphore(0)
+
+    def release(self, count=1):
+        for _ in range(count):
+            self.ready.release()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self.ready.acquire()
+        if self.reads == len(self.chunks):
+            raise StopAsyncIteration
+        self.reads += 1
+        return self.chunks[self.reads - 1]
+
+    async def aclose(self):
+        self.closed = True
+
+
+async def read_all(result):
+    return b"".join([chunk async for chunk in result["body"]])
+
+
+class TestSingleFlight:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one(self):
+        """Test that callers arriving while a call is in flight get its result"""
+        flights = SingleFlight(1024)
+        calls = []
+
+        async def stat():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"size": 1}
+
+        results = await asyncio.gather(*(flights.do("key", stat) for _ in range(5)))
+
+        assert results == [{"size": 1}] * 5
+        assert results[0] is not results[1]  # Each caller may change its own copy
+        assert len(calls) == 1
+        assert flights.stats() == {"in_flight": 0, "started": 1, "joined": 4}
+
+        await flights.do("key", stat)
+        assert len(calls) == 2  # Finished calls aren't reused
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_leaves_the_call_running(self):
+        """Test that the caller that started a call can go away without failing the rest"""
+        flights = SingleFlight(1024)
+
+        async def stat():
+            await asyncio.sleep(0.01)
+            return {"size": 1}
+
+        first = asyncio.ensure_future(flights.do("key", stat))
+        second = asyncio.ensure_future(flights.do("key", stat))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == {"size": 1}
+
+    @pytest.mark.asyncio
+    async def test_errors_are_shared(self):
+        """Test that every waiter sees the call's exception"""
+        flights = SingleFlight(1024)
+
+        async def stat():
+            await asyncio.sleep(0.01)
+            raise ConnectionError("backend unreachable")
+
+        results = await asyncio.gather(
+            *(flights.do("key", stat) for _ in range(3)), return_exceptions=True
+        )
+
+        assert all(isinstance(result, ConnectionError) for result in results)
+
+    @pytest.mark.asyncio
+    async def test_stream_fans_out_chunks(self):
+        """Test that concurrent downloads read one body, each from its first chunk"""
+        flights = SingleFlight(1024)
+        body = Body([b"a", b"b", b"c"])
+        calls = []
+
+        async def download():
+            calls.append(1)
+            await asyncio.sleep(0)
+            return {"body": body, "content_length": 3}
+
+        results = await asyncio.gather(*(flights.stream("key", download) for _ in range(3)))
+        body.release(4)
+
+        assert await asyncio.gather(*(read_all(result) for result in results)) == [b"abc"] * 3
+        assert results[0]["content_length"] == 3
+        assert len(calls) == 1
+        assert body.reads == 3
+
+    @pytest.mark.asyncio
+    async def test_stream_closed_to_joiners_once_it_moved_on(self):
+        """Test that a download can't be joined after its first chunk was dropped"""
+        flights = SingleFlight(1024)
+        bodies = [Body([b"a", b"b"]), Body([b"a", b"b"])]
+        for body in bodies:
+            body.release(3)
+        calls = []
+
+        async def download():
+            calls.append(1)
+            return {"body": bodies[len(calls) - 1]}
+
+        first = await flights.stream("key", download)
+        assert await first["body"].__anext__() == b"a"
+
+        second = await flights.stream("key", download)
+        assert len(calls) == 2  # Started its own
+        assert await read_all(second) == b"ab"
+        assert await read_all(first) == b"b"
+
+    @pytest.mark.asyncio
+    async def test_stream_waits_for_slow_readers(self):
+        """Test that the body isn't read further than max_buffer ahead of the slowest reader"""
+        flights = SingleFlight(2)
+        body = Body([b"a", b"b", b"c", b"d"])
+
+        async def download():
+            return {"body": body}
+
+        fast, slow = await asyncio.gather(*(flights.stream("key", download) for _ in range(2)))
+        body.release(5)
+        reading = asyncio.ensure_future(read_all(fast))
+        await asyncio.sleep(0.01)
+        assert not reading.done()
+        assert body.reads == 2
+
+        assert await read_all(slow) == b"abcd"
+        assert await reading == b"abcd"
+
+    @pytest.mark.asyncio
+    async def test_stream_closes_the_body_after_the_last_reader(self):
+        """Test that the backend response is released once nobody reads it"""
+        flights = SingleFlight(1024)
+        body = Body([b"a", b"b"])
+
+        async def download():
+            return {"body": body}
+
+        first, second = await asyncio.gather(*(flights.stream("key", download) for _ in range(2)))
+        body.release()
+        assert await first["body"].__anext__() == b"a"
+        await first["body"].aclose()
+        assert not body.closed
+
+        await second["body"].aclose()  # Never started reading
+        assert body.closed
+        assert flights.stats()["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_stream_without_body(self):
+        """Test that error results are shared like any other"""
+        flights = SingleFlight(1024)
+
+        async def download():
+            await asyncio.sleep(0)
+            return {"error": "Error downloading file: NoSuchKey"}
+
+        results = await asyncio.gather(*(flights.stream("key", download) for _ in range(2)))
+
+        assert results == [{"error": "Error downloading file: NoSuchKey"}] * 2
+        assert flights.stats()["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_forget(self):
+        """Test that forgotten calls aren't joined, e.g. after a write"""
+        flights = SingleFlight(1024)
+        calls = []
+
+        async def stat():
+            calls.append(1)
+            size = len(calls)
+            await asyncio.sleep(0.01)
+            return {"size": size}
+
+        first = asyncio.ensure_future(flights.do(("stat", "bucket", "a"), stat))
+        await asyncio.sleep(0)
+        flights.forget(lambda key: key[1] == "bucket")
+
+        assert await flights.do(("stat", "bucket", "a"), stat) == {"size": 2}
+        assert await first == {"size": 1}
@@ -26,8 +26,11 @@ class TestStorageAPI:
             async def upload_file(self, bucket_name: str, file):
                 return {"message": "uploaded"}
 
-            async def download_file(self, bucket_name: str, filename: str):
-                return b"content"
+            async def download_file(self, bucket_name: str, filename: str, offset=0, length=None):
+                return {"body": iter([b"content"]), "content_length": 7}
+
+            async def stat_file(self, bucket_name: str, filename: str):
+                return {"size": 7}
 
             async def delete_file(self, bucket_name: str, filename: str):
                 return {"message": "deleted"}
@@ -48,7 +51,259 @@ class TestStorageAPI:
             'list_files',
             'upload_file',
             'download_file',
+            'stat_file',
             'delete_file',
             'create_bucket'
         }
-        assert abstract_methods == expected_methods
\ No newline at end of file
+        assert abstract_methods == expected_methods
+    @pytest.mark.asyncio
+    async def test_run_executes_off_the_event_loop(self, mock_config):
+        """Test that blocking calls are dispatched to the bounded executor"""
+        import threading
+
+        class ConcreteStorage(StorageAPI):
+            list_files = upload_file = download_file = stat_file = None
+            delete_file = create_bucket = None
+
+        storage = ConcreteStorage()
+        thread_name = await storage._run(lambda: threading.current_thread().name)
+
+        assert thread_name != threading.current_thread().name
+        assert thread_name.startswith("ConcreteStorage")
+
+
+    @pytest.mark.asyncio
+    async def test_bounded_limits_concurrency(self, mock_config):
+        """Test that bulk work never runs more than batch_concurrency items at once"""
+        import asyncio
+
+        class ConcreteStorage(StorageAPI):
+            list_files = upload_file = download_file = stat_file = None
+            delete_file = create_bucket = None
+
+        storage = ConcreteStorage()
+        storage.batch_concurrency = 3
+        running = 0
+        peak = 0
+
+        async def items():
+            for i in range(10):
+                yield i
+
+        async def work(item):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return item * 2
+
+        results = [result async for result in storage._bounded(items(), work)]
+
+        assert sorted(results) == [i * 2 for i in range(10)]
+        assert peak == 3
+
+    @pytest.mark.asyncio
+    async def test_delete_files_falls_back_to_single_deletes(self, mock_config):
+        """Test that backends without multi-object delete still support bulk deletes"""
+        class ConcreteStorage(StorageAPI):
+            list_files = upload_file = download_file = stat_file = None
+            create_bucket = None
+
+            async def delete_file(self, bucket_name, filename):
+                if filename == "locked":
+                    return {"error": "locked"}
+                return {"message": "deleted"}
+
+        storage = ConcreteStorage()
+        result = await storage.delete_files("bucket", keys=["a", "locked"])
+        results = [r async for r in result["results"]]
+
+        assert results == [{"name": "a", "deleted": True}, {"name": "locked", "error": "locked"}]
+
+
+    @pytest.mark.asyncio
+    async def test_upload_archive_uploads_every_member(self, mock_config):
+        """Test that archive members are uploaded concurrently with a per-file manifest"""
+        import io
+        import zipfile
+
+        uploaded = {}
+
+        class ConcreteStorage(StorageAPI):
+            list_files = download_file = stat_file = None
+            delete_file = create_bucket = None
+
+            async def upload_file(self, bucket_name, file):
+                if file.filename.endswith(".bad"):
+                    return {"error": "rejected"}
+                uploaded[file.filename] = (file.file.read(), file.content_type)
+                return {"message": "uploaded"}
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("a.json", b"{}")
+            archive.writestr("b.txt", b"bravo")
+            archive.writestr("c.bad", b"charlie")
+        buffer.seek(0)
+
+        storage = ConcreteStorage()
+        archive_upload = Mock(file=buffer, filename="batch.zip")
+        result = await storage.upload_archive("bucket", archive_upload, prefix="in/")
+
+        assert uploaded == {"in/a.json": (b"{}", "application/json"), "in/b.txt": (b"bravo", "text/plain")}
+        assert result["uploaded"] == 2
+        assert result["failed"] == 1
+        assert {"name": "in/c.bad", "error": "rejected"} in result["files"]
+
+    @pytest.mark.asyncio
+    async def test_upload_archive_unreadable(self, mock_config):
+        """Test that a broken archive is reported in the manifest"""
+        import io
+
+        class ConcreteStorage(StorageAPI):
+            list_files = upload_file = download_file = stat_file = None
+            delete_file = create_bucket = None
+
+        storage = ConcreteStorage()
+        archive_upload = Mock(file=io.BytesIO(b"garbage"), filename="batch.tar")
+        result = await storage.upload_archive("bucket", archive_upload)
+
+        assert result["uploaded"] == 0
+        assert result["files"][0]["name"] == "batch.tar"
+        assert "Unreadable archive" in result["files"][0]["error"]
+
+
+    @pytest.mark.asyncio
+    async def test_download_archive_streams_entries_in_order(self, mock_config):
+        """Test that objects are fetched ahead but written to the archive in key order"""
+        import asyncio
+        import io
+        import zipfile
+
+        objects = {f"key-{i}": f"content-{i}".encode() * 100 for i in range(20)}
+        in_flight = 0
+        peak = 0
+
+        class ConcreteStorage(StorageAPI):
+            list_files = upload_file = stat_file = None
+            delete_file = create_bucket = None
+
+            async def download_file(self, bucket_name, filename, offset=0, length=None):
+                nonlocal in_flight, peak
+                if filename not in objects:
+                    return {"error": "NoSuchKey"}
+                in_flight += 1
+                peak = max(peak, in_flight)
+                data = objects[filename]
+
+                async def body():
+                    nonlocal in_flight
+                    for start in range(0, len(data), 256):
+                        await asyncio.sleep(0)
+                        yield data[start:start + 256]
+                    in_flight -= 1
+
+                return {"body": body(), "content_length": len(data), "last_modified": None}
+
+        storage = ConcreteStorage()
+        storage.batch_concurrency = 4
+        result = await storage.download_archive("bucket", keys=[*objects, "missing"])
+        output = io.BytesIO(b"".join([chunk async for chunk in result["body"]]))
+
+        with zipfile.ZipFile(output) as archive:
+            assert archive.namelist() == [*objects, "ERRORS.txt"]
+            assert archive.read("key-3") == objects["key-3"]
+            assert b"missing: NoSuchKey" in archive.read("ERRORS.txt")
+        assert 1 < peak <= 4
+
+    @pytest.mark.asyncio
+    async def test_download_archive_rejects_bad_requests(self, mock_config):
+        """Test that archive downloads need keys or a prefix and a known format"""
+        class ConcreteStorage(StorageAPI):
+            list_files = upload_file = download_file = stat_file = None
+            delete_file = create_bucket = None
+
+        storage = ConcreteStorage()
+        assert "error" in await storage.download_archive("bucket")
+        assert "error" in await storage.download_archive("bucket", keys=["a"], archive_format="rar")
+
+    @pytest.mark.asyncio
+    async def test_presigned_urls_unsupported_by_default(self, mock_config):
+        """Test that backends without request signing report presigning as an error"""
+        class ConcreteStorage(StorageAPI):
+            list_files = upload_file = download_file = stat_file = None
+            delete_file = create_bucket = None
+
+        storage = ConcreteStorage()
+        assert "error" in await storage.presign_url("bucket", "key")
+        assert "error" in await storage.create_multipart_upload("bucket", "key", 2)
+
+    @pytest.mark.asyncio
+    async def test_call_records_latency_and_errors(self, mock_config):
+        """Test that backend calls are timed and failures counted by error code"""
+        from metrics import BACKEND_ERRORS, BACKEND_IN_FLIGHT, BACKEND_LATENCY
+
+        class ConcreteStorage(StorageAPI):
+            list_files = upload_file = download_file = stat_file = None
+            delete_file = create_bucket = None
+
+        class BackendError(Exception):
+            code = "InternalError"
+
+        def fail():
+            raise BackendError()
+
+        storage = ConcreteStorage()
+        calls = BACKEND_LATENCY.get("test_op")
+        errors = BACKEND_ERRORS.get("test_op", "InternalError")
+
+        assert await storage._call("test_op", lambda: 42) == 42
+        with pytest.raises(BackendError):
+            await storage._call("test_op", fail)
+
+        assert BACKEND_LATENCY.get("test_op") == calls + 2
+        assert BACKEND_ERRORS.get("test_op", "InternalError") == errors + 1
+        assert BACKEND_IN_FLIGHT.get() == 0
+
+    @pytest.mark.asyncio
+    async def test_copy_files_by_prefix(self, mock_config):
+        """Test that a prefix copy maps keys under the new prefix, falling back to download and upload"""
+        import asyncio
+
+        objects = {"src/a": b"alpha", "src/b": b"beta"}
+        deleted = []
+
+        class ConcreteStorage(StorageAPI):
+            stat_file = create_bucket = None
+
+            async def list_files(self, bucket_name, prefix=None, recursive=False, max_keys=1000, continuation_token=None):
+                names = sorted(k for k in objects if k.startswith(prefix))
+                return {"bucket": bucket_name, "files": [{"name": k} for k in names], "prefixes": [],
+                        "is_truncated": False, "next_continuation_token": None}
+
+            async def download_file(self, bucket_name, filename, offset=0, length=None):
+                async def body():
+                    await asyncio.sleep(0)
+                    yield objects[filename]
+
+                return {"body": body(), "content_length": len(objects[filename]), "content_type": "text/plain"}
+
+            async def upload_file(self, bucket_name, file):
+                objects[file.filename] = file.file.read()
+                return {"message": "File uploaded successfully"}
+
+            async def delete_file(self, bucket_name, filename):
+                deleted.append(filename)
+                return {"message": "File deleted successfully"}
+
+        storage = ConcreteStorage()
+        result = await storage.copy_files("bucket", "bucket", prefix="src/", dest_prefix="dst/", move=True)
+        results = [r async for r in result["results"]]
+
+        assert sorted(r["destination"] for r in results) == ["dst/a", "dst/b"]
+        assert all(r["moved"] for r in results)
+        assert objects["dst/a"] == b"alpha"
+        assert sorted(deleted) == ["src/a", "src/b"]
+
+        assert "error" in await storage.copy_files("bucket", "bucket", prefix="src/", dest_prefix="src/old/")
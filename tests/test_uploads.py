@@ -0,0 +1,253 @@
+import hashlib
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from minio.datatypes import Part
+from minio.error import S3Error
+
+from uploads import UploadSession, UploadSessions
+
+MiB = 1024 * 1024
+
+
+def parts_listing(*parts, marker=None):
+    return [Part(number, etag, size=size) for number, etag, size in parts], marker
+
+
+@pytest.fixture
+def multipart():
+    """The backend's multipart calls, mocked where S3API makes them"""
+    with ExitStack() as stack:
+        yield SimpleNamespace(**{
+            name: stack.enter_context(patch(f"s3_multipart.{name}"))
+            for name in ("create", "upload_part", "list_parts", "complete", "abort")
+        })
+
+
+def no_such_upload():
+    return S3Error(response=Mock(), code="NoSuchUpload", message="", resource="", request_id="", host_id="")
+
+
+class TestUploadSessions:
+
+    def test_expected_lengths(self):
+        """Test that every chunk but the last is chunk_size, once the size is known"""
+        session = UploadSession("bucket", "a.bin", "id", chunk_size=5 * MiB, size=12 * MiB)
+
+        assert session.chunk_count() == 3
+        assert [session.expected_length(n) for n in (1, 2, 3)] == [5 * MiB, 5 * MiB, 2 * MiB]
+        assert UploadSession("bucket", "a.bin", "id", 5 * MiB, 0).chunk_count() == 1
+        assert UploadSession("bucket", "a.bin", "id", 5 * MiB).expected_length(1) is None
+
+    def test_stale_sessions(self):
+        """Test that only idle sessions with nothing in flight are stale"""
+        sessions = UploadSessions(ttl=60)
+        idle, busy, fresh = (UploadSession("bucket", name, name) for name in ("idle", "busy", "fresh"))
+        for session in (idle, busy, fresh):
+            sessions.add(session)
+        idle.touched -= 120
+        busy.touched -= 120
+        busy.uploading = 1
+
+        assert sessions.stale() == [idle]
+
+    def test_get_adopts_unknown_uploads(self):
+        """Test that uploads started before a restart are only tracked once adopted"""
+        sessions = UploadSessions(ttl=60)
+
+        session = sessions.get("bucket", "a.bin", "old-id")
+        assert sessions.get("bucket", "a.bin", "old-id") is not session
+        assert sessions.stats()["active"] == 0
+
+        assert sessions.adopt(session) is session
+        assert sessions.adopt(sessions.get("bucket", "a.bin", "old-id")) is session
+        assert sessions.get("bucket", "a.bin", "old-id") is session
+        assert sessions.get("bucket", "b.bin", "old-id") is not session
+        assert sessions.adopt(sessions.get("bucket", "b.bin", "old-id")) is not session
+        assert sessions.stats()["active"] == 1
+
+
+class TestResumableUploads:
+
+    @pytest.mark.asyncio
+    async def test_start_validates_chunk_size(self, s3_api_with_mock, multipart):
+        """Test that chunks must fit S3's part limits and the configured maximum"""
+        api = s3_api_with_mock
+
+        assert "error" in await api.start_upload("bucket", "a.bin", chunk_size=MiB)
+        assert "error" in await api.start_upload("bucket", "a.bin", chunk_size=1024 * MiB)
+        assert "error" in await api.start_upload("bucket", "a.bin", size=10**12, chunk_size=5 * MiB)
+        multipart.create.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_upload_flow(self, s3_api_with_mock, multipart):
+        """Test start, chunks in any order, status from the backend's parts, then complete"""
+        api = s3_api_with_mock
+        multipart.create.return_value = "upload-1"
+        multipart.upload_part.side_effect = lambda client, bucket, name, upload_id, number, data, md5: f"etag{number}"
+
+        state = await api.start_upload("bucket", "a.bin", "application/octet-stream", size=11 * MiB, chunk_size=5 * MiB)
+        assert state["upload_id"] == "upload-1"
+        assert state["missing"] == [1, 2, 3]
+
+        result = await api.upload_chunk("bucket", "a.bin", "upload-1", 3, b"x" * MiB, "md5==")
+        assert result == {"part_number": 3, "etag": '"etag3"', "size": MiB}
+        assert multipart.upload_part.call_args.args[6] == "md5=="
+        assert "error" in await api.upload_chunk("bucket", "a.bin", "upload-1", 1, b"short")
+        assert "error" in await api.upload_chunk("bucket", "a.bin", "upload-1", 4, b"")
+
+        multipart.list_parts.side_effect = [
+            parts_listing((1, "etag1", 5 * MiB), marker="1"),
+            parts_listing((3, "etag3", MiB)),
+        ]
+        status = await api.upload_status("bucket", "a.bin", "upload-1")
+        assert status["received_bytes"] == 6 * MiB
+        assert status["missing"] == [2]
+        assert [part["offset"] for part in status["parts"]] == [0, 10 * MiB]
+        assert multipart.list_parts.call_args.args[4] == "1"
+
+        multipart.list_parts.side_effect = [parts_listing((1, "etag1", 5 * MiB), (3, "etag3", MiB))]
+        assert (await api.complete_upload("bucket", "a.bin", "upload-1"))["error"] == "Missing chunks: 2"
+
+        multipart.list_parts.side_effect = [
+            parts_listing((1, "etag1", 5 * MiB), (2, "etag2", 5 * MiB), (3, "etag3", MiB))
+        ]
+        multipart.complete.return_value = "final"
+        result = await api.complete_upload("bucket", "a.bin", "upload-1")
+
+        assert result["etag"] == '"final"'
+        assert [number for number, etag in multipart.complete.call_args.args[4]] == [1, 2, 3]
+        assert api.stats()["uploads"] == {"active": 0, "started": 1, "completed": 1, "reaped": 0}
+
+    @pytest.mark.asyncio
+    async def test_complete_without_known_size(self, s3_api_with_mock, multipart):
+        """Test that uploads of unannounced size complete once their chunks are contiguous"""
+        api = s3_api_with_mock
+        multipart.list_parts.return_value = parts_listing((2, "etag2", MiB), (4, "etag4", MiB))
+
+        result = await api.complete_upload("bucket", "a.bin", "adopted")
+        assert result["error"] == "Missing chunks: 1, 3"
+
+        multipart.list_parts.return_value = parts_listing()
+        assert (await api.complete_upload("bucket", "a.bin", "adopted"))["error"] == "No chunks received"
+
+    @pytest.mark.asyncio
+    async def test_unknown_uploads_adopted_once_accepted(self, s3_api_with_mock, multipart):
+        """Test that made-up upload IDs aren't tracked, and ones the backend accepts are"""
+        api = s3_api_with_mock
+        multipart.upload_part.side_effect = no_such_upload()
+        multipart.list_parts.side_effect = no_such_upload()
+
+        assert "error" in await api.upload_chunk("bucket", "a.bin", "made-up", 1, b"x")
+        assert "error" in await api.upload_status("bucket", "a.bin", "made-up")
+        assert api.uploads.stats()["active"] == 0
+
+        multipart.upload_part.side_effect = None
+        multipart.upload_part.return_value = "etag1"
+        assert "error" not in await api.upload_chunk("bucket", "a.bin", "old-id", 1, b"x")
+        multipart.list_parts.side_effect = None
+        multipart.list_parts.return_value = parts_listing((1, "etag1", 1))
+        assert "error" not in await api.upload_status("bucket", "b.bin", "other-id")
+        assert [session.upload_id for session in api.uploads._sessions.values()] == ["old-id", "other-id"]
+
+    @pytest.mark.asyncio
+    async def test_reap_aborts_stale_uploads(self, s3_api_with_mock, multipart):
+        """Test that idle uploads are aborted on the backend, and forgotten if already gone"""
+        api = s3_api_with_mock
+        multipart.create.side_effect = ["stale", "gone", "fresh"]
+        for name in ("a.bin", "b.bin", "c.bin"):
+            await api.start_upload("bucket", name, chunk_size=5 * MiB)
+        api.uploads.get("bucket", "a.bin", "stale").touched -= 10**6
+        api.uploads.get("bucket", "b.bin", "gone").touched -= 10**6
+        multipart.list_parts.return_value = parts_listing()
+        multipart.abort.side_effect = [None, no_such_upload()]
+
+        await api.reap_uploads()
+
+        aborted = [call.args[3] for call in multipart.abort.call_args_list]
+        assert aborted == ["stale", "gone"]
+        assert api.uploads.stats() == {"active": 1, "started": 3, "completed": 0, "reaped": 1}
+
+    @pytest.mark.asyncio
+    async def test_reap_spares_uploads_active_elsewhere(self, s3_api_with_mock, multipart):
+        """Test that uploads with recent parts, e.g. sent through another worker, aren't aborted"""
+        api = s3_api_with_mock
+        api.uploads.adopt(UploadSession("bucket", "a.bin", "busy")).touched -= 10**6
+        multipart.list_parts.return_value = [Part(1, "etag1", last_modified=datetime.now(timezone.utc), size=MiB)], None
+
+        await api.reap_uploads()
+
+        multipart.abort.assert_not_called()
+        assert api.uploads.stale() == []
+
+    @pytest.mark.asyncio
+    async def test_unsupported_backend(self, mock_config, tmp_path):
+        """Test that backends without multipart uploads say so"""
+        from filesystem_api import FileSystemAPI
+
+        api = FileSystemAPI(str(tmp_path), fsync=False)
+
+        result = await api.start_upload("bucket", "a.bin")
+        assert result == {"error": "FileSystemAPI does not support resumable uploads"}
+
+
+class TestResumableUploadRoutes:
+
+    def test_upload_chunk_route(self, test_client):
+        """Test that chunk bodies and their Content-MD5 reach the storage API"""
+        data = b"chunk data"
+        md5 = hashlib.md5(data).hexdigest()
+        with patch("service.storage_api") as storage_api:
+            storage_api.upload_chunk = AsyncMock(return_value={"part_number": 2, "etag": '"e"', "size": 10})
+
+            response = test_client.put("/uploads/bucket/a.bin/upload-1/2", content=data, headers={"Content-MD5": md5})
+
+        assert response.status_code == 200
+        storage_api.upload_chunk.assert_awaited_once_with("bucket", "a.bin", "upload-1", 2, data, md5)
+
+    def test_upload_chunk_too_large(self, test_client):
+        """Test that chunks over the limit are refused before reaching the backend"""
+        with patch("service.storage_api") as storage_api, \
+                patch("service.config.OBJECT_STORAGE_UPLOAD_MAX_CHUNK_SIZE", 4):
+            storage_api.upload_chunk = AsyncMock()
+
+            response = test_client.put("/uploads/bucket/a.bin/upload-1/1", content=b"too large")
+
+        assert response.status_code == 413
+        storage_api.upload_chunk.assert_not_awaited()
+
+    def test_session_routes(self, test_client):
+        """Test that start, status, complete and abort map to the storage API, errors to 400"""
+        with patch("service.storage_api") as storage_api:
+            storage_api.start_upload = AsyncMock(return_value={"upload_id": "upload-1"})
+            storage_api.upload_status = AsyncMock(return_value={"upload_id": "upload-1", "parts": []})
+            storage_api.complete_upload = AsyncMock(return_value={"error": "Missing chunks: 1"})
+            storage_api.abort_upload = AsyncMock(return_value={"message": "Multipart upload aborted successfully"})
+
+            response = test_client.post("/uploads/bucket/a.bin/start?size=100&chunk_size=5242880")
+            assert response.json() == {"upload_id": "upload-1"}
+            storage_api.start_upload.assert_awaited_once_with("bucket", "a.bin", None, 100, 5242880)
+
+            assert test_client.get("/uploads/bucket/a.bin/upload-1").status_code == 200
+            response = test_client.post("/uploads/bucket/a.bin/upload-1")
+            assert response.status_code == 400
+            assert response.json()["detail"] == "Missing chunks: 1"
+            assert test_client.delete("/uploads/bucket/a.bin/upload-1").status_code == 200
+
+    def test_nested_key_routes(self, test_client):
+        """Test that keys containing "/" reach the storage API whole, the upload ID and chunk number after them"""
+        with patch("service.storage_api") as storage_api:
+            storage_api.start_upload = AsyncMock(return_value={"upload_id": "upload-1"})
+            storage_api.upload_chunk = AsyncMock(return_value={"part_number": 1, "etag": '"e"', "size": 1})
+            storage_api.complete_upload = AsyncMock(return_value={"etag": '"e"'})
+
+            assert test_client.post("/uploads/bucket/dir/a.bin/start").status_code == 200
+            assert test_client.put("/uploads/bucket/dir/a.bin/upload-1/1", content=b"x").status_code == 200
+            assert test_client.post("/uploads/bucket/dir/a.bin/upload-1").status_code == 200
+
+        storage_api.start_upload.assert_awaited_once_with("bucket", "dir/a.bin", None, None, None)
+        assert storage_api.upload_chunk.call_args.args[:4] == ("bucket", "dir/a.bin", "upload-1", 1)
+        storage_api.complete_upload.assert_awaited_once_with("bucket", "dir/a.bin", "upload-1")
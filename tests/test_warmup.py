@@ -0,0 +1,167 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from s3_api import S3API
+from warmup import ReadAhead, read_access_log, read_manifest, warm_up
+
+
+class FakeAPI:
+    """Storage API recording what was warmed and how many warmed at once"""
+
+    batch_concurrency = 2
+
+    def __init__(self, errors=()):
+        self.warmed = []
+        self.errors = set(errors)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def warm(self, bucket_name, filename=None, size=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await self.release.wait()
+        self.in_flight -= 1
+        self.warmed.append((bucket_name, filename))
+        if filename in self.errors:
+            return {"error": "Error getting file info: NoSuchKey"}
+        return {"cached": True}
+
+
+def files(*names, size=10):
+    return [{"name": name, "size": size} for name in names]
+
+
+class TestWarmUpSources:
+
+    def test_read_manifest(self, tmp_path):
+        """Test that manifests name buckets and keys, skipping comments and blank lines"""
+        manifest = tmp_path / "manifest"
+        manifest.write_text("# hottest first\nimages/logo.png\n\nimages\nlogs/2024/01/a.txt\n")
+
+        assert read_manifest(str(manifest)) == [
+            ("images", "logo.png"), ("images", None), ("logs", "2024/01/a.txt")
+        ]
+
+    def test_read_access_log(self, tmp_path):
+        """Test that the most downloaded objects come first, after every bucket seen"""
+        log = tmp_path / "access.log"
+        log.write_text(
+            '127.0.0.1:5000 - "GET /download/images/a.png HTTP/1.1" 200\n'
+            '127.0.0.1:5000 - "GET /download/images/dir%2Fb.png HTTP/1.1" 200\n'
+            '127.0.0.1:5000 - "GET /download/images/dir%2Fb.png?x=1 HTTP/1.1" 200\n'
+            '127.0.0.1:5000 - "GET /list/logs?prefix=2024 HTTP/1.1" 200\n'
+            '127.0.0.1:5000 - "POST /upload/uploads HTTP/1.1" 200\n'
+        )
+
+        assert read_access_log(str(log), 10) == [
+            ("images", None), ("logs", None), ("images", "dir/b.png"), ("images", "a.png")
+        ]
+        assert read_access_log(str(log), 1)[-1] == ("images", "dir/b.png")
+
+
+class TestWarmUp:
+
+    @pytest.mark.asyncio
+    async def test_warm_up_objects_then_buckets(self):
+        """Test that each target is warmed once, objects before buckets, within the limits"""
+        api = FakeAPI(errors={"missing.txt"})
+        targets = [("a", "1.txt"), ("a", None), ("b", "missing.txt"), ("a", "1.txt"), ("a", "2.txt")]
+
+        result = await warm_up(api, targets, max_objects=2)
+
+        assert result == {"warmed": 3, "failed": 1}
+        assert sorted(api.warmed[:2]) == [("a", "1.txt"), ("b", "missing.txt")]
+        assert sorted(api.warmed[2:]) == [("a", None), ("b", None)]
+        assert api.max_in_flight <= api.batch_concurrency
+
+    @pytest.mark.asyncio
+    async def test_read_ahead_bounded(self):
+        """Test that listed objects are fetched once, small ones only, within the limits"""
+        api = FakeAPI()
+        api.release.clear()
+        read_ahead = ReadAhead(api, max_size=100, concurrency=2, max_pending=3)
+
+        read_ahead.schedule("bucket", files("a", "b") + files("big", size=1000))
+        read_ahead.schedule("bucket", files("a", "c", "d"))
+        await asyncio.sleep(0.01)
+
+        assert read_ahead.stats() == {"pending": 3, "fetched": 0, "skipped": 1, "failed": 0}
+        assert api.in_flight == 2
+
+        api.release.set()
+        await asyncio.sleep(0.01)
+        assert sorted(api.warmed) == [("bucket", "a"), ("bucket", "b"), ("bucket", "c")]
+        assert read_ahead.stats()["fetched"] == 3
+
+    @pytest.mark.asyncio
+    async def test_s3_warm_fills_the_object_cache(self, mock_config, mock_minio_client):
+        """Test that warming small objects caches them, and larger ones only their stat"""
+        from config import config
+
+        with patch.object(config, 'OBJECT_STORAGE_CACHE_MAX_BYTES', 1024), \
+                patch('s3_api.Minio', return_value=mock_minio_client):
+            api = S3API()
+        mock_data = Mock()
+        mock_data.read.side_effect = [b"file content", b""]
+        mock_data.headers = {"Content-Length": "12", "ETag": '"abc123"'}
+        mock_minio_client.get_object.return_value = mock_data
+        mock_minio_client.stat_object.return_value = Mock(size=12, etag="abc123", metadata={}, last_modified=None)
+        mock_minio_client.bucket_exists.return_value = True
+
+        assert await api.warm("test-bucket", "test.txt") == {"cached": True}
+        assert await api.warm("test-bucket", "big.bin", size=10**9) == {"cached": False}
+        assert await api.warm("test-bucket") == {"exists": True}
+
+        result = await api.download_file("test-bucket", "test.txt")
+        assert b"".join([chunk async for chunk in result["body"]]) == b"file content"
+        assert mock_minio_client.get_object.call_count == 1
+        assert api.stats()["object_cache"]["hits"] == 1
+
+
+class TestWarmUpService:
+
+    def test_startup_warms_the_manifest(self, tmp_path):
+        """Test that the lifespan warms the manifest before serving and reports it in /stats"""
+        import service
+
+        manifest = tmp_path / "manifest"
+        manifest.write_text("bucket/a.txt\nbucket\n")
+        storage_api = Mock(batch_concurrency=4)
+        storage_api.warm = AsyncMock(return_value={})
+        storage_api.stats.return_value = {"service": "S3API"}
+
+        with patch.object(service, "storage_api", storage_api), \
+                patch.object(service, "warm_up_stats", {}), \
+                patch.object(service.config, "OBJECT_STORAGE_WARMUP_MANIFEST", str(manifest)):
+            with TestClient(service.app) as client:
+                assert client.get("/stats").json()["warm_up"] == {"warmed": 2, "failed": 0}
+
+        storage_api.warm.assert_any_await("bucket", "a.txt")
+        storage_api.warm.assert_any_await("bucket", None)
+
+    def test_missing_manifest_starts_cold(self, tmp_path):
+        """Test that an unreadable manifest doesn't stop the service from starting"""
+        import service
+
+        with patch.object(service, "warm_up_stats", {}), \
+                patch.object(service.config, "OBJECT_STORAGE_WARMUP_MANIFEST", str(tmp_path / "missing")):
+            with TestClient(service.app) as client:
+                assert "No such file" in client.get("/stats").json()["warm_up"]["error"]
+
+    def test_list_schedules_read_ahead(self, test_client):
+        """Test that listed files are handed to the read-ahead"""
+        import service
+
+        storage_api = Mock()
+        storage_api.list_files = AsyncMock(return_value={"files": files("a.txt"), "prefixes": []})
+        read_ahead = Mock()
+
+        with patch.object(service, "storage_api", storage_api), patch.object(service, "read_ahead", read_ahead):
+            assert test_client.get("/list/bucket").status_code == 200
+
+        read_ahead.schedule.assert_called_once_with("bucket", files("a.txt"))
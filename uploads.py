@@ -0,0 +1,95 @@
+import time
+
+
+class UploadSession:
+    """A resumable upload, assembled by the backend as a multipart upload"""
+
+    def __init__(self, bucket_name, filename, upload_id, chunk_size=None, size=None):
+        self.bucket_name = bucket_name
+        self.filename = filename
+        self.upload_id = upload_id
+        self.chunk_size = chunk_size  # None for sessions started by another process
+        self.size = size  # Total size, if the client announced it
+        self.uploading = 0  # Chunks being received right now
+        self.touched = time.monotonic()
+
+    def touch(self):
+        self.touched = time.monotonic()
+
+    def chunk_count(self):
+        if self.size is None or not self.chunk_size:
+            return None
+        return max(-(-self.size // self.chunk_size), 1)
+
+    def expected_length(self, part_number: int):
+        """Length chunk `part_number` must have, None if it can't be told yet"""
+        count = self.chunk_count()
+        if count is None:
+            return None
+        if part_number < count:
+            return self.chunk_size
+        return self.size - (count - 1) * self.chunk_size
+
+
+class UploadSessions:
+    """Resumable uploads this process has seen, so abandoned ones can be aborted.
+
+    The backend keeps the parts it received, which is what progress is read
+    from; this only adds what it doesn't keep: the chunk size, the expected
+    size and when a client last showed up.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._sessions = {}
+        self.started = 0
+        self.completed = 0
+        self.reaped = 0
+
+    def add(self, session: UploadSession):
+        self._sessions[session.upload_id] = session
+        self.started += 1
+
+    def get(self, bucket_name: str, filename: str, upload_id: str):
+        """The session for `upload_id`, or an untracked one for uploads started
+        elsewhere, e.g. before a restart, until the backend vouches for them"""
+        session = self._sessions.get(upload_id)
+        if session is None:
+            return UploadSession(bucket_name, filename, upload_id)
+        if (session.bucket_name, session.filename) != (bucket_name, filename):
+            # Not this key's upload, the backend will reject it
+            return UploadSession(bucket_name, filename, upload_id)
+        return session
+
+    def adopt(self, session: UploadSession):
+        """Track a session from `get` once the backend has accepted its upload
+        ID, so it can still be reaped; IDs are from clients and may be made up"""
+        tracked = self._sessions.setdefault(session.upload_id, session)
+        if (tracked.bucket_name, tracked.filename) != (
+            session.bucket_name,
+            session.filename,
+        ):
+            return session
+        tracked.touch()
+        return tracked
+
+    def remove(self, upload_id: str, completed: bool = False):
+        if self._sessions.pop(upload_id, None) is not None and completed:
+            self.completed += 1
+
+    def stale(self):
+        """Sessions idle for longer than the TTL, with no chunk in flight"""
+        cutoff = time.monotonic() - self.ttl
+        return [
+            session
+            for session in self._sessions.values()
+            if session.touched < cutoff and not session.uploading
+        ]
+
+    def stats(self):
+        return {
+            "active": len(self._sessions),
+            "started": self.started,
+            "completed": self.completed,
+            "reaped": self.reaped,
+        }
@@ -0,0 +1,116 @@
+import asyncio
+import collections
+import os
+import re
+from urllib.parse import unquote
+
+ACCESS_LOG_TAIL = 16 * 1024 * 1024  # Bytes read from the end of an access log
+
+# Download and listing request lines, as uvicorn and the common log format write them
+_REQUEST = re.compile(r'"(?:GET|HEAD) /(download|list)/([^/?\s"]+)(?:/([^?\s"]+))?')
+
+
+def read_manifest(path: str):
+    """(bucket, key) pairs from a manifest of one `bucket` or `bucket/key` per
+    line, hottest first; key is None for lines naming only a bucket"""
+    targets = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                bucket_name, _, key = line.partition("/")
+                targets.append((bucket_name, key or None))
+    return targets
+
+
+def read_access_log(path: str, max_objects: int):
+    """Every bucket requested in the recent end of an access log, and its
+    `max_objects` most downloaded objects, as `read_manifest` returns them"""
+    with open(path, "rb") as f:
+        f.seek(max(os.fstat(f.fileno()).st_size - ACCESS_LOG_TAIL, 0))
+        text = f.read().decode(errors="replace")
+    buckets, objects = {}, collections.Counter()
+    for route, bucket_name, key in _REQUEST.findall(text):
+        bucket_name = unquote(bucket_name)
+        buckets[bucket_name] = None
+        if route == "download" and key:
+            objects[(bucket_name, unquote(key))] += 1
+    return [(bucket_name, None) for bucket_name in buckets] + [
+        target for target, _ in objects.most_common(max_objects)
+    ]
+
+
+async def warm_up(api, targets: list, max_objects: int):
+    """Load the buckets and objects named in `targets` into the storage API's
+    caches, batch_concurrency at a time"""
+    slots = asyncio.Semaphore(api.batch_concurrency)
+    counts = collections.Counter()
+
+    async def warm(bucket_name, key=None):
+        async with slots:
+            try:
+                result = await api.warm(bucket_name, key)
+            except Exception:
+                result = {"error": "unreachable"}
+        counts["failed" if "error" in result else "warmed"] += 1
+
+    objects = list(dict.fromkeys(target for target in targets if target[1]))
+    await asyncio.gather(*(warm(*target) for target in objects[:max_objects]))
+    # Bucket existence is cached for the shortest time, so it goes last
+    buckets = dict.fromkeys(bucket_name for bucket_name, _ in targets)
+    await asyncio.gather(*(warm(bucket_name) for bucket_name in buckets))
+    return {"warmed": counts["warmed"], "failed": counts["failed"]}
+
+
+class ReadAhead:
+    """Fetches small objects a listing returned into the caches in the
+    background, for clients that download what they just listed.
+
+    At most `concurrency` fetches run at once and `max_pending` wait; listings
+    arriving when that many are queued don't add more.
+    """
+
+    def __init__(self, api, max_size: int, concurrency: int, max_pending: int):
+        self.api = api
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(concurrency)
+        self._pending = {}  # (bucket, key) -> task
+        self.fetched = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def schedule(self, bucket_name: str, files: list):
+        for file in files:
+            key = (bucket_name, file["name"])
+            if file["size"] > self.max_size or key in self._pending:
+                continue
+            if len(self._pending) >= self.max_pending:
+                self.skipped += 1
+                continue
+            task = asyncio.ensure_future(self._fetch(*key, file["size"]))
+            self._pending[key] = task
+            task.add_done_callback(lambda _, key=key: self._pending.pop(key, None))
+
+    async def _fetch(self, bucket_name: str, filename: str, size: int):
+        async with self._slots:
+            try:
+                result = await self.api.warm(bucket_name, filename, size)
+            except Exception:
+                result = {"error": "unreachable"}
+        if "error" in result:
+            self.failed += 1
+        else:
+            self.fetched += 1
+
+    def cancel(self):
+        for task in list(self._pending.values()):
+            task.cancel()
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "fetched": self.fetched,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }